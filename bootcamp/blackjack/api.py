@@ -1,17 +1,20 @@
 
 
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import List, Optional
 from pydantic import Field
-from ninja import NinjaAPI, Schema
+from ninja import NinjaAPI, Query, Schema
+from . import engine, odds
+from .store import GameStore, StudentStore, get_backend, ranked
 
 api = NinjaAPI(title="Demo API")
 
 # =========================
 #  STUDENTS (mémoire)
 # =========================
-STUDENTS: List[dict] = []
-SEQ = 0
+# état dans le backend de settings.BLACKJACK_STORE_BACKEND : partagé entre
+# workers avec le backend mmap ou Redis, propre au process avec LocalBackend
+STUDENTS = StudentStore(get_backend(), index_email=True)
 
 
 class StudentIn(Schema):
@@ -32,39 +35,28 @@ class Msg(Schema):
 
 @api.get("/students", response=List[StudentOut])
 def list_students(request):
-    return STUDENTS
+    return STUDENTS.list()
 
 
-@api.post("/students", response={201: StudentOut})
+@api.post("/students", response={201: StudentOut, 409: Msg})
 def create_student(request, data: StudentIn):
-    global SEQ
-    SEQ += 1
-    item = {
-        "id": SEQ,
-        "name": data.name,
-        "email": data.email,
-        "created_at": datetime.utcnow(),
-    }
-    STUDENTS.append(item)
+    item = STUDENTS.create(data.name, data.email)
+    if item is None:
+        return 409, {"detail": "Email already used"}
     return 201, item
 
 
 @api.delete("/students/{pk}", response={204: None, 404: Msg})
 def delete_student(request, pk: int):
-    for i, s in enumerate(STUDENTS):
-        if s["id"] == pk:
-            STUDENTS.pop(i)
-            return 204, None
+    if STUDENTS.delete(pk):
+        return 204, None
     return 404, {"detail": "Student not found"}
 
 
 # =========================
 #  GAMES & PLAYERS (mémoire)
 # =========================
-GAMES: Dict[int, Dict[str, Any]] = {}     # id -> game dict
-PLAYERS: Dict[int, Dict[str, Any]] = {}   # id -> player dict
-GAME_SEQ = 0
-PLAYER_SEQ = 0
+GAME_STORE = GameStore(get_backend())   # games, players + index game -> players
 
 
 # ---- Schémas ----
@@ -82,6 +74,7 @@ class PlayerOut(Schema):
     score: int
     stand: bool
     game_id: int
+    cards: str = ""
 
 
 class GameOut(Schema):
@@ -100,22 +93,46 @@ class GameListItem(Schema):
     ended: bool
 
 
+class RankedPlayer(PlayerOut):
+    rank: int
+
+
+class LeaderboardQuery(Schema):
+    limit: int = Field(100, ge=1, le=1000)
+
+
+class HintQuery(Schema):
+    dealer: str = Field(..., pattern="^[A2-9TJQK]$")
+    simulate: bool = True
+
+
+class HintOut(Schema):
+    action: str
+    basic_strategy: str
+    bust_probability: float
+    stand_ev: float
+    hit_ev: float
+    samples: int
+
+
 class PlayInput(Schema):
     # très simple : on ajoute du score OU on “stand”
     add_score: Optional[int] = 0
     stand: Optional[bool] = False
+    # carte tirée du sabot du game (add_score ignoré)
+    hit: Optional[bool] = False
 
 
 # ---- Helpers ----
 def _game_or_404(gid: int):
-    game = GAMES.get(gid)
+    game = GAME_STORE.get_game(gid)
     if not game:
         return None, (404, {"detail": "Game not found"})
     return game, None
 
 
 def _player_or_404(pid: int):
-    p = PLAYERS.get(pid)
+    p = GAME_STORE.get_player(pid)
     if not p:
         return None, (404, {"detail": "Player not found"})
     return p, None
@@ -128,15 +145,14 @@ def _serialize_player(p: dict) -> PlayerOut:
         score=p["score"],
         stand=p["stand"],
         game_id=p["game_id"],
+        cards=p["cards"],
     )
 
 
 def _serialize_game_detail(g: dict) -> GameOut:
-    players = [
-        _serialize_player(p)
-        for p in PLAYERS.values()
-        if p["game_id"] == g["id"]
-    ]
+    # relu sous le verrou du game : game + joueurs cohérents
+    g, players = GAME_STORE.game_detail(g["id"])
+    players = [_serialize_player(p) for p in players]
     return GameOut(
         id=g["id"],
         name=g["name"],
@@ -149,21 +165,13 @@ def _serialize_game_detail(g: dict) -> GameOut:
 # ---- Endpoints Games ----
 @api.post("/games", response={201: GameOut})
 def create_game(request, data: GameIn):
-    global GAME_SEQ
-    GAME_SEQ += 1
-    g = {
-        "id": GAME_SEQ,
-        "name": data.name.strip(),
-        "turn": 0,
-        "ended": False,
-    }
-    GAMES[g["id"]] = g
+    g = GAME_STORE.create_game(data.name.strip())
     return 201, _serialize_game_detail(g)
 
 
 @api.get("/games", response=List[GameListItem])
 def list_games(request):
-    return [GameListItem(**g) for g in GAMES.values()]  # id, name, turn, ended
+    return [GameListItem(**g) for g in GAME_STORE.list_games()]  # id, name, turn, ended
 
 
 @api.get("/games/{gid}", response={200: GameOut, 404: Msg})
@@ -177,22 +185,17 @@ def get_game(request, gid: int):
 
 @api.post("/games/{gid}/start", response={200: GameOut, 404: Msg})
 def start_game(request, gid: int):
-    game, err = _game_or_404(gid)
-    if err:
-        status, payload = err
-        return status, payload
-    game["turn"] = 0
-    game["ended"] = False
+    game = GAME_STORE.update_game(gid, turn=0, ended=False)
+    if game is None:
+        return 404, {"detail": "Game not found"}
     return _serialize_game_detail(game)
 
 
 @api.post("/games/{gid}/end", response={200: GameOut, 404: Msg})
 def end_game(request, gid: int):
-    game, err = _game_or_404(gid)
-    if err:
-        status, payload = err
-        return status, payload
-    game["ended"] = True
+    game = GAME_STORE.update_game(gid, ended=True)
+    if game is None:
+        return 404, {"detail": "Game not found"}
     return _serialize_game_detail(game)
 
 
@@ -204,20 +207,11 @@ def add_player(request, gid: int, data: PlayerIn):
         status, payload = err
         return status, payload
 
-    global PLAYER_SEQ
-    PLAYER_SEQ += 1
-    p = {
-        "id": PLAYER_SEQ,
-        "name": data.name.strip(),
-        "score": 0,
-        "stand": False,
-        "game_id": gid,
-    }
-    PLAYERS[p["id"]] = p
+    p = GAME_STORE.add_player(gid, data.name.strip())
     return 201, _serialize_player(p)
 
 
-@api.post("/games/{gid}/players/{pid}/play", response={200: PlayerOut, 404: Msg})
+@api.post("/games/{gid}/players/{pid}/play", response={200: PlayerOut, 404: Msg, 409: Msg})
 def play_turn(request, gid: int, pid: int, data: PlayInput):
     game, err = _game_or_404(gid)
     if err:
@@ -231,15 +225,14 @@ def play_turn(request, gid: int, pid: int, data: PlayInput):
 
     if player["game_id"] != game["id"]:
         return 404, {"detail": "Player does not belong to this game"}
+    if data.hit and player["stand"]:
+        return 409, {"detail": "Player already stands"}
 
     # logique minimaliste : on modifie le score, on peut mettre stand=True,
-    # et on avance le tour si on a joué
-    if data.add_score:
-        player["score"] = max(0, player["score"] + int(data.add_score))
-        game["turn"] += 1
-
-    if data.stand:
-        player["stand"] = True
+    # et on avance le tour si on a joué (atomique, sous le verrou du game)
+    player = GAME_STORE.play(gid, pid, data.add_score, data.stand, data.hit)
+    if player is None:
+        return 404, {"detail": "Player not found"}
 
     return _serialize_player(player)
 
@@ -259,34 +252,435 @@ def remove_player(request, gid: int, pid: int):
     if player["game_id"] != game["id"]:
         return 404, {"detail": "Player does not belong to this game"}
 
-    PLAYERS.pop(pid, None)
+    GAME_STORE.remove_player(pid)
     return 204, None
------------
 
-from typing import List
+
+@api.get("/games/{gid}/players/{pid}/hint", response={200: HintOut, 404: Msg})
+def player_hint(request, gid: int, pid: int, params: Query[HintQuery]):
+    game, err = _game_or_404(gid)
+    if err:
+        status, payload = err
+        return status, payload
+
+    player, err = _player_or_404(pid)
+    if err:
+        status, payload = err
+        return status, payload
+
+    if player["game_id"] != game["id"]:
+        return 404, {"detail": "Player does not belong to this game"}
+
+    # reste du sabot moins la carte visible du croupier
+    up = engine.parse_cards(params.dealer)[0]
+    counts = GAME_STORE.shoe_counts(gid)
+    if counts[up]:
+        counts[up] -= 1
+    return odds.hint(player["cards"], up, counts, params.simulate)
+
+
+# ---- Classements ----
+@api.get("/leaderboard", response=List[RankedPlayer])
+def leaderboard(request, params: Query[LeaderboardQuery]):
+    return ranked(GAME_STORE.top_players(params.limit))
+
+
+@api.get("/games/{gid}/leaderboard", response={200: List[RankedPlayer], 404: Msg})
+def game_leaderboard(request, gid: int, params: Query[LeaderboardQuery]):
+    players = GAME_STORE.game_ranking(gid, params.limit)
+    if players is None:
+        return 404, {"detail": "Game not found"}
+    return ranked(players)
+# -----------
+
+from typing import List, Optional
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Count, Expression, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.sql import UpdateQuery
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
-from ninja import NinjaAPI
-from .models import Student, Game, Player
+from ninja import NinjaAPI, Query
+from ninja.errors import HttpError
+from . import engine, events, metrics, movelog, odds, writebehind
+from .cache import collection_versions, game_cache
+from .conditional import collection_etag, conditional, game_etag
+from .models import Student, Game, Move, Player
+from .pagination import KeysetPagination
+from .projection import json_response, project, schema_fields
+from .renderers import get_renderer
+from .store import ranked
 from .schemas import (
-    StudentIn, StudentOut, Msg,
-    GameIn, GameOut, GameListItem,
-    PlayerIn, PlayerOut, PlayInput
+    StudentIn, StudentOut, StudentPage, Msg, Conflict,
+    GameIn, GameOut, GameListItem, GamePage,
+    PlayerIn, PlayerOut, PlayInput, MoveIn, CacheStats,
+    RankedPlayer, LeaderboardQuery, HintQuery, HintOut, WriteBehindStats,
+    MoveOut, MovePage, ReplayQuery, GameReplay,
 )
 
-api = NinjaAPI(title="Demo API (ORM)")
+api = NinjaAPI(title="Demo API (ORM)", renderer=get_renderer())
+
+# colonnes lues pour le détail d'un game : celles des schémas de réponse
+GAME_FIELDS = schema_fields(GameListItem)
+PLAYER_FIELDS = schema_fields(PlayerOut)
+
+# Budget de requêtes SQL par endpoint (cas nominal, hors SAVEPOINT/transaction,
+# base avec UPDATE ... RETURNING). QueryBudgetTests échoue si un endpoint
+# le dépasse ou si un endpoint n'a pas de budget.
+QUERY_BUDGETS = {
+    ("GET", "/students"): 1,                          # page keyset
+    ("POST", "/students"): 1,                         # INSERT
+    ("DELETE", "/students/{pk}"): 1,                  # DELETE
+    ("GET", "/games"): 1,                             # page keyset
+    ("POST", "/games"): 1,                            # INSERT (game neuf : pas de joueurs)
+    ("GET", "/games/{gid}"): 2,                       # game + joueurs (0 si en cache)
+    # les écritures de games ajoutent leurs coups au journal : + 1 INSERT (movelog)
+    ("POST", "/games/{gid}/start"): 3,                # UPDATE RETURNING + journal + joueurs
+    ("POST", "/games/{gid}/end"): 3,                  # UPDATE RETURNING + journal + joueurs
+    ("POST", "/games/{gid}/players"): 3,              # UPDATE game (compteur, existe ?) + INSERT + journal
+    ("POST", "/games/{gid}/players/bulk"): 3,         # UPDATE game (compteur, existe ?) + INSERT multi-lignes + journal
+    ("POST", "/games/{gid}/moves"): 5,                # verrou game + joueurs + bulk_update + UPDATE game + journal
+    ("POST", "/games/{gid}/players/{pid}/play"): 3,   # UPDATE game (verrou, agrégats) + UPDATE player RETURNING + journal (hit : tirage + main + joueur + game + journal) ; write-behind : 0
+    ("GET", "/games/{gid}/players/{pid}/hint"): 1,   # joueur + sabot du game (jointure)
+    ("GET", "/games/{gid}/moves"): 1,                 # page keyset du journal (+ game si page vide)
+    ("GET", "/games/{gid}/replay"): 2,                # dernier snapshot + fin du journal (+ game si aucun des deux)
+    ("DELETE", "/games/{gid}/players/{pid}"): 4,      # verrou game + DELETE + UPDATE game (compteurs) + journal
+    ("GET", "/games/{gid}/events"): 2,                # snapshot (game + joueurs), puis diffs poussés
+    ("GET", "/leaderboard"): 1,                       # top-N (index -score, id)
+    ("GET", "/games/{gid}/leaderboard"): 2,           # top-N du game (index game, -score) ; + game si vide
+    ("GET", "/cache/stats"): 0,
+    ("GET", "/write-behind/stats"): 0,
+    ("GET", "/metrics"): 0,
+}
+
+
+# =========================
+# Helpers (ORM)
+# =========================
+def _can_update_returning(using: str) -> bool:
+    # UPDATE ... RETURNING : PostgreSQL et SQLite >= 3.35
+    # (MySQL/MariaDB ne l'ont pas pour UPDATE)
+    conn = connections[using]
+    return conn.vendor in ("postgresql", "sqlite") and conn.features.can_return_columns_from_insert
+
+
+def _returning_sql(qs, values: dict, fields) -> tuple:
+    # L'UPDATE est compilé par l'ORM (F(), Greatest...), on y ajoute juste RETURNING.
+    query = qs.query.chain(UpdateQuery)
+    query.add_update_values(values)
+    sql, params = query.get_compiler(qs.db).as_sql()
+    meta = qs.model._meta
+    cols = ", ".join(connections[qs.db].ops.quote_name(meta.get_field(f).column) for f in fields)
+    return f"{sql} RETURNING {cols}", params
+
+
+def _update_returning(qs, values: dict, fields=PLAYER_FIELDS) -> Optional[dict]:
+    # Écrit et relit la ligne en un seul aller-retour.
+    sql, params = _returning_sql(qs, values, fields)
+    with connections[qs.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    return dict(zip(fields, row)) if row else None
+
+
+class _Param(Expression):
+    # Valeur d'une requête compilée une seule fois (cf. _update_compiled) :
+    # rendue en %s, remplacée à chaque exécution par args[name].
+    def __init__(self, name: str):
+        super().__init__(output_field=IntegerField())
+        self.name = name
+
+    def as_sql(self, compiler, connection):
+        return "%s", [self]
+
+
+_compiled = {}
+
+
+def _update_compiled(key: tuple, build, fields, **args) -> Optional[dict]:
+    # _update_returning pour un UPDATE chaud : build() -> (qs, values), avec
+    # des _Param à la place des valeurs qui changent d'un appel à l'autre, est
+    # compilé une fois par `key`. Avec des sous-requêtes, la compilation par
+    # l'ORM coûte bien plus que l'exécution (bench play).
+    stmt = _compiled.get(key)
+    if stmt is None:
+        qs, values = build()
+        stmt = _compiled[key] = (qs.db, *_returning_sql(qs, values, fields))
+    using, sql, params = stmt
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, [args[p.name] if isinstance(p, _Param) else p for p in params])
+        row = cursor.fetchone()
+    return dict(zip(fields, row)) if row else None
+
+
+def _play_changes(data: PlayInput) -> dict:
+    # valeurs de l'UPDATE d'un coup : expressions SQL, pas de read-modify-write
+    changes = {}
+    if data.add_score:
+        changes["score"] = Greatest(F("score") + int(data.add_score), Value(0))
+    if data.stand:
+        changes["stand"] = True
+    return changes
+
+
+def _deal(gid: int, n: int = 1) -> Optional[List[int]]:
+    # n cartes du sabot du game (engine.Shoe), None si le game n'existe pas.
+    # L'UPDATE de shoe_pos passe en premier : il verrouille la ligne du game
+    # jusqu'au commit, deux tirages concurrents n'ont jamais la même carte.
+    qs = Game.objects.filter(pk=gid)
+    values = {"shoe_pos": F("shoe_pos") + n}
+    if _can_update_returning(qs.db):
+        row = _update_returning(qs, values, ("shoe", "shoe_pos"))
+    elif qs.update(**values):
+        row = qs.values("shoe", "shoe_pos").first()
+    else:
+        row = None
+    if row is None:
+        return None
+    shoe = engine.Shoe.from_bytes(bytes(row["shoe"]), row["shoe_pos"] - n)
+    if not shoe.needs_shuffle(n):
+        return shoe.deal(n)
+    # premier tirage du game, ou carte de coupe atteinte : sabot neuf ; un
+    # lot plus grand qu'un sabot (jusqu'à sa carte de coupe) en prend plusieurs
+    cards = []
+    while len(cards) < n:
+        shoe = engine.Shoe.new(getattr(settings, "BLACKJACK_SHOE_DECKS", 6))
+        cards += shoe.deal(min(n - len(cards), shoe.cut))
+    qs.update(shoe=shoe.to_bytes(), shoe_pos=shoe.pos)
+    return cards
+
+
+def _lock_game(gid: int) -> bool:
+    # Verrou de la ligne du game (SELECT ... FOR UPDATE), False s'il n'existe
+    # pas. À prendre avant d'écrire ses joueurs quand l'UPDATE du game recalcule
+    # ses agrégats (_player_aggregates) : sinon, en READ COMMITTED, deux coups
+    # concurrents les calculent chacun sans le joueur de l'autre. Même ordre
+    # que _deal (game puis joueurs), qui tient lieu de verrou quand il y a tirage.
+    return Game.objects.select_for_update().filter(pk=gid).values_list("pk", flat=True).first() is not None
+
+
+def _hint(cards: str, shoe: bytes, shoe_pos: int, dealer: str, simulate: bool = True) -> dict:
+    # odds.hint sur le reste du sabot, tel que le verra le prochain tirage :
+    # sabot neuf s'il doit être remélangé (cf. _deal), moins la carte du croupier
+    up = engine.parse_cards(dealer)[0]
+    s = engine.Shoe.from_bytes(bytes(shoe), shoe_pos)
+    if s.needs_shuffle():
+        counts = engine.Shoe.full_counts(getattr(settings, "BLACKJACK_SHOE_DECKS", 6))
+    else:
+        counts = list(s.remaining())
+    if counts[up]:
+        counts[up] -= 1
+    return odds.hint(cards, up, counts, simulate)
+
+
+def _hit(hand: str, card: int) -> dict:
+    # main + une carte -> nouvelles valeurs du joueur ; à 21 ou plus, la main s'arrête
+    codes = engine.parse_cards(hand) + [card]
+    score, _ = engine.hand_value(codes)
+    return {"cards": engine.format_cards(codes), "score": score, "stand": score >= 21}
+
+
+def _player_aggregates(score: bool = False, stand: bool = False) -> dict:
+    # Agrégats dénormalisés du game (cf. models.Game), recalculés depuis ses
+    # joueurs dans l'UPDATE du game lui-même : un score peut baisser, un simple
+    # incrément ne suffit pas. Sous-requêtes servies par les index (game, -score)
+    # et (game, id). À appeler dans la transaction qui modifie les joueurs.
+    players = Player.objects.filter(game_id=OuterRef("pk")).order_by()
+    values = {}
+    if score:
+        values["top_score"] = Coalesce(Subquery(players.order_by("-score").values("score")[:1]), 0)
+    if stand:
+        standing = players.filter(stand=True).values("game_id").annotate(n=Count("pk")).values("n")
+        values["standing_count"] = Coalesce(Subquery(standing), 0)
+    return values
+
+
+def _play_aggregates(pid, add_score=0, stand: bool = False) -> dict:
+    # Agrégats du game après un coup sans tirage de pid (add_score / stand),
+    # calculés avant l'UPDATE du joueur : les autres joueurs + sa nouvelle
+    # valeur. L'UPDATE du game passe ainsi en premier et tient lieu de verrou
+    # (cf. _lock_game), sans SELECT ... FOR UPDATE préalable.
+    others = Player.objects.filter(game_id=OuterRef("pk")).exclude(pk=pid).order_by()
+    values = {}
+    if add_score:
+        old = Subquery(Player.objects.filter(pk=pid, game_id=OuterRef("pk")).values("score")[:1])
+        new = Greatest(Coalesce(old, 0) + add_score, Value(0))
+        values["top_score"] = Greatest(Coalesce(Subquery(others.order_by("-score").values("score")[:1]), 0), new)
+    if stand:
+        standing = others.filter(stand=True).values("game_id").annotate(n=Count("pk")).values("n")
+        values["standing_count"] = Coalesce(Subquery(standing), 0) + 1
+    return values
+
+
+def _update_game_play(gid: int, pid: int, data: PlayInput, moves: int) -> Optional[dict]:
+    # _update_game d'un coup sans tirage (tour, agrégats anticipés), compilé
+    # une fois par forme de coup (cf. _update_compiled)
+    score, stand = bool(data.add_score), bool(data.stand)
+    fields = GAME_FIELDS + ("move_count",)
+    if not _can_update_returning(Game.objects.db):
+        changes = _play_aggregates(pid, int(data.add_score or 0), stand)
+        if score:
+            changes["turn"] = F("turn") + 1
+        return _update_game(gid, moves=moves, **changes)
+
+    def build():
+        values = _play_aggregates(_Param("pid"), score and _Param("add_score"), stand)
+        if score:
+            values["turn"] = F("turn") + 1
+        values["version"] = F("version") + 1
+        values["move_count"] = F("move_count") + _Param("moves")
+        return Game.objects.filter(pk=_Param("gid")), values
+
+    return _update_compiled(("play", score, stand), build, fields,
+                            gid=gid, pid=pid, add_score=int(data.add_score or 0), moves=moves)
+
+
+def _if_match(request) -> Optional[int]:
+    # If-Match: "<version>" (champ version de GameOut / PlayerOut) : l'écriture
+    # n'a lieu que si la ligne en est toujours à cette version. Absent ou "*" :
+    # écriture sans condition.
+    value = request.headers.get("If-Match", "*").strip() if request is not None else "*"
+    if value == "*":
+        return None
+    try:
+        return int(value.removeprefix("W/").strip('"'))
+    except ValueError:
+        raise HttpError(400, "If-Match: expected a version number")
+
+
+def _version_conflict(qs, expected: Optional[int]):
+    # UPDATE / DELETE conditionnel sans ligne touchée : 409 (et transaction
+    # annulée) si la ligne existe dans une autre version, None si elle n'existe
+    # pas (404 de l'appelant). Un SELECT, sur ce chemin seulement ; aucun verrou.
+    if expected is None:
+        return None
+    version = qs.values_list("version", flat=True).first()
+    if version is None:
+        return None
+    transaction.set_rollback(True)
+    return 409, {"detail": "Version conflict", "version": version}
+
+
+def _update_game(gid: int, moves: int = 0, expected: Optional[int] = None, **values) -> Optional[dict]:
+    # UPDATE du game + sa ligne à jour (RETURNING si possible), None si absent
+    # ou, avec expected, s'il n'en est plus à cette version (compare-and-swap).
+    # moves : coups journalisés par l'appelant (movelog.append, qui reprend
+    # le move_count ajouté à la ligne)
+    qs = Game.objects.filter(pk=gid)
+    if expected is not None:
+        qs = qs.filter(version=expected)
+    values["version"] = F("version") + 1
+    fields = GAME_FIELDS
+    if moves:
+        values["move_count"] = F("move_count") + moves
+        fields += ("move_count",)
+    if _can_update_returning(qs.db):
+        return _update_returning(qs, values, fields)
+    if not qs.update(**values):
+        return None
+    return qs.values(*fields).first()
+
+
+def _moves(pid: int, data: PlayInput, card: Optional[int] = None) -> List[Move]:
+    # coups du journal pour un PlayInput (cf. movelog.apply)
+    moves = []
+    if data.hit:
+        moves.append(Move(player_id=pid, kind=Move.Kind.HIT, value=card))
+    elif data.add_score:
+        moves.append(Move(player_id=pid, kind=Move.Kind.SCORE, value=int(data.add_score)))
+    if data.stand:
+        moves.append(Move(player_id=pid, kind=Move.Kind.STAND))
+    return moves
+
+
+def _player_row(p) -> dict:
+    # Player (instance ou dict values()) -> dict PlayerOut, pour les événements
+    if isinstance(p, dict):
+        return p
+    return {f: getattr(p, f) for f in PLAYER_FIELDS}
+
+
+def _game_row(game: dict) -> dict:
+    return {f: game[f] for f in GAME_FIELDS}
+
+
+def _load_game_detail(gid: int, game: Optional[dict] = None) -> Optional[dict]:
+    # Chargeur commun du détail d'un game (GameOut) pour tous les endpoints :
+    # 1 SELECT game (sauté si `game` est déjà connu) + 1 SELECT joueurs.
+    if game is None:
+        game = Game.objects.filter(pk=gid).values(*GAME_FIELDS).first()
+        if game is None:
+            return None
+    game["players"] = list(
+        Player.objects.filter(game_id=gid).order_by("id").values(*PLAYER_FIELDS)
+    )
+    return writebehind.overlay(gid, game)  # coups pas encore écrits (write-behind)
+
+
+def _leaderboard(qs, limit: int) -> list:
+    # (-score, id) : même ordre que les index player_score_idx / player_game_score_idx
+    # (l'id y départage les ex aequo), le tri se fait donc dans l'index
+    return ranked(project(qs.order_by("-score", "id")[:limit], PlayerOut))
+
+
+def _game_changed(gid: int, game: Optional[dict] = None) -> None:
+    # après chaque mutation d'un game : cache de détail (nouvel état s'il est
+    # connu, sinon invalidation) + version de la liste /games (ETag)
+    if game is None:
+        game_cache.invalidate(gid)
+    else:
+        game_cache.update(gid, game)
+    collection_versions.bump("games")
+
+
+def _cached_game_detail(gid: int) -> Optional[dict]:
+    # Lecture via le cache ; en cas de miss, chargeur commun puis mise en cache.
+    # La version est lue avant le chargement (cf. GameDetailCache).
+    game = game_cache.get(gid)
+    if game is None:
+        version = game_cache.version(gid)
+        game = _load_game_detail(gid)
+        if game is not None:
+            game_cache.set(gid, version, game)
+    return game
+
+
+def _play_buffered(gid: int, pid: int, data: PlayInput, expected: Optional[int] = None):
+    # play_turn en write-behind (cf. writebehind) : aucune requête une fois
+    # le joueur chargé (If-Match compris) ; l'événement "game" suit au flush
+    try:
+        p = writebehind.get_buffer().play(gid, pid, data.add_score, data.stand, expected)
+    except writebehind.VersionConflict as e:
+        return 409, {"detail": "Version conflict", "version": e.version}
+    if p is None:
+        if not Game.objects.filter(pk=gid).exists():
+            return 404, {"detail": "Game not found"}
+        return 404, {"detail": "Player not found or not in this game"}
+    _game_changed(gid)
+    events.publish(gid, "players", players=[p])
+    return p
 
 
 # =========================
 # Students (ORM)
 # =========================
-@api.get("/students", response=List[StudentOut])
-def list_students(request):
-    return Student.objects.all()
+@api.get("/students", response=StudentPage)
+@conditional(collection_etag("students"))
+def list_students(request, page: Query[KeysetPagination.Input]):
+    return json_response(KeysetPagination().project(Student.objects.all(), StudentOut, page))
 
 
-@api.post("/students", response={201: StudentOut})
+@api.post("/students", response={201: StudentOut, 409: Msg})
 def create_student(request, data: StudentIn):
-    obj = Student.objects.create(**data.dict())
+    # unicité de l'email garantie par l'index unique (pas de SELECT préalable)
+    try:
+        with transaction.atomic():
+            obj = Student.objects.create(**data.dict())
+    except IntegrityError:
+        return 409, {"detail": "Email already used"}
+    collection_versions.bump("students")
     return 201, obj
 
 
@@ -294,6 +688,7 @@ def create_student(request, data: StudentIn):
 def delete_student(request, pk: int):
     deleted, _ = Student.objects.filter(pk=pk).delete()
     if deleted:
+        collection_versions.bump("students")
         return 204, None
     return 404, {"detail": "Student not found"}
 
@@ -304,103 +699,329 @@ def delete_student(request, pk: int):
 @api.post("/games", response={201: GameOut})
 def create_game(request, data: GameIn):
     g = Game.objects.create(name=data.name.strip())
-    g = Game.objects.prefetch_related("players").get(pk=g.pk)
-    return 201, {
-        "id": g.id,
-        "name": g.name,
-        "turn": g.turn,
-        "ended": g.ended,
-        "players": [PlayerOut.from_orm(p) for p in g.players.all()],
-    }
+    # un game neuf n'a pas encore de joueurs : inutile de les relire
+    game = {**{f: getattr(g, f) for f in GAME_FIELDS}, "players": []}
+    _game_changed(g.id, game)
+    return 201, game
 
 
-@api.get("/games", response=List[GameListItem])
-def list_games(request):
-    return [
-        GameListItem(id=g.id, name=g.name, turn=g.turn, ended=g.ended)
-        for g in Game.objects.all()
-    ]
+@api.get("/games", response=GamePage)
+@conditional(collection_etag("games"))
+def list_games(request, page: Query[KeysetPagination.Input], ended: Optional[bool] = None):
+    qs = Game.objects.all()
+    if ended is not None:
+        # Value() : « ended = ? » au lieu de « WHERE ended » nu, sinon SQLite
+        # n'utilise pas l'index (ended, id)
+        qs = qs.filter(ended=Value(ended))
+    return json_response(KeysetPagination().project(qs, GameListItem, page))
 
 
 @api.get("/games/{gid}", response={200: GameOut, 404: Msg})
+@conditional(game_etag)
 def get_game(request, gid: int):
-    g = Game.objects.prefetch_related("players").filter(pk=gid).first()
-    if not g:
+    game = _cached_game_detail(gid)
+    if game is None:
         return 404, {"detail": "Game not found"}
-    return {
-        "id": g.id,
-        "name": g.name,
-        "turn": g.turn,
-        "ended": g.ended,
-        "players": [PlayerOut.from_orm(p) for p in g.players.all()],
-    }
+    # lignes values() de _load_game_detail : déjà au format GameOut
+    return json_response(game)
 
 
-@api.post("/games/{gid}/start", response={200: GameOut, 404: Msg})
+@api.post("/games/{gid}/start", response={200: GameOut, 404: Msg, 409: Conflict})
 def start_game(request, gid: int):
-    g = Game.objects.filter(pk=gid).first()
-    if not g:
-        return 404, {"detail": "Game not found"}
-    g.turn = 0
-    g.ended = False
-    g.save(update_fields=["turn", "ended"])
-    g.refresh_from_db()
-    return get_game(request, gid)[1] if isinstance(get_game(request, gid), tuple) else get_game(request, gid)
-
-
-@api.post("/games/{gid}/end", response={200: GameOut, 404: Msg})
+    expected = _if_match(request)
+    writebehind.sync(gid)
+    with transaction.atomic():
+        game = _update_game(gid, moves=1, expected=expected, turn=0, ended=False)
+        if game is None:
+            return _version_conflict(Game.objects.filter(pk=gid), expected) or (404, {"detail": "Game not found"})
+        movelog.append(game, [Move(kind=Move.Kind.START)])
+    game = _load_game_detail(gid, game)
+    _game_changed(gid, game)
+    events.publish(gid, "game", game=_game_row(game))
+    return game
+
+
+@api.post("/games/{gid}/end", response={200: GameOut, 404: Msg, 409: Conflict})
 def end_game(request, gid: int):
-    g = Game.objects.filter(pk=gid).first()
-    if not g:
-        return 404, {"detail": "Game not found"}
-    g.ended = True
-    g.save(update_fields=["ended"])
-    g.refresh_from_db()
-    return get_game(request, gid)[1] if isinstance(get_game(request, gid), tuple) else get_game(request, gid)
+    expected = _if_match(request)
+    writebehind.sync(gid)
+    with transaction.atomic():
+        game = _update_game(gid, moves=1, expected=expected, ended=True)
+        if game is None:
+            return _version_conflict(Game.objects.filter(pk=gid), expected) or (404, {"detail": "Game not found"})
+        movelog.append(game, [Move(kind=Move.Kind.END)])
+    game = _load_game_detail(gid, game)
+    _game_changed(gid, game)
+    events.publish(gid, "game", game=_game_row(game))
+    return game
 
 
 @api.post("/games/{gid}/players", response={201: PlayerOut, 404: Msg})
 def add_player(request, gid: int, data: PlayerIn):
-    g = Game.objects.filter(pk=gid).first()
-    if not g:
-        return 404, {"detail": "Game not found"}
-    p = Player.objects.create(game=g, name=data.name.strip())
+    # l'UPDATE du compteur sert aussi de test d'existence du game
+    writebehind.sync(gid)
+    with transaction.atomic():
+        game = _update_game(gid, moves=1, player_count=F("player_count") + 1)
+        if game is None:
+            return 404, {"detail": "Game not found"}
+        p = Player.objects.create(game_id=gid, name=data.name.strip())
+        movelog.append(game, [Move(player_id=p.id, kind=Move.Kind.JOIN, name=p.name)])
+    _game_changed(gid)
+    events.publish(gid, "players", players=[_player_row(p)])
+    events.publish(gid, "game", game=game)
     return 201, p
 
 
-@api.post("/games/{gid}/players/{pid}/play", response={200: PlayerOut, 404: Msg})
+@api.post("/games/{gid}/players/bulk", response={201: List[PlayerOut], 404: Msg})
+def add_players(request, gid: int, data: List[PlayerIn]):
+    # place toute une table en un seul INSERT
+    writebehind.sync(gid)
+    with transaction.atomic():
+        game = _update_game(gid, moves=len(data), player_count=F("player_count") + len(data))
+        if game is None:
+            return 404, {"detail": "Game not found"}
+        players = Player.objects.bulk_create(
+            Player(game_id=gid, name=p.name.strip()) for p in data
+        )
+        movelog.append(game, [Move(player_id=p.id, kind=Move.Kind.JOIN, name=p.name) for p in players])
+    _game_changed(gid)
+    events.publish(gid, "players", players=[_player_row(p) for p in players])
+    events.publish(gid, "game", game=game)
+    return 201, players
+
+
+@api.post("/games/{gid}/moves", response={200: List[PlayerOut], 404: Msg, 409: Msg})
+def play_moves(request, gid: int, data: List[MoveIn]):
+    # Un lot de coups pour un game, appliqué en une transaction :
+    # les coups d'un même joueur sont cumulés dans l'ordre, puis bulk_update.
+    pids = {m.player_id for m in data}
+    hits = sum(1 for m in data if m.hit)
+    writebehind.sync(gid)
+    with transaction.atomic():
+        # game verrouillé avant ses joueurs : cartes tirées (cf. _deal) ou _lock_game
+        dealt = _deal(gid, hits) if hits else None
+        if not (dealt if hits else _lock_game(gid)):
+            return 404, {"detail": "Game not found"}
+        dealt = iter(dealt or ())
+        players = {
+            p.id: p
+            for p in Player.objects.select_for_update().filter(game_id=gid, pk__in=pids)
+        }
+        if len(players) != len(pids):
+            transaction.set_rollback(True)  # cartes tirées rendues au sabot
+            return 404, {"detail": "Player not found or not in this game"}
+
+        turns, stands, log = 0, False, []
+        for m in data:
+            p = players[m.player_id]
+            card = next(dealt) if m.hit else None
+            log += _moves(p.id, m, card)
+            if m.hit:
+                if p.stand:
+                    transaction.set_rollback(True)
+                    return 409, {"detail": "Player already stands"}
+                for field, value in _hit(p.cards, card).items():
+                    setattr(p, field, value)
+                stands = stands or p.stand
+                turns += 1
+            elif m.add_score:
+                p.score = max(0, p.score + int(m.add_score))
+                turns += 1
+            if m.stand:
+                p.stand = stands = True
+
+        for p in players.values():
+            p.version += 1
+        if players:
+            Player.objects.bulk_update(players.values(), ["score", "stand", "cards", "version"])
+        changes = _player_aggregates(score=turns > 0, stand=stands)
+        if turns:
+            changes["turn"] = F("turn") + turns
+        game = _update_game(gid, moves=len(log), **changes) if changes else None
+        if log:
+            movelog.append(game, log)
+
+    touched = [players[pid] for pid in dict.fromkeys(m.player_id for m in data)]
+    _game_changed(gid)
+    if touched:
+        events.publish(gid, "players", players=[_player_row(p) for p in touched])
+    if game is not None:
+        events.publish(gid, "game", game=game)
+    return touched
+
+
+@api.post("/games/{gid}/players/{pid}/play", response={200: PlayerOut, 404: Msg, 409: Conflict})
 def play_turn(request, gid: int, pid: int, data: PlayInput):
-    g = Game.objects.filter(pk=gid).first()
-    if not g:
+    # UPDATE conditionnels atomiques (F() / Greatest) au lieu de
+    # lecture + save() : aucun incrément de score ou de tour perdu en concurrence.
+    # Avec If-Match, le coup n'est joué que sur cette version du joueur.
+    expected = _if_match(request)
+    if writebehind.enabled() and not data.hit:
+        return _play_buffered(gid, pid, data, expected)
+    writebehind.sync(gid)
+    player = Player.objects.filter(pk=pid, game_id=gid)
+    qs = player if expected is None else player.filter(version=expected)
+    log = _moves(pid, data) if not data.hit else None
+    with transaction.atomic():
+        # game verrouillé avant le joueur : tirage (cf. _deal), UPDATE du game
+        # (coup joué, agrégats anticipés) ou _lock_game (coup vide)
+        game = None
+        if data.hit:
+            card = _deal(gid)
+            found = card is not None
+        elif log:
+            game = _update_game_play(gid, pid, data, len(log))
+            found = game is not None
+        else:
+            found = _lock_game(gid)
+        if not found:
+            return 404, {"detail": "Game not found"}
+        if data.hit:
+            # main lue après le tirage, sous le verrou du game
+            hand = qs.values("cards", "stand").first()
+            if hand is not None and hand["stand"]:
+                transaction.set_rollback(True)  # carte rendue au sabot
+                return 409, {"detail": "Player already stands"}
+            changes = _hit(hand["cards"], card[0]) if hand else None
+            if changes and data.stand:
+                changes["stand"] = True
+        else:
+            changes = _play_changes(data)
+        if changes:
+            changes["version"] = F("version") + 1
+
+        if not changes:
+            p = qs.values(*PLAYER_FIELDS).first()
+        elif _can_update_returning(qs.db):
+            p = _update_returning(qs, changes)
+        elif qs.update(**changes):
+            p = qs.values(*PLAYER_FIELDS).first()
+        else:
+            p = None
+
+        if p is None:
+            # chemin rare : on distingue seulement ici version / joueur absent ;
+            # tirage ou UPDATE du game annulés
+            conflict = _version_conflict(player, expected)
+            transaction.set_rollback(True)
+            return conflict or (404, {"detail": "Player not found or not in this game"})
+
+        if data.hit:
+            # agrégats relus après l'UPDATE du joueur : la carte décide du stand
+            changes = _player_aggregates(score=True, stand=p["stand"])
+            changes["turn"] = F("turn") + 1
+            log = _moves(pid, data, card[0])
+            game = _update_game(gid, moves=len(log), **changes)
+        if log:
+            movelog.append(game, log)
+
+    # cache et diffs mis à jour après le commit
+    _game_changed(gid)
+    events.publish(gid, "players", players=[p])
+    if game is not None:
+        events.publish(gid, "game", game=game)
+    return p
+
+
+@api.delete("/games/{gid}/players/{pid}", response={204: None, 404: Msg, 409: Conflict})
+def remove_player(request, gid: int, pid: int):
+    # S'assure que le joueur appartient bien au game
+    expected = _if_match(request)
+    writebehind.sync(gid)
+    player = Player.objects.filter(pk=pid, game_id=gid)
+    with transaction.atomic():
+        # game verrouillé avant le DELETE : agrégats recalculés ci-dessous (cf. _lock_game)
+        if not _lock_game(gid):
+            return 404, {"detail": "Player not found"}
+        deleted, _ = (player if expected is None else player.filter(version=expected)).delete()
+        if not deleted:
+            return _version_conflict(player, expected) or (404, {"detail": "Player not found"})
+        game = _update_game(
+            gid, moves=1, player_count=F("player_count") - 1, **_player_aggregates(score=True, stand=True)
+        )
+        movelog.append(game, [Move(player_id=pid, kind=Move.Kind.LEAVE)])
+    _game_changed(gid)
+    events.publish(gid, "player_removed", player_id=pid)
+    events.publish(gid, "game", game=game)
+    return 204, None
+
+
+@api.get("/games/{gid}/events", response={404: Msg, 501: Msg})
+def game_events(request, gid: int):
+    # Flux SSE : snapshot du game, puis les diffs publiés par les endpoints
+    # ci-dessus. Servi en ASGI seulement : le flux est un générateur async,
+    # qu'un serveur WSGI lirait en entier avant de répondre (jamais, le flux
+    # ne finit qu'avec le game).
+    if isinstance(request, WSGIRequest):
+        return 501, {"detail": "Event stream requires an ASGI server"}
+    sub = events.get_broker().subscribe(gid)
+    game = _load_game_detail(gid)
+    if game is None:
+        events.get_broker().unsubscribe(sub)
         return 404, {"detail": "Game not found"}
-    p = Player.objects.filter(pk=pid, game=g).first()
-    if not p:
+    return events.stream_response(sub, game)
+
+
+@api.get("/leaderboard", response=List[RankedPlayer])
+def leaderboard(request, params: Query[LeaderboardQuery]):
+    return json_response(_leaderboard(Player.objects.all(), params.limit))
+
+
+@api.get("/games/{gid}/leaderboard", response={200: List[RankedPlayer], 404: Msg})
+def game_leaderboard(request, gid: int, params: Query[LeaderboardQuery]):
+    players = _leaderboard(Player.objects.filter(game_id=gid), params.limit)
+    # pas de joueurs : game vide ou inexistant
+    if not players and not Game.objects.filter(pk=gid).exists():
+        return 404, {"detail": "Game not found"}
+    return json_response(players)
+
+
+@api.get("/games/{gid}/players/{pid}/hint", response={200: HintOut, 404: Msg})
+def player_hint(request, gid: int, pid: int, params: Query[HintQuery]):
+    # "hit ou stand ?" pour la main du joueur (Monte Carlo, cf. odds)
+    row = Player.objects.filter(pk=pid, game_id=gid).values("cards", "game__shoe", "game__shoe_pos").first()
+    if row is None:
+        if not Game.objects.filter(pk=gid).exists():
+            return 404, {"detail": "Game not found"}
         return 404, {"detail": "Player not found or not in this game"}
+    return _hint(row["cards"], row["game__shoe"], row["game__shoe_pos"], params.dealer, params.simulate)
 
-    updated_fields = []
-    if data.add_score:
-        p.score = max(0, p.score + int(data.add_score))
-        updated_fields.append("score")
-        g.turn += 1
-        g.save(update_fields=["turn"])
 
-    if data.stand:
-        p.stand = True
-        updated_fields.append("stand")
+@api.get("/games/{gid}/moves", response={200: MovePage, 404: Msg})
+def list_moves(request, gid: int, page: Query[KeysetPagination.Input]):
+    # historique des coups (audit), dans l'ordre
+    body = KeysetPagination().project(Move.objects.filter(game_id=gid), MoveOut, page)
+    if not body["items"] and not Game.objects.filter(pk=gid).exists():
+        return 404, {"detail": "Game not found"}
+    return json_response(body)
 
-    if updated_fields:
-        p.save(update_fields=updated_fields)
 
-    return p
+@api.get("/games/{gid}/replay", response={200: GameReplay, 404: Msg})
+def replay_game(request, gid: int, params: Query[ReplayQuery]):
+    # état du game reconstruit depuis le journal, éventuellement à un coup donné (litiges)
+    state = movelog.rebuild(gid, params.upto)
+    if state is None:
+        return 404, {"detail": "Game not found"}
+    return json_response(state)
 
 
-@api.delete("/games/{gid}/players/{pid}", response={204: None, 404: Msg})
-def remove_player(request, gid: int, pid: int):
-    # S'assure que le joueur appartient bien au game
-    deleted, _ = Player.objects.filter(pk=pid, game_id=gid).delete()
-    if deleted:
-        return 204, None
-    return 404, {"detail": "Player not found"}
+@api.get("/cache/stats", response=CacheStats)
+def cache_stats(request):
+    return game_cache.stats()
+
+
+@api.get("/write-behind/stats", response=WriteBehindStats)
+def write_behind_stats(request):
+    return writebehind.stats()
+
+
+@api.get("/metrics", include_in_schema=False)
+def metrics_text(request):
+    # format texte Prometheus (cf. metrics.py), métriques du process
+    return HttpResponse(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+
+metrics.instrument(api)
 
 
 
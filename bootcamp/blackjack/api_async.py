@@ -0,0 +1,346 @@
+from typing import List, Optional
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError
+from django.db.models import F, Value
+from django.http import HttpResponse
+from ninja import NinjaAPI, Query
+from . import api as sync_api
+from . import events, metrics, movelog, writebehind
+from .cache import collection_versions, game_cache
+from .conditional import collection_etag, conditional, game_etag
+from .api import (
+    GAME_FIELDS, PLAYER_FIELDS, _game_changed, _game_row, _hint, _if_match,
+    _moves, _play_changes, _player_aggregates, _player_row,
+)
+from .models import Student, Game, Move, Player
+from .pagination import KeysetPagination
+from .projection import aproject, json_response
+from .renderers import get_renderer
+from .store import ranked
+from .schemas import (
+    StudentIn, StudentOut, StudentPage, Msg, Conflict,
+    GameIn, GameOut, GameListItem, GamePage,
+    PlayerIn, PlayerOut, PlayInput, MoveIn, CacheStats,
+    RankedPlayer, LeaderboardQuery, HintQuery, HintOut, WriteBehindStats,
+    MoveOut, MovePage, ReplayQuery, GameReplay,
+)
+
+# Mêmes routes que api.py, en handlers async (ORM async : aget, acreate, aupdate...).
+# Monté à la place de l'API sync avec BLACKJACK_API_MODE=async (cf. urls.py),
+# à servir en ASGI (uvicorn bootcamp.asgi:application).
+api = NinjaAPI(title="Demo API (ORM, async)", urls_namespace="api-async", renderer=get_renderer())
+
+
+# =========================
+# Helpers (ORM async)
+# =========================
+async def _aload_game_detail(gid: int, game: Optional[dict] = None) -> Optional[dict]:
+    if game is None:
+        game = await Game.objects.filter(pk=gid).values(*GAME_FIELDS).afirst()
+        if game is None:
+            return None
+    game["players"] = [
+        p async for p in Player.objects.filter(game_id=gid).order_by("id").values(*PLAYER_FIELDS)
+    ]
+    return writebehind.overlay(gid, game)
+
+
+async def _acached_game_detail(gid: int) -> Optional[dict]:
+    # même logique que api._cached_game_detail
+    game = game_cache.get(gid)
+    if game is None:
+        version = game_cache.version(gid)
+        game = await _aload_game_detail(gid)
+        if game is not None:
+            game_cache.set(gid, version, game)
+    return game
+
+
+async def _awritebehind_sync(gid: int) -> None:
+    # cf. writebehind.sync : flush transactionnel, dans un thread
+    if writebehind.enabled():
+        await sync_to_async(writebehind.sync)(gid)
+
+
+async def _aupdate_game(gid: int, moves: int = 0, expected: Optional[int] = None, **values) -> Optional[dict]:
+    # cf. api._update_game : aupdate (pas de RETURNING en ORM async) puis
+    # relecture de la ligne, qui peut déjà porter l'écriture suivante
+    qs = Game.objects.filter(pk=gid)
+    values["version"] = F("version") + 1
+    fields = GAME_FIELDS
+    if moves:
+        values["move_count"] = F("move_count") + moves
+        fields += ("move_count",)
+    if not await (qs if expected is None else qs.filter(version=expected)).aupdate(**values):
+        return None
+    return await qs.values(*fields).afirst()
+
+
+async def _aversion_conflict(qs, expected: Optional[int]):
+    # cf. api._version_conflict, sans transaction à annuler
+    if expected is None:
+        return None
+    version = await qs.values_list("version", flat=True).afirst()
+    if version is None:
+        return None
+    return 409, {"detail": "Version conflict", "version": version}
+
+
+async def _aset_game(request, gid: int, kind: str, **values):
+    # start / end : UPDATE conditionnel (If-Match) + journal + détail
+    expected = _if_match(request)
+    await _awritebehind_sync(gid)
+    game = await _aupdate_game(gid, moves=1, expected=expected, **values)
+    if game is None:
+        return await _aversion_conflict(Game.objects.filter(pk=gid), expected) or (404, {"detail": "Game not found"})
+    await movelog.aappend(game, [Move(kind=kind)])
+    game = await _aload_game_detail(gid, game)
+    _game_changed(gid, game)
+    events.publish(gid, "game", game=_game_row(game))
+    return game
+
+
+async def _aleaderboard(qs, limit: int) -> list:
+    # cf. api._leaderboard
+    return ranked(await aproject(qs.order_by("-score", "id")[:limit], PlayerOut))
+
+
+# =========================
+# Students (ORM async)
+# =========================
+@api.get("/students", response=StudentPage)
+@conditional(collection_etag("students"))
+async def list_students(request, page: Query[KeysetPagination.Input]):
+    return json_response(await KeysetPagination().aproject(Student.objects.all(), StudentOut, page))
+
+
+@api.post("/students", response={201: StudentOut, 409: Msg})
+async def create_student(request, data: StudentIn):
+    # hors transaction (autocommit) : un INSERT refusé ne laisse rien à annuler
+    try:
+        obj = await Student.objects.acreate(**data.dict())
+    except IntegrityError:
+        return 409, {"detail": "Email already used"}
+    collection_versions.bump("students")
+    return 201, obj
+
+
+@api.delete("/students/{pk}", response={204: None, 404: Msg})
+async def delete_student(request, pk: int):
+    deleted, _ = await Student.objects.filter(pk=pk).adelete()
+    if deleted:
+        collection_versions.bump("students")
+        return 204, None
+    return 404, {"detail": "Student not found"}
+
+
+# =========================
+# Games & Players (ORM async)
+# =========================
+@api.post("/games", response={201: GameOut})
+async def create_game(request, data: GameIn):
+    g = await Game.objects.acreate(name=data.name.strip())
+    game = {**{f: getattr(g, f) for f in GAME_FIELDS}, "players": []}
+    _game_changed(g.id, game)
+    return 201, game
+
+
+@api.get("/games", response=GamePage)
+@conditional(collection_etag("games"))
+async def list_games(request, page: Query[KeysetPagination.Input], ended: Optional[bool] = None):
+    qs = Game.objects.all()
+    if ended is not None:
+        qs = qs.filter(ended=Value(ended))  # cf. api.list_games
+    return json_response(await KeysetPagination().aproject(qs, GameListItem, page))
+
+
+@api.get("/games/{gid}", response={200: GameOut, 404: Msg})
+@conditional(game_etag)
+async def get_game(request, gid: int):
+    game = await _acached_game_detail(gid)
+    if game is None:
+        return 404, {"detail": "Game not found"}
+    return json_response(game)
+
+
+# Pas de transaction en ORM async : les mutations enchaînent des requêtes
+# atomiques chacune (aupdate avec F(), INSERT), dans l'ordre des versions sync.
+# Les agrégats du game (api._player_aggregates) sont recalculés par un UPDATE
+# lancé après le commit de l'écriture des joueurs : le dernier de ces UPDATE
+# voit tous les joueurs, sans le verrou du game (api._lock_game) de la version
+# sync. Un échec en cours de route laisse les compteurs du game en avance sur
+# ses joueurs et son journal, jusqu'à l'écriture suivante du game.
+@api.post("/games/{gid}/start", response={200: GameOut, 404: Msg, 409: Conflict})
+async def start_game(request, gid: int):
+    return await _aset_game(request, gid, Move.Kind.START, turn=0, ended=False)
+
+
+@api.post("/games/{gid}/end", response={200: GameOut, 404: Msg, 409: Conflict})
+async def end_game(request, gid: int):
+    return await _aset_game(request, gid, Move.Kind.END, ended=True)
+
+
+@api.post("/games/{gid}/players", response={201: PlayerOut, 404: Msg})
+async def add_player(request, gid: int, data: PlayerIn):
+    # l'UPDATE du compteur sert aussi de test d'existence du game
+    await _awritebehind_sync(gid)
+    game = await _aupdate_game(gid, moves=1, player_count=F("player_count") + 1)
+    if game is None:
+        return 404, {"detail": "Game not found"}
+    p = await Player.objects.acreate(game_id=gid, name=data.name.strip())
+    await movelog.aappend(game, [Move(player_id=p.id, kind=Move.Kind.JOIN, name=p.name)])
+    _game_changed(gid)
+    events.publish(gid, "players", players=[_player_row(p)])
+    events.publish(gid, "game", game=game)
+    return 201, p
+
+
+@api.post("/games/{gid}/players/bulk", response={201: List[PlayerOut], 404: Msg})
+async def add_players(request, gid: int, data: List[PlayerIn]):
+    await _awritebehind_sync(gid)
+    game = await _aupdate_game(gid, moves=len(data), player_count=F("player_count") + len(data))
+    if game is None:
+        return 404, {"detail": "Game not found"}
+    players = await Player.objects.abulk_create([Player(game_id=gid, name=p.name.strip()) for p in data])
+    await movelog.aappend(game, [Move(player_id=p.id, kind=Move.Kind.JOIN, name=p.name) for p in players])
+    _game_changed(gid)
+    events.publish(gid, "players", players=[_player_row(p) for p in players])
+    events.publish(gid, "game", game=game)
+    return 201, players
+
+
+@api.post("/games/{gid}/moves", response={200: List[PlayerOut], 404: Msg, 409: Msg})
+async def play_moves(request, gid: int, data: List[MoveIn]):
+    # le lot doit rester tout-ou-rien : pas de transaction en ORM async,
+    # on réutilise donc la version sync (transaction.atomic) dans un thread
+    return await sync_to_async(sync_api.play_moves)(request, gid, data)
+
+
+@api.post("/games/{gid}/players/{pid}/play", response={200: PlayerOut, 404: Msg, 409: Conflict})
+async def play_turn(request, gid: int, pid: int, data: PlayInput):
+    # Tirage (hit) : carte, main lue et refus éventuel dans une même
+    # transaction, comme play_moves -> version sync. Write-behind : buffer
+    # du process, qui peut charger le joueur -> version sync aussi.
+    if data.hit or writebehind.enabled():
+        return await sync_to_async(sync_api.play_turn)(request, gid, pid, data)
+    expected = _if_match(request)
+    player = Player.objects.filter(pk=pid, game_id=gid)
+    changes = _play_changes(data)
+    p = None
+    if not changes:
+        p = await player.values(*PLAYER_FIELDS).afirst()
+    elif await (player if expected is None else player.filter(version=expected)).aupdate(
+        **changes, version=F("version") + 1
+    ):
+        p = await player.values(*PLAYER_FIELDS).afirst()
+
+    if p is None:
+        if not await Game.objects.filter(pk=gid).aexists():
+            return 404, {"detail": "Game not found"}
+        conflict = await _aversion_conflict(player, expected)
+        return conflict or (404, {"detail": "Player not found or not in this game"})
+
+    changes = _player_aggregates(score=bool(data.add_score), stand=bool(data.stand))
+    if data.add_score:
+        changes["turn"] = F("turn") + 1
+    log = _moves(pid, data)
+    game = await _aupdate_game(gid, moves=len(log), **changes) if changes else None
+    if game is not None and log:
+        await movelog.aappend(game, log)
+
+    _game_changed(gid)
+    events.publish(gid, "players", players=[p])
+    if game is not None:
+        events.publish(gid, "game", game=game)
+    return p
+
+
+@api.delete("/games/{gid}/players/{pid}", response={204: None, 404: Msg, 409: Conflict})
+async def remove_player(request, gid: int, pid: int):
+    expected = _if_match(request)
+    await _awritebehind_sync(gid)
+    player = Player.objects.filter(pk=pid, game_id=gid)
+    deleted, _ = await (player if expected is None else player.filter(version=expected)).adelete()
+    if not deleted:
+        return await _aversion_conflict(player, expected) or (404, {"detail": "Player not found"})
+    game = await _aupdate_game(
+        gid, moves=1, player_count=F("player_count") - 1, **_player_aggregates(score=True, stand=True)
+    )
+    if game is not None:
+        await movelog.aappend(game, [Move(player_id=pid, kind=Move.Kind.LEAVE)])
+    _game_changed(gid)
+    events.publish(gid, "player_removed", player_id=pid)
+    if game is not None:
+        events.publish(gid, "game", game=game)
+    return 204, None
+
+
+@api.get("/games/{gid}/events", response={404: Msg})
+async def game_events(request, gid: int):
+    sub = events.get_broker().subscribe(gid)
+    game = await _aload_game_detail(gid)
+    if game is None:
+        events.get_broker().unsubscribe(sub)
+        return 404, {"detail": "Game not found"}
+    return events.stream_response(sub, game)
+
+
+@api.get("/leaderboard", response=List[RankedPlayer])
+async def leaderboard(request, params: Query[LeaderboardQuery]):
+    return json_response(await _aleaderboard(Player.objects.all(), params.limit))
+
+
+@api.get("/games/{gid}/leaderboard", response={200: List[RankedPlayer], 404: Msg})
+async def game_leaderboard(request, gid: int, params: Query[LeaderboardQuery]):
+    players = await _aleaderboard(Player.objects.filter(game_id=gid), params.limit)
+    if not players and not await Game.objects.filter(pk=gid).aexists():
+        return 404, {"detail": "Game not found"}
+    return json_response(players)
+
+
+@api.get("/games/{gid}/players/{pid}/hint", response={200: HintOut, 404: Msg})
+async def player_hint(request, gid: int, pid: int, params: Query[HintQuery]):
+    row = await Player.objects.filter(pk=pid, game_id=gid).values("cards", "game__shoe", "game__shoe_pos").afirst()
+    if row is None:
+        if not await Game.objects.filter(pk=gid).aexists():
+            return 404, {"detail": "Game not found"}
+        return 404, {"detail": "Player not found or not in this game"}
+    args = (row["cards"], row["game__shoe"], row["game__shoe_pos"], params.dealer, params.simulate)
+    if not params.simulate:
+        return _hint(*args)  # lecture des tables : immédiat
+    # calcul long (jusqu'à BLACKJACK_HINT_TIMEOUT) : hors du thread partagé de sync_to_async
+    return await sync_to_async(_hint, thread_sensitive=False)(*args)
+
+
+@api.get("/games/{gid}/moves", response={200: MovePage, 404: Msg})
+async def list_moves(request, gid: int, page: Query[KeysetPagination.Input]):
+    body = await KeysetPagination().aproject(Move.objects.filter(game_id=gid), MoveOut, page)
+    if not body["items"] and not await Game.objects.filter(pk=gid).aexists():
+        return 404, {"detail": "Game not found"}
+    return json_response(body)
+
+
+@api.get("/games/{gid}/replay", response={200: GameReplay, 404: Msg})
+async def replay_game(request, gid: int, params: Query[ReplayQuery]):
+    state = await sync_to_async(movelog.rebuild)(gid, params.upto)
+    if state is None:
+        return 404, {"detail": "Game not found"}
+    return json_response(state)
+
+
+@api.get("/cache/stats", response=CacheStats)
+async def cache_stats(request):
+    return game_cache.stats()
+
+
+@api.get("/write-behind/stats", response=WriteBehindStats)
+async def write_behind_stats(request):
+    return writebehind.stats()
+
+
+@api.get("/metrics", include_in_schema=False)
+async def metrics_text(request):
+    return HttpResponse(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+
+metrics.instrument(api)
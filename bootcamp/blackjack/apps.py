@@ -3,5 +3,12 @@ from django.apps import AppConfig
 
 class BlackjackConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'blackjack',
-    name = 'api'
+    name = 'blackjack'
+
+    def ready(self):
+        # tables de stratégie ouvertes en mmap dès le démarrage (cf. strategy.py)
+        from . import strategy
+        strategy.get_tables()
+        # nombre et durée des requêtes SQL par requête HTTP (cf. metrics.py)
+        from . import metrics
+        metrics.install()
@@ -0,0 +1,832 @@
+# Micro-benchmarks du projet.
+#
+#   cd bootcamp && python -m blackjack.bench <scenario> [options]
+#
+# Chaque scénario est une fonction enregistrée avec @scenario("nom").
+
+import argparse
+import os
+import time
+from pathlib import Path
+from typing import Callable, Dict
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+SCENARIOS: Dict[str, Callable[[argparse.Namespace], None]] = {}
+
+
+def scenario(name: str):
+    def deco(fn):
+        SCENARIOS[name] = fn
+        return fn
+    return deco
+
+
+def _timeit(fn, repeat: int) -> float:
+    # meilleur temps par appel, en microsecondes
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1e6
+
+
+def _setup_django():
+    # Django + base de test SQLite en mémoire (les scénarios ORM en ont besoin)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "bootcamp.settings")
+    import django
+    from django.db import connection
+
+    django.setup()
+    connection.creation.create_test_db(verbosity=0)
+
+
+# ---------- Store mémoire ----------
+@scenario("game-detail")
+def bench_game_detail(args):
+    from .store import GameStore
+
+    store = GameStore()
+    games = [store.create_game(f"table {i}") for i in range(args.players // args.per_game)]
+    for g in games:
+        for j in range(args.per_game):
+            store.add_player(g["id"], f"p{j}")
+    gid = games[len(games) // 2]["id"]
+
+    def scan():
+        # ancien comportement : parcours de tous les joueurs
+        return [p for p in store.backend.hvals("players") if p["game_id"] == gid]
+
+    def indexed():
+        return store.game_players(gid)
+
+    assert scan() == indexed()
+    print(f"{store.backend.hlen('players')} joueurs, {len(games)} games, {args.per_game} joueurs/game")
+    t_scan = _timeit(scan, args.repeat)
+    t_idx = _timeit(indexed, args.repeat)
+    print(f"  scan PLAYERS : {t_scan:10.1f} µs")
+    print(f"  index game   : {t_idx:10.1f} µs  (x{t_scan / t_idx:.0f})")
+
+
+@scenario("store-backends")
+def bench_store_backends(args):
+    # GameStore sur chaque backend : coup joué, détail d'un game, top-N global
+    # (Redis : serveur local de store_redis, donc le coût du protocole sans le réseau)
+    import tempfile
+    from .store import GameStore, LocalBackend
+    from .store_redis import LocalRedisServer, RedisBackend
+    from .store_shm import SharedMemoryBackend
+
+    n_games = max(1, 2000 // args.per_game)
+    server = LocalRedisServer().start()
+    tmp = tempfile.TemporaryDirectory()
+    backends = (
+        ("dict (process)", LocalBackend()),
+        ("mmap partagé", SharedMemoryBackend(f"{tmp.name}/store", slots=16384, slot_size=512)),
+        ("redis (local)", RedisBackend(port=server.port)),
+    )
+    print(f"{n_games} games, {args.per_game} joueurs/game, top {args.top}")
+    for name, backend in backends:
+        store = GameStore(backend)
+        games = [store.create_game(f"table {i}")["id"] for i in range(n_games)]
+        players = [store.add_player(gid, f"p{j}")["id"] for gid in games for j in range(args.per_game)]
+        gid, pid = games[0], players[0]
+        p50, _ = _percentiles(lambda: store.play(gid, pid, add_score=1), args.repeat * 50)
+        t_detail = _timeit(lambda: store.game_detail(gid), args.repeat)
+        t_top = _timeit(lambda: store.top_players(args.top), args.repeat)
+        print(f"  {name:15s} : play {p50:8.1f} µs   game_detail {t_detail:8.1f} µs   top {t_top:8.1f} µs")
+    server.shutdown()
+    tmp.cleanup()
+
+
+@scenario("engine")
+def bench_engine(args):
+    # valeur de --hands mains (2 à 6 cartes) : boucle Python vs numpy (engine.hand_values)
+    import numpy as np
+    from . import engine
+
+    rng = np.random.default_rng(1)
+    n = args.hands
+    hands = rng.integers(1, 14, size=(n, 6), dtype=np.uint8)
+    hands[np.arange(6) >= rng.integers(2, 7, size=(n, 1))] = 0
+    rows = hands.tolist()
+
+    totals, soft = engine.hand_values(hands)
+    assert [engine.hand_value(r) for r in rows[:1000]] == list(zip(totals[:1000].tolist(), soft[:1000].tolist()))
+    t_py = _timeit(lambda: [engine.hand_value(r) for r in rows], max(1, args.repeat // 10))
+    t_np = _timeit(lambda: engine.hand_values(hands), args.repeat)
+    print(f"{n} mains (mains évaluées / s)")
+    print(f"  hand_value (Python) : {n / t_py * 1e6:14,.0f}")
+    print(f"  hand_values (numpy) : {n / t_np * 1e6:14,.0f}  (x{t_py / t_np:.0f})")
+
+    t_new = _timeit(lambda: engine.Shoe.new(6), args.repeat)
+    shoe = engine.Shoe.new(6).to_bytes()
+    t_load = _timeit(lambda: engine.Shoe.from_bytes(shoe, 10).deal(), args.repeat)
+    print(f"  sabot 6 jeux : mélange {t_new:.1f} µs, relecture + tirage {t_load:.1f} µs")
+
+
+@scenario("hint")
+def bench_hint(args):
+    # odds.hint (16 contre 10, sabot neuf de 6 jeux) : simulation dans le
+    # process, puis sur un pool de --workers process, puis depuis le cache
+    _setup_django()
+    from django.test import override_settings
+    from . import engine, odds
+    from .cache import hint_cache
+
+    counts = engine.Shoe.full_counts(6)
+    n = args.samples
+    t = _timeit(lambda: odds.simulate(16, False, 10, counts, n, 1), max(1, args.repeat // 10))
+    print(f"{n} parties simulées")
+    print(f"  simulate, 1 process   : {n / t * 1e6:12,.0f} parties / s")
+
+    with override_settings(BLACKJACK_HINT_WORKERS=args.workers, BLACKJACK_HINT_SAMPLES=n,
+                           BLACKJACK_HINT_CHUNK=max(1, n // (4 * args.workers)), BLACKJACK_HINT_TIMEOUT=60):
+        def fresh():
+            hint_cache.clear()
+            return odds.hint("T6", 10, counts)
+
+        fresh()  # démarrage du pool
+        t_pool = _timeit(fresh, max(1, args.repeat // 10))
+        t_hit = _timeit(lambda: odds.hint("T6", 10, counts), args.repeat)
+    print(f"  hint, pool {args.workers:2d} process : {n / t_pool * 1e6:12,.0f} parties / s  ({t_pool / 1000:.0f} ms)")
+    print(f"  hint en cache         : {t_hit:12.1f} µs")
+
+
+@scenario("strategy")
+def bench_strategy(args):
+    # décision 16 contre 10 : tables en mmap vs recalcul (DP) vs Monte Carlo
+    _setup_django()
+    from . import engine, odds, strategy
+
+    strategy.get_tables()
+    counts = engine.Shoe.full_counts(6)
+
+    def dp():
+        strategy._dealer.cache_clear()
+        strategy._best_ev.cache_clear()
+        return strategy.build_tables()
+
+    t_lookup = _timeit(lambda: strategy.lookup(16, False, 10), args.repeat * 100)
+    t_dp = _timeit(dp, args.repeat)
+    t_mc = _timeit(lambda: odds.simulate(16, False, 10, counts, args.samples, 1), max(1, args.repeat // 10))
+    print(f"table {strategy.table_path()} ({type(strategy.get_tables()).__name__})")
+    print(f"  lookup (mmap)           : {t_lookup:12.1f} µs")
+    print(f"  tables recalculées (DP) : {t_dp:12.1f} µs  (x{t_dp / t_lookup:.0f})")
+    print(f"  Monte Carlo {args.samples:>9,}   : {t_mc:12.1f} µs  (x{t_mc / t_lookup:.0f})")
+
+
+# ---------- ORM ----------
+@scenario("paginate")
+def bench_paginate(args):
+    _setup_django()
+    from ninja.testing import TestClient
+    from .api import api
+    from .models import Game
+
+    Game.objects.bulk_create(Game(name=f"table {i}") for i in range(args.rows))
+    client = TestClient(api)
+
+    def fetch(cursor):
+        params = {"limit": args.limit}
+        if cursor:
+            params["cursor"] = cursor
+        return client.get("/games", query_params=params).json()
+
+    # curseurs de quelques pages, du début à la fin de la table
+    cursors, cursor, page = {}, None, 0
+    last_page = args.rows // args.limit - 1
+    while True:
+        if page in (0, 10, 100, 1000, last_page):
+            cursors[page] = cursor
+        cursor, page = fetch(cursor)["next"], page + 1
+        if cursor is None:
+            break
+
+    print(f"{args.rows} games, pages de {args.limit}")
+    for page, cursor in cursors.items():
+        t = _timeit(lambda: fetch(cursor), args.repeat)
+        print(f"  page {page:6d} : {t:10.1f} µs")
+
+
+@scenario("serialize")
+def bench_serialize(args):
+    # listes de --list-size lignes : instances + validation pydantic (ancien
+    # chemin @paginate / from_orm) vs projection values_list (projection.py)
+    _setup_django()
+    from django.utils import timezone
+    from .models import Game, Player, Student
+    from .projection import json_response, project
+    from .schemas import GameListItem, GamePage, PlayerOut, StudentOut, StudentPage
+
+    n = args.list_size
+    Game.objects.bulk_create(Game(name=f"table {i}", turn=i % 7) for i in range(n))
+    game = Game.objects.first()
+    Player.objects.bulk_create(Player(game=game, name=f"p{i}", score=i % 21) for i in range(n))
+    now = timezone.now()
+    Student.objects.bulk_create(Student(name=f"s{i}", email=f"s{i}@x.io", created_at=now) for i in range(n))
+
+    cases = (
+        ("games", Game.objects.order_by("id"), GameListItem,
+         lambda qs: json_response(GamePage.model_validate({"items": list(qs)}).model_dump())),
+        ("students", Student.objects.order_by("id"), StudentOut,
+         lambda qs: json_response(StudentPage.model_validate({"items": list(qs)}).model_dump())),
+        ("players", Player.objects.filter(game=game).order_by("id"), PlayerOut,
+         lambda qs: json_response([PlayerOut.from_orm(p).model_dump() for p in qs])),
+    )
+    print(f"listes de {n} lignes (lignes sérialisées / s)")
+    for name, qs, schema, legacy in cases:
+        t_old = _timeit(lambda: legacy(qs.all()), args.repeat)
+        t_new = _timeit(lambda: json_response(project(qs.all(), schema)), args.repeat)
+        print(f"  {name:9s} modèles + pydantic : {n / t_old * 1e6:10.0f}   "
+              f"projection : {n / t_new * 1e6:10.0f}  (x{t_old / t_new:.1f})")
+
+
+@scenario("render")
+def bench_render(args):
+    # encodage JSON des plus grosses réponses (listes de --list-size lignes,
+    # détail d'un game à --list-size joueurs) : temps et taille par renderer
+    _setup_django()
+    from django.utils import timezone
+    from .api import _load_game_detail
+    from .models import Game, Player, Student
+    from .projection import project
+    from .renderers import FastJSONRenderer, StdlibJSONRenderer, orjson
+    from .schemas import GameListItem, StudentOut
+
+    n = args.list_size
+    Game.objects.bulk_create(Game(name=f"table {i}", turn=i % 7) for i in range(n))
+    game = Game.objects.first()
+    Player.objects.bulk_create(Player(game=game, name=f"p{i}", score=i % 21) for i in range(n))
+    now = timezone.now()
+    Student.objects.bulk_create(Student(name=f"s{i}", email=f"s{i}@x.io", created_at=now) for i in range(n))
+
+    payloads = (
+        ("GET /games", {"items": project(Game.objects.order_by("id"), GameListItem), "next": None}),
+        ("GET /students", {"items": project(Student.objects.order_by("id"), StudentOut), "next": None}),
+        ("GET /games/{gid}", _load_game_detail(game.id)),
+    )
+    renderers = [("stdlib json", StdlibJSONRenderer())]
+    if orjson is not None:
+        renderers.append(("orjson", FastJSONRenderer()))
+    else:
+        print("orjson absent : FastJSONRenderer retombe sur la stdlib")
+
+    print(f"{n} lignes par réponse")
+    for name, data in payloads:
+        print(f"  {name}")
+        base = None
+        for label, renderer in renderers:
+            t = _timeit(lambda: renderer.dumps(data), args.repeat)
+            size = len(renderer.dumps(data))
+            base = base or t
+            print(f"    {label:12s} : {t / 1000:8.2f} ms  {size / 1024:8.1f} Kio  (x{base / t:.1f})")
+
+
+def _percentiles(fn, n: int):
+    samples = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1e6)
+    samples.sort()
+    return samples[n // 2], samples[int(n * 0.99)]
+
+
+@scenario("play")
+def bench_play(args):
+    # coup add_score, les deux versions faisant le même travail : joueur
+    # (score, version), game (tour, meilleur score, version, move_count) et
+    # journal, dans une transaction
+    _setup_django()
+    from django.db import connection, transaction
+    from django.db.models import Max
+    from django.test.utils import CaptureQueriesContext
+    from .api import play_turn
+    from .models import Game, Move, Player
+    from .schemas import PlayInput
+
+    game = Game.objects.create(name="table")
+    player = Player.objects.create(game=game, name="p")
+    Player.objects.bulk_create(Player(game=game, name=f"p{i}", score=i) for i in range(6))
+    move = PlayInput(add_score=3)
+
+    def legacy():
+        # lecture + save() : SELECT game et joueur, save() des deux, meilleur
+        # score relu, journal
+        with transaction.atomic():
+            g = Game.objects.select_for_update().get(pk=game.id)
+            p = Player.objects.get(pk=player.id, game=g)
+            p.score = max(0, p.score + int(move.add_score))
+            p.version += 1
+            p.save(update_fields=["score", "version"])
+            g.top_score = Player.objects.filter(game=g).aggregate(m=Max("score"))["m"]
+            g.turn += 1
+            g.version += 1
+            g.move_count += 1
+            g.save(update_fields=["turn", "top_score", "version", "move_count"])
+            Move.objects.create(game=g, player_id=p.id, kind=Move.Kind.SCORE, value=int(move.add_score))
+        return p
+
+    def atomic():
+        return play_turn(None, game.id, player.id, move)
+
+    sides = (("lecture + save()", legacy), ("UPDATE atomiques", atomic))
+    queries = {}
+    for name, fn in sides:
+        # avant les mesures : le journal des requêtes (DEBUG) est borné
+        with CaptureQueriesContext(connection) as ctx:
+            fn()
+        queries[name] = len(ctx.captured_queries)
+    print(f"play_turn, {args.repeat * 100} coups")
+    for name, fn in sides:
+        p50, p99 = _percentiles(fn, args.repeat * 100)
+        print(f"  {name:18s} : {queries[name]} requêtes   p50 {p50:8.1f} µs   p99 {p99:8.1f} µs")
+
+
+@scenario("write-behind")
+def bench_write_behind(args):
+    # play_turn (add_score) : UPDATE par coup vs write-behind (copie mémoire + flush groupé)
+    _setup_django()
+    from django.test import override_settings
+    from . import writebehind
+    from .api import play_turn
+    from .models import Game, Player
+    from .schemas import PlayInput
+
+    games = Game.objects.bulk_create(Game(name=f"table {i}") for i in range(args.per_game))
+    players = Player.objects.bulk_create(Player(game=g, name=f"p{j}") for g in games for j in range(7))
+    move = PlayInput(add_score=1)
+    n = args.repeat * 100
+    moves = [(players[i % len(players)].game_id, players[i % len(players)].id) for i in range(n)]
+    print(f"play_turn, {n} coups sur {len(players)} joueurs")
+
+    for name, enabled in (("UPDATE par coup", False), ("write-behind", True)):
+        with override_settings(BLACKJACK_WRITE_BEHIND=enabled, BLACKJACK_WRITE_BEHIND_INTERVAL=0,
+                               BLACKJACK_WRITE_BEHIND_JOURNAL=None, BLACKJACK_WRITE_BEHIND_MAX_PENDING=10**9):
+            writebehind._buffer = None
+            it = iter(moves)
+            p50, p99 = _percentiles(lambda: play_turn(None, *next(it), move), n)
+            print(f"  {name:16s} : p50 {p50:8.1f} µs   p99 {p99:8.1f} µs")
+            if enabled:
+                t0 = time.perf_counter()
+                rows = writebehind.get_buffer().flush()
+                print(f"  flush            : {rows} joueurs en {(time.perf_counter() - t0) * 1000:.1f} ms")
+
+
+@scenario("replay")
+def bench_replay(args):
+    # état d'un game de --events coups : relecture complète du journal vs
+    # dernier snapshot + fin du journal (movelog.rebuild)
+    _setup_django()
+    from . import movelog
+    from .models import Game, GameSnapshot, Move
+
+    every = movelog.snapshot_every()
+    game = Game.objects.create(name="table")
+    seats = 7
+    t0 = time.perf_counter()
+    Move.objects.bulk_create((Move(game=game, player_id=j + 1, kind=Move.Kind.JOIN, name=f"p{j}")
+                              for j in range(seats)))
+    Move.objects.bulk_create((Move(game=game, player_id=i % seats + 1, kind=Move.Kind.SCORE, value=i % 11 - 3)
+                              for i in range(args.events - seats)), batch_size=10_000)
+    ids = list(Move.objects.filter(game=game).order_by("id").values_list("id", flat=True))
+    # snapshots tels que les écrit l'API, un tous les `every` coups (les derniers
+    # suffisent) ; pire cas : le dernier coup n'est pas encore dans un snapshot
+    for n in range((len(ids) - 1) // every * every, 0, -every)[:3][::-1]:
+        GameSnapshot.objects.create(game=game, last_move=ids[n - 1], state=movelog.load(game.id, ids[n - 1])[0])
+    Game.objects.filter(pk=game.id).update(move_count=len(ids))
+    print(f"{len(ids)} coups insérés en {time.perf_counter() - t0:.1f} s, snapshot tous les {every} coups")
+
+    def full():
+        rows = Move.objects.filter(game=game).order_by("id").values_list(*movelog.REPLAY_FIELDS)
+        return movelog.apply(movelog.empty_state(), rows.iterator(chunk_size=10_000))
+
+    def snapshot():
+        return movelog.rebuild(game.id)
+
+    state = full()
+    assert [p["score"] for p in snapshot()["players"]] == [p["score"] for p in state["players"].values()]
+    tail = len(ids) - (len(ids) - 1) // every * every
+    for name, fn, replayed, repeat in (("relecture complète", full, len(ids), 1),
+                                       ("snapshot + fin", snapshot, tail, args.repeat)):
+        us = _timeit(fn, repeat)
+        print(f"  {name:18s} : {us / 1000:10.2f} ms   {replayed:8d} coups rejoués   "
+              f"{replayed / us * 1e6:10,.0f} coups/s")
+
+
+@scenario("leaderboard")
+def bench_leaderboard(args):
+    # top-N global sur --players joueurs (ex. --players 10000000) :
+    # ORM (index player_score_idx) et ScoreIndex du store mémoire,
+    # comparés à un tri / parcours de tous les joueurs
+    import heapq
+    import random
+    from .store import ScoreIndex
+
+    n, top = args.players, args.top
+    rng = random.Random(1)
+    scores = [rng.randrange(10_000) for _ in range(n)]
+
+    # store mémoire : l'index seul (10M dicts joueur ne tiennent pas en RAM ici)
+    keys = [(-s, pid) for pid, s in enumerate(scores, 1)]
+    t0 = time.perf_counter()
+    index = ScoreIndex(keys)
+    build = time.perf_counter() - t0
+    assert index.first(top) == heapq.nsmallest(top, keys)
+    print(f"{n} joueurs, top {top}")
+    print(f"  mémoire  construction index : {build * 1000:10.1f} ms")
+    t_scan = _timeit(lambda: heapq.nsmallest(top, keys), max(1, args.repeat // 10))
+    t_idx = _timeit(lambda: index.first(top), args.repeat)
+    print(f"  mémoire  parcours (heapq)   : {t_scan / 1000:10.2f} ms")
+    print(f"  mémoire  ScoreIndex.first   : {t_idx / 1000:10.3f} ms  (x{t_scan / t_idx:.0f})")
+    moves = [(keys[rng.randrange(n)], rng.randrange(10_000)) for _ in range(10_000)]
+    t0 = time.perf_counter()
+    for old, s in moves:
+        index.replace(old, (-s, old[1]))
+    print(f"  mémoire  changements score  : {len(moves) / (time.perf_counter() - t0):10.0f} /s")
+    del keys, index, moves
+
+    _setup_django()
+    from django.db import connection
+    from django.db.models import F
+    from ninja.testing import TestClient
+    from .api import api
+    from .models import Game, Player
+
+    games = max(1, n // args.per_game)
+    Game.objects.bulk_create(Game(name=f"table {i}") for i in range(games))
+    table = connection.ops.quote_name(Player._meta.db_table)
+    t0 = time.perf_counter()
+    with connection.cursor() as cursor:
+        # executemany plutôt que bulk_create : 10M instances de modèle coûtent trop cher
+        cursor.executemany(
+            # toutes les colonnes NOT NULL : les défauts du modèle ne sont pas en base
+            f"INSERT INTO {table} (game_id, name, score, stand, cards, version) VALUES (%s, %s, %s, %s, %s, %s)",
+            ((i % games + 1, f"p{i}", s, False, "", 1) for i, s in enumerate(scores)),
+        )
+    print(f"  ORM      insertion          : {time.perf_counter() - t0:10.1f} s")
+    del scores
+
+    client = TestClient(api)
+    # score + 0 : même tri, mais l'index n'est plus utilisable (parcours + TEMP B-TREE)
+    unindexed = Player.objects.annotate(s=F("score") + 0).order_by("-s", "id").values_list("score", "id")
+    t_full = _timeit(lambda: list(unindexed[:top]), max(1, args.repeat // 10))
+    t_qs = _timeit(lambda: list(Player.objects.order_by("-score", "id").values_list("score", "id")[:top]),
+                   args.repeat)
+    t_api = _timeit(lambda: client.get("/leaderboard", query_params={"limit": top}), args.repeat)
+    print(f"  ORM      tri sans index     : {t_full / 1000:10.2f} ms")
+    print(f"  ORM      SELECT top-N       : {t_qs / 1000:10.2f} ms  (x{t_full / t_qs:.0f})")
+    print(f"  ORM      GET /leaderboard   : {t_api / 1000:10.2f} ms")
+
+
+# ---------- Profils de base (settings.DB_PROFILE) ----------
+def _db_worker(env, role, n, barrier, queue):
+    # process séparé : une connexion SQLite par worker, comme des workers gunicorn
+    os.environ.update(env)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "bootcamp.settings")
+    import django
+
+    django.setup()
+    from django.db import OperationalError, close_old_connections
+    from .api import _load_game_detail, play_moves, play_turn
+    from .models import Game, Player
+    from .schemas import MoveIn, PlayInput
+
+    if role == "seed":
+        game = Game.objects.create(name="table")
+        players = Player.objects.bulk_create(Player(game=game, name=f"p{i}") for i in range(8))
+        queue.put((game.id, [p.id for p in players]))
+        return
+    gid, pids = role[1], role[2]
+    samples, errors = [], 0
+    barrier.wait()
+    if role[0] == "cas":
+        _cas_loop(gid, pids[0], n, samples, queue)
+        return
+    for i in range(n):
+        t0 = time.perf_counter()
+        try:
+            if role[0] == "read":
+                _load_game_detail(gid)
+            elif i % 2:
+                play_turn(None, gid, pids[i % len(pids)], PlayInput(add_score=1))
+            else:
+                # lot de coups en transaction (/moves)
+                play_moves(None, gid, [MoveIn(player_id=pid, add_score=1) for pid in pids[:2]])
+        except OperationalError:  # database is locked
+            errors += 1
+        samples.append((time.perf_counter() - t0) * 1e6)
+        close_old_connections()  # fin de « requête » : ferme la connexion si CONN_MAX_AGE=0
+    queue.put((role[0], samples, errors))
+
+
+def _cas_loop(gid, pid, n, samples, queue):
+    # client optimiste : lit la version, joue avec If-Match, relit et rejoue sur 409
+    from django.db import OperationalError, close_old_connections
+    from django.test import RequestFactory
+    from .api import play_turn
+    from .models import Player
+    from .schemas import PlayInput
+
+    factory, move = RequestFactory(), PlayInput(add_score=1)
+    played = conflicts = errors = 0
+    for _ in range(n):
+        t0 = time.perf_counter()
+        while True:
+            try:
+                version = Player.objects.filter(pk=pid).values_list("version", flat=True).get()
+                response = play_turn(factory.post("/", headers={"If-Match": f'"{version}"'}), gid, pid, move)
+            except OperationalError:  # database is locked
+                errors += 1
+                break
+            finally:
+                close_old_connections()
+            if isinstance(response, tuple) and response[0] == 409:
+                conflicts += 1
+                continue
+            played += 1
+            break
+        samples.append((time.perf_counter() - t0) * 1e6)
+    queue.put(("cas", samples, errors, conflicts, played))
+
+
+@scenario("db-contention")
+def bench_db_contention(args):
+    # --workers process en parallèle (moitié lecteurs, moitié écrivains) sur un
+    # fichier SQLite, profil dev (défaut Django) vs sqlite (WAL, pragmas...)
+    import multiprocessing
+    import subprocess
+    import sys
+    import tempfile
+
+    ctx = multiprocessing.get_context("spawn")
+    n = args.requests // args.workers
+    print(f"{args.workers} workers, {n} requêtes chacun")
+    for profile in ("dev", "sqlite"):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {"DB_PROFILE": profile, "SQLITE_PATH": os.path.join(tmp, "bench.sqlite3")}
+            subprocess.run([sys.executable, "manage.py", "migrate", "-v", "0"], cwd=PROJECT_DIR,
+                           env=dict(os.environ, **env), check=True)
+            queue = ctx.Queue()
+            seed = ctx.Process(target=_db_worker, args=(env, "seed", 0, None, queue))
+            seed.start()
+            gid, pids = queue.get()
+            seed.join()
+
+            barrier = ctx.Barrier(args.workers + 1)
+            workers = [
+                ctx.Process(target=_db_worker,
+                            args=(env, ("read" if i % 2 else "write", gid, pids), n, barrier, queue))
+                for i in range(args.workers)
+            ]
+            for w in workers:
+                w.start()
+            barrier.wait()
+            t0 = time.perf_counter()
+            results = [queue.get() for _ in workers]
+            elapsed = time.perf_counter() - t0
+            for w in workers:
+                w.join()
+
+            print(f"  {profile} :")
+            for role in ("write", "read"):
+                samples = sorted(x for r, s, _ in results if r == role for x in s)
+                errors = sum(e for r, _, e in results if r == role)
+                print(f"    {role:5s} : {len(samples) / elapsed:8.0f} req/s   "
+                      f"p99 {samples[int(len(samples) * 0.99)] / 1000:8.1f} ms   {errors} « database is locked »")
+
+
+@scenario("optimistic")
+def bench_optimistic(args):
+    # If-Match (compare-and-swap) : coût d'un coup conditionnel et d'un 409, puis
+    # --workers process qui jouent tous le même joueur (relecture + nouvel essai sur 409)
+    import multiprocessing
+    import sqlite3
+    import subprocess
+    import sys
+    import tempfile
+
+    _setup_django()
+    from django.test import RequestFactory
+    from .api import play_turn
+    from .models import Game, Player
+    from .schemas import PlayInput
+
+    game = Game.objects.create(name="table")
+    player = Player.objects.create(game=game, name="p")
+    factory, move = RequestFactory(), PlayInput(add_score=1)
+    plain = factory.post("/")
+    stale = factory.post("/", headers={"If-Match": '"0"'})
+
+    def matching():
+        version = Player.objects.filter(pk=player.id).values_list("version", flat=True).get()
+        return play_turn(factory.post("/", headers={"If-Match": f'"{version}"'}), game.id, player.id, move)
+
+    n = args.repeat * 100
+    print(f"play_turn, {n} coups")
+    for name, fn in (("sans If-Match", lambda: play_turn(plain, game.id, player.id, move)),
+                     ("lecture + If-Match", matching),
+                     ("If-Match périmé (409)", lambda: play_turn(stale, game.id, player.id, move))):
+        p50, p99 = _percentiles(fn, n)
+        print(f"  {name:22s} : p50 {p50:8.1f} µs   p99 {p99:8.1f} µs")
+
+    ctx = multiprocessing.get_context("spawn")
+    per_worker = args.requests // args.workers
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {"DB_PROFILE": "sqlite", "SQLITE_PATH": os.path.join(tmp, "bench.sqlite3")}
+        subprocess.run([sys.executable, "manage.py", "migrate", "-v", "0"], cwd=PROJECT_DIR,
+                       env=dict(os.environ, **env), check=True)
+        queue = ctx.Queue()
+        seed = ctx.Process(target=_db_worker, args=(env, "seed", 0, None, queue))
+        seed.start()
+        gid, pids = queue.get()
+        seed.join()
+        barrier = ctx.Barrier(args.workers + 1)
+        workers = [ctx.Process(target=_db_worker, args=(env, ("cas", gid, pids), per_worker, barrier, queue))
+                   for _ in range(args.workers)]
+        for w in workers:
+            w.start()
+        barrier.wait()
+        t0 = time.perf_counter()
+        results = [queue.get() for _ in workers]
+        elapsed = time.perf_counter() - t0
+        for w in workers:
+            w.join()
+        samples = sorted(x for _, s, _, _, _ in results for x in s)
+        played = sum(r[4] for r in results)
+        conflicts = sum(r[3] for r in results)
+        errors = sum(r[2] for r in results)
+        print(f"{args.workers} workers sur un même joueur, {per_worker} coups chacun (profil sqlite) :")
+        print(f"  {played / elapsed:8.0f} coups/s   p99 {samples[int(len(samples) * 0.99)] / 1000:8.1f} ms   "
+              f"{conflicts} 409 rejoués   {errors} « database is locked »")
+        with sqlite3.connect(env["SQLITE_PATH"]) as db:
+            score, = db.execute("SELECT score FROM blackjack_player WHERE id = ?", (pids[0],)).fetchone()
+        lost = f"{played - score} coups perdus" if score != played else "aucun coup perdu"
+        print(f"  score final {score} pour {played} coups joués : {lost}")
+
+
+@scenario("metrics")
+def bench_metrics(args):
+    # coût de l'instrumentation (metrics.py) : middleware seul, par requête SQL,
+    # puis requête complète avec / sans MetricsMiddleware
+    _setup_django()
+    from django.conf import settings
+    from django.db import connection
+    from django.http import HttpResponse
+    from django.test import Client, RequestFactory, override_settings
+    from django.urls import resolve
+    from . import metrics
+    from .models import Game, Player
+
+    n = args.repeat * 1000
+    request = RequestFactory().get("/api/games/1/players/2/play")
+    request.resolver_match = resolve(request.path)
+    response = HttpResponse()
+    middleware = metrics.MetricsMiddleware(lambda r: response)
+
+    def loop(fn):
+        return lambda: [fn(request) for _ in range(n)]
+
+    bare = _timeit(loop(lambda r: response), 5) / n
+    wrapped = _timeit(loop(middleware), 5) / n
+    print(f"middleware        : {wrapped - bare:6.2f} µs par requête")
+
+    cursor = connection.cursor()
+
+    def queries():
+        for _ in range(n):
+            cursor.execute("SELECT 1")
+
+    connection.execute_wrappers.remove(metrics._wrap_queries)
+    plain = _timeit(queries, 5) / n
+    connection.execute_wrappers.append(metrics._wrap_queries)
+    token = metrics._current.set(metrics.RequestStats())
+    timed = _timeit(queries, 5) / n
+    metrics._current.reset(token)
+    print(f"requête SQL       : {timed - plain:6.2f} µs par requête SQL")
+
+    game = Game.objects.create(name="table")
+    Player.objects.bulk_create(Player(game=game, name=f"p{i}") for i in range(7))
+    client, url = Client(), f"/api/games/{game.id}/players"
+    others = [m for m in settings.MIDDLEWARE if m != "blackjack.metrics.MetricsMiddleware"]
+    for name, middlewares in (("sans métriques", others), ("avec métriques", settings.MIDDLEWARE)):
+        with override_settings(MIDDLEWARE=middlewares, ALLOWED_HOSTS=["testserver"]):
+            p50, p99 = _percentiles(lambda: client.post(url, {"name": "x"}, content_type="application/json"),
+                                    args.repeat * 50)
+        print(f"POST {url} {name:15s} : p50 {p50:8.1f} µs   p99 {p99:8.1f} µs")
+
+
+# ---------- Serveur ASGI ----------
+def _wait_port(port: int, timeout: float = 15.0):
+    import socket
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"serveur absent sur le port {port}")
+
+
+def _http_load(port: int, method: str, path: str, concurrency: int, total: int, body: bytes = None):
+    # `concurrency` clients (1 connexion keep-alive chacun) ; renvoie (req/s, p99 µs)
+    import http.client
+    from concurrent.futures import ThreadPoolExecutor
+
+    headers = {"Content-Type": "application/json"} if body is not None else {}
+
+    def client(n):
+        conn = http.client.HTTPConnection("127.0.0.1", port)
+        samples = []
+        for _ in range(n):
+            t0 = time.perf_counter()
+            conn.request(method, path, body, headers)
+            conn.getresponse().read()
+            samples.append((time.perf_counter() - t0) * 1e6)
+        conn.close()
+        return samples
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        samples = sorted(x for part in pool.map(client, [total // concurrency] * concurrency) for x in part)
+    elapsed = time.perf_counter() - t0
+    return len(samples) / elapsed, samples[int(len(samples) * 0.99)]
+
+
+@scenario("asgi")
+def bench_asgi(args):
+    # GET /api/games/{gid} et POST .../play (add_score) sous uvicorn :
+    # handlers sync (thread pool) vs async
+    import json
+    import subprocess
+    import sys
+    import tempfile
+    import urllib.request
+
+    try:
+        import uvicorn  # noqa: F401
+    except ImportError:
+        print("uvicorn requis : pip install uvicorn")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, SQLITE_PATH=os.path.join(tmp, "bench.sqlite3"))
+        subprocess.run([sys.executable, "manage.py", "migrate", "-v", "0"], cwd=PROJECT_DIR, env=env, check=True)
+        for mode in ("sync", "async"):
+            server = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "bootcamp.asgi:application",
+                 "--port", str(args.port), "--log-level", "warning"],
+                cwd=PROJECT_DIR, env=dict(env, BLACKJACK_API_MODE=mode),
+            )
+            try:
+                _wait_port(args.port)
+                base = f"http://127.0.0.1:{args.port}/api"
+
+
+                def post(path, body):
+                    req = urllib.request.Request(f"{base}{path}", data=json.dumps(body).encode(),
+                                                 headers={"Content-Type": "application/json"})
+                    return json.load(urllib.request.urlopen(req))
+
+                gid = post("/games", {"name": "t"})["id"]
+                pid = post(f"/games/{gid}/players", {"name": "p"})["id"]
+                routes = (
+                    ("GET /games/{gid}", "GET", f"/api/games/{gid}", None),
+                    ("POST .../play", "POST", f"/api/games/{gid}/players/{pid}/play", b'{"add_score": 1}'),
+                )
+                print(f"{mode} :")
+                for label, method, path, body in routes:
+                    for c in (1, 8, 32, 64):
+                        rps, p99 = _http_load(args.port, method, path, c, args.requests, body)
+                        print(f"  {label:17s} {c:3d} clients : {rps:8.0f} req/s   p99 {p99 / 1000:8.1f} ms")
+            finally:
+                server.terminate()
+                server.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m blackjack.bench")
+    parser.add_argument("scenario", choices=sorted(SCENARIOS))
+    parser.add_argument("--players", type=int, default=100_000)
+    parser.add_argument("--per-game", type=int, default=10)
+    parser.add_argument("--top", type=int, default=100)
+    parser.add_argument("--hands", type=int, default=1_000_000)
+    parser.add_argument("--samples", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--list-size", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args(argv)
+    SCENARIOS[args.scenario](args)
+
+
+if __name__ == "__main__":
+    main()
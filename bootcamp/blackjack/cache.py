@@ -0,0 +1,185 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+
+
+class GameDetailCache:
+    # Cache LRU + TTL des détails de game (payload GameOut), par game id.
+    #
+    # Chaque game a un numéro de version, changé par chaque mutation
+    # (invalidate / update). Un lecteur note la version AVANT de charger depuis
+    # la base et set() refuse d'écrire si elle a changé entre-temps : une
+    # lecture lente ne peut pas réinsérer un état périmé.
+    #
+    # Les versions viennent d'une horloge commune à tous les games et sont
+    # gardées pour les `maxsize` games les plus récemment utilisés (LRU, comme
+    # les entrées). Un game sorti du LRU prend la version plancher (_floor) :
+    # l'horloge au moment de la dernière éviction, jamais inférieure à une
+    # version déjà donnée à ce game. Une version (donc un ETag, cf.
+    # conditional.game_etag) ne désigne jamais deux états d'un même game.
+    #
+    # Le cache est local au process : avec plusieurs workers, le TTL borne
+    # la durée pendant laquelle un autre worker peut servir un état ancien.
+
+    def __init__(self, maxsize: int = 10_000, ttl: float = 30.0) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, tuple[int, float, Dict[str, Any]]]" = OrderedDict()
+        self._versions: "OrderedDict[int, int]" = OrderedDict()
+        self._clock = 0
+        self._floor = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def version(self, gid: int) -> int:
+        return self._versions.get(gid, self._floor)
+
+    def get(self, gid: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(gid)
+            if entry is None:
+                self.misses += 1
+                return None
+            version, expires, payload = entry
+            if expires < time.monotonic() or version != self._versions.get(gid, self._floor):
+                del self._entries[gid]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(gid)
+            if gid in self._versions:
+                self._versions.move_to_end(gid)
+            self.hits += 1
+            return payload
+
+    def set(self, gid: int, version: int, payload: Dict[str, Any]) -> bool:
+        with self._lock:
+            if version != self._versions.get(gid, self._floor):
+                return False
+            self._set_version(gid, version)
+            self._store(gid, version, payload)
+            return True
+
+    def update(self, gid: int, payload: Dict[str, Any]) -> None:
+        # mutation qui connaît déjà le nouvel état (start / end)
+        with self._lock:
+            version = self._tick(gid)
+            self._store(gid, version, payload)
+
+    def invalidate(self, gid: int) -> None:
+        with self._lock:
+            self._tick(gid)
+            self._entries.pop(gid, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+            self._clock = self._floor = 0
+            self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _tick(self, gid: int) -> int:
+        self._clock += 1
+        self._set_version(gid, self._clock)
+        return self._clock
+
+    def _set_version(self, gid: int, version: int) -> None:
+        self._versions[gid] = version
+        self._versions.move_to_end(gid)
+        while len(self._versions) > self.maxsize:
+            self._versions.popitem(last=False)
+            self._floor = self._clock
+
+    def _store(self, gid: int, version: int, payload: Dict[str, Any]) -> None:
+        self._entries[gid] = (version, time.monotonic() + self.ttl, payload)
+        self._entries.move_to_end(gid)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+class VersionCounter:
+    # Versions des collections ("games", "students"), incrémentées à chaque
+    # mutation qui change une liste ; servent aux ETag des endpoints de liste.
+
+    def __init__(self) -> None:
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> int:
+        return self._versions.get(name, 0)
+
+    def bump(self, name: str) -> int:
+        with self._lock:
+            self._versions[name] = self._versions.get(name, 0) + 1
+            return self._versions[name]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._versions.clear()
+
+
+class MemoCache:
+    # LRU simple (sans TTL ni version) pour des résultats purs, recalculables
+    # à l'identique depuis leur clé : conseils de odds.hint.
+
+    def __init__(self, maxsize: int = 10_000) -> None:
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Any, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Any) -> Optional[Any]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Any, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+collection_versions = VersionCounter()
+
+game_cache = GameDetailCache(
+    maxsize=getattr(settings, "BLACKJACK_GAME_CACHE_SIZE", 10_000),
+    ttl=getattr(settings, "BLACKJACK_GAME_CACHE_TTL", 30.0),
+)
+
+hint_cache = MemoCache(maxsize=getattr(settings, "BLACKJACK_HINT_CACHE_SIZE", 10_000))
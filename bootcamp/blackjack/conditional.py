@@ -0,0 +1,38 @@
+import secrets
+import time
+
+from django.conf import settings
+from django.views.decorators.http import condition
+from ninja.decorators import decorate_view
+
+from .cache import collection_versions, game_cache
+
+# ETag forts pour les GET de games / students : un If-None-Match qui correspond
+# renvoie 304 avant que le handler ne tourne (ni requête SQL, ni sérialisation).
+#
+# Le tag = époque du process + fenêtre de temps + version. Les versions sont
+# locales au process : l'époque évite qu'un autre worker valide un tag qu'il
+# n'a pas produit, et la fenêtre (TTL du cache) borne la durée pendant laquelle
+# une mutation faite sur un autre worker peut passer inaperçue.
+_EPOCH = secrets.token_hex(4)
+
+
+def _tag(*parts) -> str:
+    window = int(time.time() // getattr(settings, "BLACKJACK_GAME_CACHE_TTL", 30.0))
+    return "-".join(str(p) for p in (_EPOCH, window, *parts))
+
+
+def game_etag(request, gid, **kwargs) -> str:
+    gid = int(gid)
+    return _tag("game", gid, game_cache.version(gid))
+
+
+def collection_etag(name: str):
+    def etag(request, *args, **kwargs) -> str:
+        return _tag(name, collection_versions.get(name))
+    return etag
+
+
+def conditional(etag_func):
+    # @api.get(...) puis @conditional(...) : appliqué autour de la vue ninja complète
+    return decorate_view(condition(etag_func=etag_func))
@@ -0,0 +1,101 @@
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Moteur de cartes : sabot multi-jeux et valeur des mains.
+#
+# Une carte = un octet, le code de son rang (1 = as ... 13 = roi, 0 = pas de
+# carte) ; la couleur ne compte pas au blackjack. Les mains des joueurs sont
+# stockées en texte (Player.cards), un caractère de RANKS par carte.
+
+RANKS = "A23456789TJQK"
+# valeur par code (0 = case vide d'une main de la matrice de hand_values)
+VALUES = (0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10)
+_CODES = {r: i for i, r in enumerate(RANKS, 1)}
+
+
+def parse_cards(cards: str) -> List[int]:
+    return [_CODES[c] for c in cards]
+
+
+def format_cards(codes: Iterable[int]) -> str:
+    return "".join(RANKS[c - 1] for c in codes)
+
+
+def hand_value(codes: Iterable[int]) -> Tuple[int, bool]:
+    # (total, soft) d'une main : un seul as peut compter 11, et seulement
+    # si la main ne dépasse pas 21 (main "soft")
+    total, ace = 0, False
+    for c in codes:
+        total += VALUES[c]
+        ace = ace or c == 1
+    soft = ace and total <= 11
+    return total + 10 * soft, soft
+
+
+_VALUES = np.array(VALUES, dtype=np.uint8)
+
+
+def hand_values(hands) -> Tuple[np.ndarray, np.ndarray]:
+    # hand_value pour n mains à la fois : matrice (n, k) de codes, complétée
+    # par des 0. Renvoie (totaux int16, soft bool), sans boucle Python.
+    hands = np.asarray(hands, dtype=np.uint8)
+    hard = _VALUES[hands].sum(axis=1, dtype=np.int16)
+    soft = (hands == 1).any(axis=1) & (hard <= 11)
+    return hard + 10 * soft, soft
+
+
+class Shoe:
+    # Sabot de `decks` jeux, mélangé une fois puis lu dans l'ordre :
+    # distribuer = avancer `pos`. Stocké tel quel en base (Game.shoe, un octet
+    # par carte) ; tableau numpy uint8.
+    # Au-delà de la carte de coupe (`penetration`), needs_shuffle() demande un
+    # nouveau sabot, comme au casino (on ne distribue pas le fond du sabot).
+
+    penetration = 0.75
+
+    def __init__(self, cards, pos: int = 0) -> None:
+        self.cards = cards
+        self.pos = pos
+
+    @classmethod
+    def new(cls, decks: int = 6, seed: Optional[int] = None) -> "Shoe":
+        cards = np.tile(np.arange(1, 14, dtype=np.uint8), 4 * decks)
+        np.random.default_rng(seed).shuffle(cards)
+        return cls(cards)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, pos: int = 0) -> "Shoe":
+        # lecture seule, sans copie : un sabot ne fait que se lire
+        cards = np.frombuffer(data, dtype=np.uint8)
+        return cls(cards, pos)
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.cards)
+
+    def __len__(self) -> int:
+        # cartes restantes
+        return len(self.cards) - self.pos
+
+    @property
+    def cut(self) -> int:
+        return int(len(self.cards) * self.penetration)
+
+    def needs_shuffle(self, n: int = 1) -> bool:
+        return self.pos + n > self.cut
+
+    def deal(self, n: int = 1) -> List[int]:
+        if n > len(self):
+            raise ValueError("shoe exhausted")
+        cards = self.cards[self.pos:self.pos + n]
+        self.pos += n
+        return [int(c) for c in cards]
+
+    @staticmethod
+    def full_counts(decks: int) -> List[int]:
+        # composition d'un sabot neuf, au format de remaining()
+        return [0] + [4 * decks] * 13
+
+    def remaining(self) -> Sequence[int]:
+        # composition du reste du sabot : nombre de cartes par code (index 0..13)
+        return np.bincount(self.cards[self.pos:], minlength=14)
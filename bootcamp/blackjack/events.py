@@ -0,0 +1,166 @@
+import asyncio
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, Dict, Optional, Set
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.module_loading import import_string
+
+from .renderers import dumps
+
+# Flux d'état des games poussé aux clients (Server-Sent Events) au lieu du
+# polling de GET /games/{gid}. Les endpoints qui modifient un game publient
+# un petit diff ; le broker le distribue aux abonnés de ce game.
+#
+# Événements :
+#   snapshot        GameOut complet, envoyé à la connexion
+#   players         {"players": [PlayerOut, ...]}  joueurs ajoutés ou modifiés
+#   player_removed  {"player_id": pid}
+#   game            {"game": GameListItem}  tour, fin, compteurs de joueurs
+#   resync          l'abonné a pris trop de retard : refaire un GET /games/{gid}
+
+KEEPALIVE_SECONDS = 15
+QUEUE_SIZE = 256
+
+
+class Subscription:
+    # File d'événements d'un abonné. put() peut être appelé depuis n'importe
+    # quel thread (handlers sync), get() depuis la boucle asyncio du flux.
+
+    def __init__(self, gid: int, maxsize: int = QUEUE_SIZE) -> None:
+        self.gid = gid
+        self._maxsize = maxsize
+        self._items: deque = deque()
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def put(self, event: Dict[str, Any]) -> None:
+        with self._lock:
+            if len(self._items) >= self._maxsize:
+                # abonné trop lent : on jette son retard, il relira l'état complet
+                self._items.clear()
+                event = {"type": "resync"}
+            self._items.append(event)
+            loop, wakeup = self._loop, self._wakeup
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(wakeup.set)
+            except RuntimeError:
+                pass  # boucle fermée : le flux est terminé
+
+    async def get(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        if self._wakeup is None:
+            with self._lock:
+                self._loop = asyncio.get_running_loop()
+                self._wakeup = asyncio.Event()
+        while True:
+            self._wakeup.clear()
+            with self._lock:
+                if self._items:
+                    return self._items.popleft()
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+
+
+class EventBroker(ABC):
+    # Interface du pub/sub ; choisi par settings.BLACKJACK_EVENT_BROKER.
+
+    @abstractmethod
+    def subscribe(self, gid: int) -> Subscription:
+        ...
+
+    @abstractmethod
+    def unsubscribe(self, sub: Subscription) -> None:
+        ...
+
+    @abstractmethod
+    def publish(self, gid: int, event: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def has_subscribers(self, gid: int) -> bool:
+        ...
+
+
+class InProcessBroker(EventBroker):
+    # Pub/sub en mémoire du process : suffit avec un seul worker ASGI.
+
+    def __init__(self) -> None:
+        self._subs: Dict[int, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, gid: int) -> Subscription:
+        sub = Subscription(gid)
+        with self._lock:
+            self._subs.setdefault(gid, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            subs = self._subs.get(sub.gid)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[sub.gid]
+
+    def publish(self, gid: int, event: Dict[str, Any]) -> None:
+        with self._lock:
+            subs = list(self._subs.get(gid, ()))
+        for sub in subs:
+            sub.put(event)
+
+    def has_subscribers(self, gid: int) -> bool:
+        return gid in self._subs
+
+
+_broker: Optional[EventBroker] = None
+
+
+def get_broker() -> EventBroker:
+    global _broker
+    if _broker is None:
+        path = getattr(settings, "BLACKJACK_EVENT_BROKER", "blackjack.events.InProcessBroker")
+        _broker = import_string(path)()
+    return _broker
+
+
+def publish(gid: int, type: str, **data: Any) -> None:
+    get_broker().publish(gid, {"type": type, **data})
+
+
+def has_subscribers(gid: int) -> bool:
+    return get_broker().has_subscribers(gid)
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {dumps(data).decode()}\n\n"
+
+
+async def _stream(sub: Subscription, snapshot: Dict[str, Any]):
+    # Le flux se termine quand le game est fini (le client se reconnecte après /start).
+    broker = get_broker()
+    try:
+        yield _sse("snapshot", snapshot)
+        if snapshot["ended"]:
+            return
+        while True:
+            try:
+                event = await sub.get(timeout=KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            yield _sse(event["type"], event)
+            if event["type"] == "game" and event["game"]["ended"]:
+                return
+    finally:
+        broker.unsubscribe(sub)
+
+
+def stream_response(sub: Subscription, snapshot: Dict[str, Any]) -> StreamingHttpResponse:
+    # `sub` doit être pris AVANT de lire le snapshot : aucun diff perdu entre les deux
+    response = StreamingHttpResponse(_stream(sub, snapshot), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,18 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from blackjack import strategy
+
+
+class Command(BaseCommand):
+    help = "Calcule les tables de stratégie de base / EV (blackjack.strategy) et les écrit en .npy"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", type=Path, default=None,
+                            help="fichier de sortie (défaut : settings.BLACKJACK_STRATEGY_TABLE)")
+
+    def handle(self, *args, **options):
+        path = options["output"] or strategy.table_path()
+        table = strategy.write_tables(path)
+        self.stdout.write(f"{table.size} états, {path.stat().st_size} octets -> {path}")
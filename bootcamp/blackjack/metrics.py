@@ -0,0 +1,276 @@
+import functools
+import inspect
+import re
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db.backends.signals import connection_created
+
+# Métriques par route, exposées au format texte Prometheus (GET /metrics).
+#
+#   MetricsMiddleware    durée totale de la requête, par (méthode, gabarit de route)
+#   _wrap_queries        nombre et durée des requêtes SQL (execute_wrapper de
+#                        chaque connexion, posé par install() à la connexion)
+#   instrument(api)      hooks ninja : validation des réponses (pydantic, entre
+#                        la fin du handler et le rendu) et rendu JSON
+#                        (create_response, ou projection.json_response)
+#
+# Les mesures d'une requête s'accumulent dans un RequestStats porté par une
+# ContextVar : suivie par sync_to_async, donc valable aussi pour l'API async.
+# Hors requête (commandes, flux SSE après la réponse), rien n'est compté.
+#
+# Coût : une poignée de perf_counter(), quatre bisect et un verrou par requête,
+# un perf_counter() de plus par requête SQL (python -m blackjack.bench metrics).
+
+# bornes des histogrammes de durée (secondes) et de nombre de requêtes SQL
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 4, 5, 10, 20, 50, 100)
+
+
+class RequestStats:
+    __slots__ = ("queries", "db", "validation", "render", "handler_end")
+
+    def __init__(self) -> None:
+        self.queries = 0
+        self.db = self.validation = self.render = 0.0
+        self.handler_end = None
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("blackjack_metrics", default=None)
+
+
+class Histogram:
+    # comptes par tranche (non cumulés : cumulés à l'export) + somme
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds=BUCKETS) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class RouteMetrics:
+    __slots__ = ("statuses", "duration", "queries", "db", "validation", "render")
+
+    def __init__(self) -> None:
+        self.statuses: Dict[int, int] = {}
+        self.duration = Histogram()
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.db = Histogram()
+        self.validation = Histogram()
+        self.render = Histogram()
+
+
+class Registry:
+
+    def __init__(self) -> None:
+        self._routes: Dict[Tuple[str, str], RouteMetrics] = {}
+        self._lock = threading.Lock()
+
+    def record(self, method: str, route: str, status: int, duration: float, stats: RequestStats) -> None:
+        with self._lock:
+            m = self._routes.get((method, route))
+            if m is None:
+                m = self._routes[method, route] = RouteMetrics()
+            m.statuses[status] = m.statuses.get(status, 0) + 1
+            m.duration.observe(duration)
+            m.queries.observe(stats.queries)
+            m.db.observe(stats.db)
+            if stats.validation or stats.render:
+                m.validation.observe(stats.validation)
+                m.render.observe(stats.render)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._routes.clear()
+
+    def render(self) -> str:
+        # format d'exposition texte Prometheus 0.0.4
+        with self._lock:
+            routes = sorted(self._routes.items())
+            snapshot = [
+                (key, dict(m.statuses), *[(list(h.counts), h.sum, h.bounds)
+                                          for h in (m.duration, m.queries, m.db, m.validation, m.render)])
+                for key, m in routes
+            ]
+        out: List[str] = []
+        out += ["# HELP blackjack_requests_total Requêtes HTTP par route et statut.",
+                "# TYPE blackjack_requests_total counter"]
+        for (method, route), statuses, *_ in snapshot:
+            for status, n in sorted(statuses.items()):
+                out.append(f'blackjack_requests_total{{{_labels(method, route)},status="{status}"}} {n}')
+        families = (
+            ("request_duration_seconds", "Durée totale de la requête (middleware).", 0),
+            ("db_queries", "Requêtes SQL par requête HTTP.", 1),
+            ("db_duration_seconds", "Temps passé en SQL par requête HTTP.", 2),
+            ("validation_duration_seconds", "Validation de la réponse par ninja (pydantic).", 3),
+            ("render_duration_seconds", "Rendu JSON de la réponse.", 4),
+        )
+        for name, help_, i in families:
+            out += [f"# HELP blackjack_{name} {help_}", f"# TYPE blackjack_{name} histogram"]
+            for (method, route), _, *histograms in snapshot:
+                counts, total, bounds = histograms[i]
+                if not any(counts):
+                    continue
+                labels = _labels(method, route)
+                cumulative = 0
+                for bound, n in zip(bounds, counts):
+                    cumulative += n
+                    out.append(f'blackjack_{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                out.append(f'blackjack_{name}_bucket{{{labels},le="+Inf"}} {sum(counts)}')
+                out.append(f"blackjack_{name}_sum{{{labels}}} {total!r}")
+                out.append(f"blackjack_{name}_count{{{labels}}} {sum(counts)}")
+        return "\n".join(out) + "\n"
+
+
+def _labels(method: str, route: str) -> str:
+    route = route.replace("\\", "\\\\").replace('"', '\\"')
+    return f'method="{method}",route="{route}"'
+
+
+registry = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# ---- Gabarit de route ----
+_PARAM = re.compile(r"<(?:\w+:)?(\w+)>")
+_templates: Dict[str, str] = {}
+
+
+def route_template(request) -> str:
+    # "api/games/<gid>/players/<pid>/play" -> "/api/games/{gid}/players/{pid}/play" ;
+    # pas de route résolue (404) : un seul libellé, pas un par URL
+    match = getattr(request, "resolver_match", None)
+    if match is None or match.route is None:
+        return "<unmatched>"
+    route = match.route
+    template = _templates.get(route)
+    if template is None:
+        template = _templates[route] = "/" + _PARAM.sub(r"{\1}", route)
+    return template
+
+
+# ---- Middleware ----
+class MetricsMiddleware:
+    # en tête de settings.MIDDLEWARE : la durée couvre tous les autres
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        t0 = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        registry.record(request.method, route_template(request), response.status_code, perf_counter() - t0, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        t0 = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        registry.record(request.method, route_template(request), response.status_code, perf_counter() - t0, stats)
+        return response
+
+
+# ---- SQL ----
+def _wrap_queries(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    t0 = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db += perf_counter() - t0
+        stats.queries += 1
+
+
+def _on_connection_created(sender, connection, **kwargs) -> None:
+    # à chaque (re)connexion : le wrapper reste sur le DatabaseWrapper du thread
+    if _wrap_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_wrap_queries)
+
+
+def install() -> None:
+    # appelé par BlackjackConfig.ready(), avant toute connexion
+    connection_created.connect(_on_connection_created, dispatch_uid="blackjack.metrics")
+
+
+# ---- Hooks ninja ----
+def add_render(seconds: float) -> None:
+    # rendu fait par le handler lui-même (projection.json_response)
+    stats = _current.get()
+    if stats is not None:
+        stats.render += seconds
+
+
+def _timed_view(view_func):
+    # marque la fin du handler : la validation pydantic va de là au rendu
+    if inspect.iscoroutinefunction(view_func):
+        @functools.wraps(view_func)
+        async def view(request, *args, **kwargs):
+            try:
+                return await view_func(request, *args, **kwargs)
+            finally:
+                _mark_handler_end()
+    else:
+        @functools.wraps(view_func)
+        def view(request, *args, **kwargs):
+            try:
+                return view_func(request, *args, **kwargs)
+            finally:
+                _mark_handler_end()
+    return view
+
+
+def _mark_handler_end() -> None:
+    stats = _current.get()
+    if stats is not None:
+        stats.handler_end = perf_counter()
+
+
+def instrument(api) -> None:
+    # à appeler une fois toutes les routes de `api` déclarées
+    for _, router in api._routers:
+        for view in router.path_operations.values():
+            for op in view.operations:
+                if not getattr(op, "stream_format", None):
+                    op.view_func = _timed_view(op.view_func)
+    create_response = api.create_response
+
+    def timed_create_response(request, data: Any, **kwargs):
+        stats = _current.get()
+        if stats is None:
+            return create_response(request, data, **kwargs)
+        t0 = perf_counter()
+        if stats.handler_end is not None:
+            stats.validation += t0 - stats.handler_end
+        try:
+            return create_response(request, data, **kwargs)
+        finally:
+            stats.render += perf_counter() - t0
+
+    api.create_response = timed_create_response
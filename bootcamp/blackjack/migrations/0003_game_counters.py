@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:45
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    # games existants : agrégats recalculés depuis les joueurs, en un UPDATE
+    Game = apps.get_model('blackjack', 'Game')
+    Player = apps.get_model('blackjack', 'Player')
+    players = Player.objects.filter(game_id=OuterRef('pk')).order_by()
+
+    def count(qs):
+        return Coalesce(Subquery(qs.values('game_id').annotate(n=Count('pk')).values('n')), 0)
+
+    Game.objects.update(
+        player_count=count(players),
+        standing_count=count(players.filter(stand=True)),
+        top_score=Coalesce(Subquery(players.order_by('-score').values('score')[:1]), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blackjack', '0002_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='player_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='standing_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='top_score',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
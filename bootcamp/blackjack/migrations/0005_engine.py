@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blackjack', '0004_player_score_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='shoe',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='shoe_pos',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='player',
+            name='cards',
+            field=models.CharField(blank=True, default='', max_length=16),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:31
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def baseline_snapshots(apps, schema_editor):
+    # games existants : leur état actuel sert de point de départ au journal
+    # (snapshot avant le premier coup, last_move = 0 ; format de movelog.apply)
+    Game = apps.get_model('blackjack', 'Game')
+    GameSnapshot = apps.get_model('blackjack', 'GameSnapshot')
+    Player = apps.get_model('blackjack', 'Player')
+    states = {
+        gid: {'turn': turn, 'ended': ended, 'players': {}}
+        for gid, turn, ended in Game.objects.values_list('id', 'turn', 'ended').iterator()
+    }
+    fields = ('game_id', 'id', 'name', 'score', 'stand', 'cards')
+    for gid, pid, name, score, stand, cards in Player.objects.values_list(*fields).iterator():
+        states[gid]['players'][str(pid)] = {'name': name, 'score': score, 'stand': stand, 'cards': cards}
+    GameSnapshot.objects.bulk_create(
+        (GameSnapshot(game_id=gid, last_move=0, state=state) for gid, state in states.items()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blackjack', '0005_engine'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='move_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='GameSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_move', models.BigIntegerField()),
+                ('state', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('game', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='blackjack.game')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['game', '-last_move'], name='snapshot_game_move_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Move',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('player_id', models.BigIntegerField(null=True)),
+                ('kind', models.CharField(choices=[('join', 'Join'), ('score', 'Score'), ('hit', 'Hit'), ('stand', 'Stand'), ('leave', 'Leave'), ('start', 'Start'), ('end', 'End')], max_length=5)),
+                ('value', models.IntegerField(default=0)),
+                ('name', models.CharField(blank=True, default='', max_length=50)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('game', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='moves', to='blackjack.game')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['game', 'id'], name='move_game_id_idx')],
+            },
+        ),
+        migrations.RunPython(baseline_snapshots, migrations.RunPython.noop),
+    ]
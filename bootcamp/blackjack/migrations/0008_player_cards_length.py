@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blackjack', '0007_versions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='player',
+            name='cards',
+            field=models.CharField(blank=True, default='', max_length=24),
+        ),
+    ]
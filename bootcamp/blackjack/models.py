@@ -77,11 +77,12 @@
 
 
 from django.db import models
+from django.utils import timezone
 
 
 class Student(models.Model):
     name = models.CharField(max_length=100)
-    email = models.EmailField()
+    email = models.EmailField(unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self) -> str:
@@ -92,16 +93,100 @@ class Game(models.Model):
     name = models.CharField(max_length=250)
     turn = models.IntegerField(default=0)
     ended = models.BooleanField(default=False)
+    # agrégats des joueurs, tenus à jour par les endpoints qui les modifient
+    # (api.py) pour que GET /games les renvoie sans jointure
+    player_count = models.IntegerField(default=0)
+    standing_count = models.IntegerField(default=0)
+    top_score = models.IntegerField(default=0)
+    # sabot du game (engine.Shoe : un octet par carte) et position de la
+    # prochaine carte ; vide tant que personne n'a tiré
+    shoe = models.BinaryField(default=b"")
+    shoe_pos = models.IntegerField(default=0)
+    # nombre de coups journalisés (Move) : déclenche les snapshots (movelog.py)
+    move_count = models.IntegerField(default=0)
+    # version de la ligne, +1 à chaque UPDATE (api._update_game) : contrôle
+    # optimiste des écritures (If-Match)
+    version = models.IntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            # GET /games?ended=... : WHERE ended = ? AND id > <curseur> ORDER BY id
+            models.Index(fields=["ended", "id"], name="game_ended_id_idx"),
+        ]
 
     def __str__(self) -> str:
         return self.name
 
 
 class Player(models.Model):
-    game = models.ForeignKey(Game, related_name="players", on_delete=models.CASCADE)
+    # l'index simple de la FK est remplacé par (game, id), qui a la même colonne de tête
+    game = models.ForeignKey(Game, related_name="players", on_delete=models.CASCADE, db_index=False)
     name = models.CharField(max_length=50)
     score = models.IntegerField(default=0)
     stand = models.BooleanField(default=False)
+    # main du joueur, une lettre de engine.RANKS par carte ("AK") ; au plus
+    # 20 cartes avant d'atteindre 21 (dix as, un 2, huit as, une dernière
+    # carte), possibles dès 5 jeux dans le sabot
+    cards = models.CharField(max_length=24, default="", blank=True)
+    # +1 à chaque coup (cf. Game.version)
+    version = models.IntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            # joueurs d'un game dans l'ordre (détail, /moves, suppression en cascade)
+            models.Index(fields=["game", "id"], name="player_game_id_idx"),
+            # joueurs d'un game par score (classement), sans tri temporaire
+            models.Index(fields=["game", "-score"], name="player_game_score_idx"),
+            # classement global (GET /leaderboard) : top-N lu dans l'index
+            models.Index(fields=["-score", "id"], name="player_score_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"{self.name} ({self.game_id})"
+
+
+class Move(models.Model):
+    # Journal des coups, en ajout seul (movelog.py) : jamais modifié, et il
+    # survit au départ du joueur (player_id sans FK). L'ordre des coups d'un
+    # game est celui des ids.
+    class Kind(models.TextChoices):
+        JOIN = "join"      # arrivée du joueur (name)
+        SCORE = "score"    # value points ajoutés (score >= 0), tour suivant
+        HIT = "hit"        # value = carte tirée (code engine), tour suivant
+        STAND = "stand"
+        LEAVE = "leave"
+        START = "start"    # tour remis à 0, game rouvert
+        END = "end"
+
+    game = models.ForeignKey(Game, related_name="moves", on_delete=models.CASCADE, db_index=False)
+    player_id = models.BigIntegerField(null=True)
+    kind = models.CharField(max_length=5, choices=Kind.choices)
+    value = models.IntegerField(default=0)
+    name = models.CharField(max_length=50, blank=True, default="")
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # historique d'un game et fin de journal après un snapshot : WHERE game = ? AND id > ?
+            models.Index(fields=["game", "id"], name="move_game_id_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.kind} ({self.game_id}/{self.player_id})"
+
+
+class GameSnapshot(models.Model):
+    # État d'un game (movelog.apply) après le coup last_move
+    game = models.ForeignKey(Game, related_name="snapshots", on_delete=models.CASCADE, db_index=False)
+    last_move = models.BigIntegerField()
+    state = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # dernier snapshot d'un game (avant un coup donné)
+            models.Index(fields=["game", "-last_move"], name="snapshot_game_move_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.game_id}@{self.last_move}"
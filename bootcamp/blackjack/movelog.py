@@ -0,0 +1,138 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from . import engine
+from .models import Game, GameSnapshot, Move
+
+# Journal des coups (audit, litiges) et reconstruction de l'état d'un game.
+#
+# Chaque écriture de l'API ORM ajoute ses coups (models.Move) en un
+# bulk_create, dans la transaction qui modifie le game ; le même UPDATE du
+# game incrémente Game.move_count (cf. api._update_game). Tous les
+# BLACKJACK_SNAPSHOT_EVERY coups d'un game, un snapshot de son état est écrit
+# après le commit.
+#
+# rebuild(gid, upto) : dernier snapshot (avant upto) + les coups suivants, au
+# plus SNAPSHOT_EVERY coups à rejouer, quelle que soit la longueur de
+# l'historique ; les deux lectures sont servies par les index (game, ...).
+#
+# État : {"turn", "ended", "players": {"<pid>": {"name", "score", "stand", "cards"}}},
+# directement sérialisable en JSON (GameSnapshot.state).
+
+REPLAY_FIELDS = ("player_id", "kind", "value", "name")
+
+
+def snapshot_every() -> int:
+    return getattr(settings, "BLACKJACK_SNAPSHOT_EVERY", 500)
+
+
+def empty_state() -> Dict[str, Any]:
+    return {"turn": 0, "ended": False, "players": {}}
+
+
+def _new_player(name: str = "") -> Dict[str, Any]:
+    return {"name": name, "score": 0, "stand": False, "cards": ""}
+
+
+def apply(state: Dict[str, Any], rows: Iterable[Tuple[Optional[int], str, int, str]]) -> Dict[str, Any]:
+    # rejoue des coups (tuples REPLAY_FIELDS, dans l'ordre) sur `state`, mêmes
+    # règles que les endpoints (api.play_turn, api._hit). Un joueur créé hors
+    # de l'API (admin, shell) n'a pas de coup "join" : ajouté à son premier coup.
+    players = state["players"]
+    for pid, kind, value, name in rows:
+        if kind == "score":
+            p = players.setdefault(str(pid), _new_player())
+            p["score"] = max(0, p["score"] + value)
+            state["turn"] += 1
+        elif kind == "hit":
+            p = players.setdefault(str(pid), _new_player())
+            p["cards"] += engine.RANKS[value - 1]
+            p["score"], _ = engine.hand_value(engine.parse_cards(p["cards"]))
+            p["stand"] = p["stand"] or p["score"] >= 21
+            state["turn"] += 1
+        elif kind == "stand":
+            players.setdefault(str(pid), _new_player())["stand"] = True
+        elif kind == "join":
+            players[str(pid)] = _new_player(name)
+        elif kind == "leave":
+            players.pop(str(pid), None)
+        elif kind == "start":
+            state["turn"], state["ended"] = 0, False
+        elif kind == "end":
+            state["ended"] = True
+    return state
+
+
+def load(gid: int, upto: Optional[int] = None) -> Tuple[Dict[str, Any], int, bool]:
+    # (état, id du dernier coup appliqué, snapshot trouvé ?) après le coup `upto`
+    # (None : dernier coup) ; 2 SELECT
+    snapshots = GameSnapshot.objects.filter(game_id=gid)
+    if upto is not None:
+        snapshots = snapshots.filter(last_move__lte=upto)
+    snap = snapshots.order_by("-last_move").values_list("last_move", "state").first()
+    last, state = snap if snap else (0, empty_state())
+    tail = Move.objects.filter(game_id=gid, id__gt=last)
+    if upto is not None:
+        tail = tail.filter(id__lte=upto)
+    rows = list(tail.order_by("id").values_list("id", *REPLAY_FIELDS))
+    if rows:
+        apply(state, (row[1:] for row in rows))
+        last = rows[-1][0]
+    return state, last, snap is not None
+
+
+def snapshot(gid: int) -> GameSnapshot:
+    state, last, _ = load(gid)
+    return GameSnapshot.objects.create(game_id=gid, last_move=last, state=state)
+
+
+def _due(count: int, added: int) -> bool:
+    # `added` coups viennent d'amener Game.move_count à `count` : un multiple
+    # de SNAPSHOT_EVERY a-t-il été franchi ?
+    every = snapshot_every()
+    return count // every > (count - added) // every
+
+
+def snapshot_if_due(gid: int, count: int, added: int) -> None:
+    # snapshot après le commit (hors verrou du game)
+    if _due(count, added):
+        transaction.on_commit(lambda: snapshot(gid))
+
+
+def append(game: Dict[str, Any], moves: List[Move]) -> None:
+    # coups écrits avec l'UPDATE du game : `game` est la ligne renvoyée par
+    # api._update_game(moves=len(moves)), qui porte move_count (retiré ici)
+    count = game.pop("move_count")
+    for m in moves:
+        m.game_id = game["id"]
+    Move.objects.bulk_create(moves)
+    snapshot_if_due(game["id"], count, len(moves))
+
+
+async def aappend(game: Dict[str, Any], moves: List[Move]) -> None:
+    # append pour l'API async, hors transaction (cf. api_async) : le snapshot
+    # dû est écrit tout de suite
+    count = game.pop("move_count")
+    for m in moves:
+        m.game_id = game["id"]
+    await Move.objects.abulk_create(moves)
+    if _due(count, len(moves)):
+        await sync_to_async(snapshot)(game["id"])
+
+
+def rebuild(gid: int, upto: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    # état du game après le coup `upto` (GameReplay), None si le game n'existe pas
+    state, last, found = load(gid, upto)
+    if not found and not last and not Game.objects.filter(pk=gid).exists():
+        return None
+    # joueurs par id : jsonb (PostgreSQL) ne garde pas l'ordre des clés
+    players = sorted((int(pid), p) for pid, p in state["players"].items())
+    return {
+        "last_move": last,
+        "turn": state["turn"],
+        "ended": state["ended"],
+        "players": [{"id": pid, **p} for pid, p in players],
+    }
@@ -0,0 +1,193 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import get_context
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from . import engine, strategy
+from .cache import hint_cache
+
+# Conseil "hit ou stand ?" pour une main, par Monte Carlo sur le reste du sabot.
+#
+# Chaque tirage simulé prend des cartes sans remise dans la composition du
+# sabot (nombre de cartes restantes par code, cf. Shoe.remaining), puis joue :
+#   - stand : le croupier complète sa main (carte visible + tirage jusqu'à 17 ;
+#     sur 17 soft, il tire si BLACKJACK_DEALER_HITS_SOFT_17, comme dans les
+#     tables de strategy.lookup) ;
+#   - hit   : le joueur tire une carte, puis continue sous 17, puis le croupier.
+# Gain par partie : +1 / 0 / -1 ; les EV renvoyées sont les moyennes.
+#
+# Les gros lots sont découpés en tranches réparties sur un pool de process
+# (BLACKJACK_HINT_WORKERS), dans la limite de BLACKJACK_HINT_TIMEOUT secondes :
+# chaque tranche s'arrête elle-même à l'échéance (par lots de _BATCH parties),
+# on garde ce qui a été joué. Un pool n'est donc jamais occupé par les
+# tranches d'un conseil déjà rendu. Résultats mémorisés par
+# (main, carte du croupier, composition du sabot, règle) dans cache.hint_cache.
+# simulate=False s'en tient aux tables précalculées (strategy.py, sabot infini).
+
+_MAX_DRAW = 24  # cartes tirées par partie simulée (joueur + croupier), largement assez
+_BATCH = 5_000  # parties par lot : granularité de l'échéance
+_VALUES = np.array(engine.VALUES, dtype=np.uint8)
+
+
+def _draw(counts: Sequence[int], n: int, m: int, rng) -> np.ndarray:
+    # n séquences de m cartes tirées sans remise : Fisher-Yates partiel
+    # (m échanges) sur n copies du reste du sabot, une ligne par partie
+    cards = np.tile(np.repeat(np.arange(14, dtype=np.uint8), counts), (n, 1))
+    rows = np.arange(n)
+    for j in range(m):
+        k = rng.integers(j, cards.shape[1], size=n)
+        picked = cards[rows, k]
+        cards[rows, k] = cards[:, j]
+        cards[:, j] = picked
+    return cards[:, :m]
+
+
+def _play_out(hard, ace, cards: np.ndarray, ptr, stop: int = 17, h17: bool = False):
+    # chaque main tire dans sa ligne de `cards` (à partir de ptr) tant qu'elle
+    # vaut moins de `stop`, et aussi sur un 17 soft avec h17 (croupier H17) ;
+    # renvoie (totaux, prochaine carte de chaque ligne)
+    rows = np.arange(len(hard))
+    m = cards.shape[1]
+    while True:
+        soft = ace & (hard <= 11)
+        total = hard + 10 * soft
+        need = ((total < stop) | (h17 & soft & (total == 17))) & (ptr < m)
+        if not need.any():
+            return total, ptr
+        card = cards[rows, np.minimum(ptr, m - 1)]
+        hard = hard + _VALUES[card] * need
+        ace = ace | ((card == 1) & need)
+        ptr = ptr + need
+
+
+def _outcome(player, dealer) -> np.ndarray:
+    result = np.sign(player - dealer)
+    result[dealer > 21] = 1
+    result[player > 21] = -1
+    return result
+
+
+def simulate(hard: int, ace: bool, up: int, counts: Sequence[int], n: int, seed,
+             deadline: Optional[float] = None, h17: bool = False) -> Tuple[float, float, int]:
+    # Une tranche de n parties : (somme des gains stand, somme des gains hit,
+    # parties jouées). Par lots de _BATCH ; passé `deadline` (time.monotonic,
+    # horloge commune aux process de la machine), on s'arrête après le lot en
+    # cours. Fonction de module, sans Django : exécutée telle quelle dans le pool.
+    rng = np.random.default_rng(seed)
+    stand = hit = 0.0
+    done = 0
+    while done < n:
+        size = min(_BATCH, n - done)
+        s, h = _simulate_batch(hard, ace, up, counts, size, rng, h17)
+        stand, hit, done = stand + s, hit + h, done + size
+        if deadline is not None and time.monotonic() > deadline:
+            break
+    return stand, hit, done
+
+
+def _simulate_batch(hard: int, ace: bool, up: int, counts: Sequence[int], n: int, rng,
+                    h17: bool) -> Tuple[float, float]:
+    cards = _draw(counts, n, min(_MAX_DRAW, sum(counts)), rng)
+    zeros = np.zeros(n, dtype=np.int16)
+    start = np.zeros(n, dtype=np.intp)
+    dealer_hard, dealer_ace = zeros + engine.VALUES[up], np.full(n, up == 1)
+
+    total = zeros + hard + 10 * (ace and hard <= 11)
+    dealer, _ = _play_out(dealer_hard, dealer_ace, cards, start, h17=h17)
+    stand = _outcome(total, dealer)
+
+    first = cards[:, 0]
+    total, ptr = _play_out(zeros + hard + _VALUES[first], (first == 1) | ace, cards, start + 1)
+    dealer, _ = _play_out(dealer_hard, dealer_ace, cards, ptr, h17=h17)
+    hit = _outcome(total, dealer)
+    return float(stand.sum()), float(hit.sum())
+
+
+def bust_probability(hard: int, counts: Sequence[int]) -> float:
+    # exacte : part des cartes restantes qui font dépasser 21 au prochain hit
+    # (l'as compte 1 : seule une main "hard" peut sauter)
+    total = sum(counts)
+    busting = sum(counts[c] for c in range(1, 14) if hard + engine.VALUES[c] > 21)
+    return busting / total if total else 0.0
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> Optional[ProcessPoolExecutor]:
+    # pool créé au premier gros calcul ; spawn : pas de fork d'un serveur multi-thread
+    global _pool
+    workers = getattr(settings, "BLACKJACK_HINT_WORKERS", None)
+    if workers == 0:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+    return _pool
+
+
+def _run(hard: int, ace: bool, up: int, counts: Tuple[int, ...], h17: bool) -> Tuple[float, float, int]:
+    samples = getattr(settings, "BLACKJACK_HINT_SAMPLES", 200_000)
+    chunk = getattr(settings, "BLACKJACK_HINT_CHUNK", 25_000)
+    deadline = time.monotonic() + getattr(settings, "BLACKJACK_HINT_TIMEOUT", 1.0)
+    sizes = [min(chunk, samples - i) for i in range(0, samples, chunk)]
+    seeds = np.random.SeedSequence().spawn(len(sizes))
+    pool = get_pool() if len(sizes) > 1 else None
+
+    results = []
+    if pool is None:
+        # dans le process : tranche par tranche jusqu'à l'échéance
+        for size, seed in zip(sizes, seeds):
+            results.append(simulate(hard, ace, up, counts, size, seed, deadline, h17))
+            if time.monotonic() > deadline:
+                break
+    else:
+        futures = [pool.submit(simulate, hard, ace, up, counts, size, seed, deadline, h17)
+                   for size, seed in zip(sizes, seeds)]
+        done, pending = wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+        if not done:
+            # au moins un lot, même hors budget
+            done, pending = wait(futures, return_when=FIRST_COMPLETED)
+        for f in pending:
+            f.cancel()  # pas encore commencées ; les autres s'arrêtent d'elles-mêmes
+        results = [f.result() for f in done]
+    return tuple(map(sum, zip(*results)))
+
+
+def hint(cards: str, up: int, counts: Sequence[int], simulate: bool = True) -> Dict[str, Any]:
+    # Conseil pour la main `cards` (Player.cards) face à la carte `up` du croupier,
+    # avec `counts` cartes restantes par code. La main est réduite à
+    # (total hard, as ?) : deux mains équivalentes partagent leur entrée de cache.
+    codes = engine.parse_cards(cards)
+    hard = sum(engine.VALUES[c] for c in codes)
+    basic, stand_ev, hit_ev = strategy.lookup(hard, 1 in codes, up)
+    if not simulate:
+        return {
+            "action": basic,
+            "basic_strategy": basic,
+            "bust_probability": bust_probability(hard, counts),
+            "stand_ev": stand_ev,
+            "hit_ev": hit_ev,
+            "samples": 0,
+        }
+    h17 = bool(getattr(settings, "BLACKJACK_DEALER_HITS_SOFT_17", False))
+    key = (hard, 1 in codes, up, tuple(int(c) for c in counts), h17)
+    result = hint_cache.get(key)
+    if result is None:
+        stand, hit, n = _run(*key)
+        result = {
+            "action": "hit" if hit > stand else "stand",
+            "basic_strategy": basic,
+            "bust_probability": bust_probability(hard, key[3]),
+            "stand_ev": stand / n,
+            "hit_ev": hit / n,
+            "samples": n,
+        }
+        hint_cache.set(key, result)
+    return result
@@ -0,0 +1,69 @@
+import binascii
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from operator import attrgetter, itemgetter
+from typing import Any, List, Optional, Type
+
+from django.db.models import QuerySet
+from ninja import Field, Schema
+from ninja.errors import HttpError
+from ninja.pagination import AsyncPaginationBase
+
+from .projection import aproject, project
+
+
+def encode_cursor(last_id: int) -> str:
+    return urlsafe_b64encode(str(last_id).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, binascii.Error):
+        raise HttpError(400, "Invalid cursor")
+
+
+class KeysetPagination(AsyncPaginationBase):
+    # Pagination par curseur sur l'id : WHERE id > <dernier id> ORDER BY id LIMIT n.
+    # Pas d'OFFSET ni de COUNT(*), donc le coût d'une page ne dépend pas
+    # de la profondeur. Le curseur est opaque pour le client (id encodé en base64).
+
+    class Input(Schema):
+        limit: int = Field(50, ge=1, le=500)
+        cursor: Optional[str] = None
+
+    class Output(Schema):
+        items: List[Any]
+        next: Optional[str] = None
+
+    def _page_queryset(self, queryset: QuerySet, pagination: Input) -> QuerySet:
+        if pagination.cursor:
+            queryset = queryset.filter(id__gt=decode_cursor(pagination.cursor))
+        # une ligne de plus pour savoir s'il reste une page, sans COUNT(*)
+        return queryset.order_by("id")[: pagination.limit + 1]
+
+    def _page(self, rows: list, pagination: Input, id_of=attrgetter("id")) -> dict:
+        has_more = len(rows) > pagination.limit
+        rows = rows[: pagination.limit]
+        return {
+            "items": rows,
+            "next": encode_cursor(id_of(rows[-1])) if has_more else None,
+        }
+
+    def paginate_queryset(self, queryset: QuerySet, pagination: Input, **params: Any) -> Any:
+        return self._page(list(self._page_queryset(queryset, pagination)), pagination)
+
+    async def apaginate_queryset(self, queryset: QuerySet, pagination: Input, **params: Any) -> Any:
+        rows = [row async for row in self._page_queryset(queryset, pagination)]
+        return self._page(rows, pagination)
+
+    # Pages projetées (cf. projection.py) : appelées directement par les handlers
+    # qui déclarent `page: Query[KeysetPagination.Input]`. @paginate ne s'applique
+    # pas ici, il fait valider chaque ligne par pydantic.
+    def project(self, queryset: QuerySet, schema: Type[Schema], pagination: Input) -> dict:
+        rows = project(self._page_queryset(queryset, pagination), schema)
+        return self._page(rows, pagination, itemgetter("id"))
+
+    async def aproject(self, queryset: QuerySet, schema: Type[Schema], pagination: Input) -> dict:
+        rows = await aproject(self._page_queryset(queryset, pagination), schema)
+        return self._page(rows, pagination, itemgetter("id"))
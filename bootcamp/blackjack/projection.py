@@ -0,0 +1,44 @@
+from time import perf_counter
+from typing import Any, Dict, List, Tuple, Type
+
+from django.db.models import QuerySet
+from django.http import HttpResponse
+from ninja import Schema
+
+from . import metrics
+from .renderers import get_renderer
+
+# Chemin rapide des endpoints de lecture : les lignes sont lues en tuples
+# (values_list) et émises telles quelles, sans instance de modèle ni
+# re-validation pydantic. Les colonnes viennent des schémas de schemas.py,
+# la forme des réponses reste donc celle déclarée dans response=.
+#
+# À réserver aux données de confiance (lues en base par nos propres requêtes) ;
+# les schémas projetés doivent être plats (pas de champ imbriqué).
+
+
+def schema_fields(schema: Type[Schema]) -> Tuple[str, ...]:
+    return tuple(schema.model_fields)
+
+
+def _rows(fields: Tuple[str, ...], tuples) -> List[Dict[str, Any]]:
+    return [dict(zip(fields, row)) for row in tuples]
+
+
+def project(queryset: QuerySet, schema: Type[Schema]) -> List[Dict[str, Any]]:
+    fields = schema_fields(schema)
+    return _rows(fields, queryset.values_list(*fields))
+
+
+async def aproject(queryset: QuerySet, schema: Type[Schema]) -> List[Dict[str, Any]]:
+    fields = schema_fields(schema)
+    return _rows(fields, [row async for row in queryset.values_list(*fields)])
+
+
+def json_response(data: Any, status: int = 200) -> HttpResponse:
+    # rendu direct : ninja ne valide pas un HttpResponse renvoyé par le handler
+    renderer = get_renderer()
+    t0 = perf_counter()
+    content = renderer.render(None, data, response_status=status)
+    metrics.add_render(perf_counter() - t0)
+    return HttpResponse(content, status=status, content_type=f"{renderer.media_type}; charset={renderer.charset}")
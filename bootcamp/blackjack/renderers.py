@@ -0,0 +1,68 @@
+import datetime
+import json
+from typing import Any, Optional
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from ninja.renderers import BaseRenderer
+from ninja.responses import NinjaJSONEncoder
+
+try:
+    import orjson
+except ImportError:  # encodeur rapide optionnel : pip install orjson
+    orjson = None
+
+# Rendu JSON des APIs ORM (réponses ninja, projections, flux SSE) ;
+# choisi par settings.BLACKJACK_JSON_RENDERER (sous-classe de StdlibJSONRenderer).
+#
+# Les dates sont au format RFC 3339 d'orjson avec les deux encodeurs :
+# microsecondes complètes, "Z" pour UTC (NinjaJSONEncoder tronquait aux
+# millisecondes ; le refaire en Python coûte plus cher que tout le reste
+# de l'encodage). Ce qu'orjson ne connaît pas est confié à NinjaJSONEncoder.
+
+
+class JSONEncoder(NinjaJSONEncoder):
+    def default(self, o: Any) -> Any:
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            r = o.isoformat()
+            return r[:-6] + "Z" if r.endswith("+00:00") else r
+        return super().default(o)
+
+
+_fallback = JSONEncoder()
+
+
+class StdlibJSONRenderer(BaseRenderer):
+    # renderer par défaut de ninja (json de la stdlib), en bytes
+    media_type = "application/json"
+
+    def dumps(self, data: Any) -> bytes:
+        return json.dumps(data, cls=JSONEncoder).encode()
+
+    def render(self, request, data: Any, *, response_status: int) -> bytes:
+        return self.dumps(data)
+
+
+class FastJSONRenderer(StdlibJSONRenderer):
+    # orjson s'il est installé, sinon json de la stdlib
+    options = 0 if orjson is None else orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, data: Any) -> bytes:
+        if orjson is None:
+            return super().dumps(data)
+        return orjson.dumps(data, default=_fallback.default, option=self.options)
+
+
+_renderer: Optional[BaseRenderer] = None
+
+
+def get_renderer() -> BaseRenderer:
+    global _renderer
+    if _renderer is None:
+        path = getattr(settings, "BLACKJACK_JSON_RENDERER", "blackjack.renderers.FastJSONRenderer")
+        _renderer = import_string(path)()
+    return _renderer
+
+
+def dumps(data: Any) -> bytes:
+    return get_renderer().dumps(data)
@@ -65,6 +65,11 @@ class Msg(Schema):
     detail: str
 
 
+class Conflict(Msg):
+    # 409 ; écriture conditionnelle refusée (If-Match) : version actuelle de la ligne
+    version: Optional[int] = None
+
+
 # ---------- Students ----------
 class StudentIn(Schema):
     name: str
@@ -81,6 +86,12 @@ class StudentOut(Schema):
     created_at: datetime
 
 
+class StudentPage(Schema):
+    # page de KeysetPagination (même forme que @paginate)
+    items: List[StudentOut]
+    next: Optional[str] = None
+
+
 # ---------- Games / Players ----------
 class GameIn(Schema):
     name: str
@@ -98,6 +109,18 @@ class PlayerOut(Schema):
     score: int
     stand: bool
     game_id: int
+    cards: str = ""
+    # à renvoyer dans If-Match pour une écriture conditionnelle
+    version: int = 1
+
+
+class RankedPlayer(PlayerOut):
+    rank: int
+
+
+class LeaderboardQuery(Schema):
+    # GET /leaderboard, GET /games/{gid}/leaderboard
+    limit: int = Field(100, ge=1, le=1000)
 
 
 class GameOut(Schema):
@@ -107,6 +130,10 @@ class GameOut(Schema):
     name: str
     turn: int
     ended: bool
+    player_count: int
+    standing_count: int
+    top_score: int
+    version: int = 1
     # IMPORTANT: pas de liste mutable par défaut
     players: List[PlayerOut] = Field(default_factory=list)
 
@@ -118,8 +145,103 @@ class GameListItem(Schema):
     name: str
     turn: int
     ended: bool
+    player_count: int
+    standing_count: int
+    top_score: int
+    version: int = 1
+
+
+class GamePage(Schema):
+    items: List[GameListItem]
+    next: Optional[str] = None
 
 
 class PlayInput(Schema):
     add_score: Optional[int] = 0
     stand: Optional[bool] = False
+    # tire une carte du sabot du game : le score devient la valeur de la main
+    # (add_score est alors ignoré)
+    hit: Optional[bool] = False
+
+
+class MoveIn(PlayInput):
+    # un coup dans un lot (POST /games/{gid}/moves)
+    player_id: int
+
+
+class MoveOut(Schema):
+    # un coup du journal (GET /games/{gid}/moves), cf. models.Move
+    id: int
+    player_id: Optional[int] = None
+    kind: str
+    value: int
+    name: str
+    created_at: datetime
+
+
+class MovePage(Schema):
+    items: List[MoveOut]
+    next: Optional[str] = None
+
+
+class ReplayQuery(Schema):
+    # état juste après ce coup (id de Move) ; absent : état actuel
+    upto: Optional[int] = Field(None, ge=0)
+
+
+class ReplayPlayer(Schema):
+    id: int
+    name: str
+    score: int
+    stand: bool
+    cards: str
+
+
+class GameReplay(Schema):
+    # état reconstruit depuis le journal (movelog.rebuild)
+    last_move: int
+    turn: int
+    ended: bool
+    players: List[ReplayPlayer]
+
+
+class HintQuery(Schema):
+    # carte visible du croupier, une lettre de engine.RANKS
+    dealer: str = Field(..., pattern="^[A2-9TJQK]$")
+    # False : tables précalculées seulement (strategy.py), sans Monte Carlo
+    simulate: bool = True
+
+
+class HintOut(Schema):
+    action: str             # "hit" ou "stand"
+    basic_strategy: str     # décision des tables précalculées
+    bust_probability: float
+    stand_ev: float
+    hit_ev: float
+    samples: int
+
+
+class CacheStats(Schema):
+    size: int
+    maxsize: int
+    ttl: float
+    hits: int
+    misses: int
+    hit_ratio: float
+    evictions: int
+    expirations: int
+
+
+class WriteBehindStats(Schema):
+    # cf. writebehind.WriteBehindBuffer.stats ; compteurs à 0 tant qu'aucun coup n'est passé
+    enabled: bool
+    pending_players: int = 0
+    pending_games: int = 0
+    backlog_age_ms: float = 0.0   # âge du plus vieux coup pas encore écrit
+    journal_bytes: int = 0
+    flushes: int = 0
+    flushed_rows: int = 0
+    errors: int = 0
+    last_flush_ms: float = 0.0
+    max_flush_ms: float = 0.0
+    avg_flush_ms: float = 0.0
@@ -0,0 +1,538 @@
+import heapq
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from bisect import bisect_left, insort
+from datetime import datetime
+from typing import Any, ContextManager, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from . import engine
+
+
+class Sequence:
+    # Générateur d'ids atomique (remplace les "global SEQ; SEQ += 1",
+    # qui donnent des doublons sous un serveur multi-thread).
+
+    def __init__(self, start: int = 0) -> None:
+        self._value = start
+        self._lock = threading.Lock()
+
+    def next(self) -> int:
+        with self._lock:
+            self._value += 1
+            return self._value
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+
+class ScoreIndex:
+    # Clés (-score, id) triées, pour le classement global des joueurs.
+    # Liste triée découpée en blocs de `load` à 2*`load` clés (principe de
+    # sortedcontainers.SortedList) : ajout / retrait en O(log n + bloc),
+    # et le top-N se lit dans les premiers blocs, sans trier tous les joueurs.
+
+    def __init__(self, keys: Iterable[Tuple[int, int]] = (), load: int = 1000) -> None:
+        self._load = load
+        keys = sorted(keys)
+        self._blocks: List[List[Tuple[int, int]]] = [keys[i:i + load] for i in range(0, len(keys), load)]
+        self._maxes: List[Tuple[int, int]] = [b[-1] for b in self._blocks]
+        self._len = len(keys)
+        self._lock = threading.Lock()
+
+    def _add(self, key: Tuple[int, int]) -> None:
+        if not self._blocks:
+            self._blocks.append([key])
+            self._maxes.append(key)
+        else:
+            i = bisect_left(self._maxes, key)
+            if i == len(self._maxes):
+                # au-delà du dernier bloc : ajout en fin
+                i -= 1
+                self._blocks[i].append(key)
+                self._maxes[i] = key
+            else:
+                insort(self._blocks[i], key)
+            block = self._blocks[i]
+            if len(block) > 2 * self._load:
+                tail = block[self._load:]
+                del block[self._load:]
+                self._maxes[i] = block[-1]
+                self._blocks.insert(i + 1, tail)
+                self._maxes.insert(i + 1, tail[-1])
+        self._len += 1
+
+    def _discard(self, key: Tuple[int, int]) -> bool:
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            return False
+        block = self._blocks[i]
+        j = bisect_left(block, key)
+        if j == len(block) or block[j] != key:
+            return False
+        del block[j]
+        self._len -= 1
+        if not block:
+            del self._blocks[i]
+            del self._maxes[i]
+        elif j == len(block):
+            self._maxes[i] = block[-1]
+        return True
+
+    def add(self, key: Tuple[int, int]) -> None:
+        with self._lock:
+            self._add(key)
+
+    def discard(self, key: Tuple[int, int]) -> bool:
+        with self._lock:
+            return self._discard(key)
+
+    def replace(self, old: Tuple[int, int], new: Tuple[int, int]) -> None:
+        # changement de score : retrait + ajout sous le même verrou
+        with self._lock:
+            self._discard(old)
+            self._add(new)
+
+    def first(self, n: int) -> List[Tuple[int, int]]:
+        out: List[Tuple[int, int]] = []
+        with self._lock:
+            for block in self._blocks:
+                if len(out) >= n:
+                    break
+                out.extend(block[:n - len(out)])
+        return out
+
+    def __len__(self) -> int:
+        return self._len
+
+
+def score_key(p: Dict[str, Any]) -> Tuple[int, int]:
+    # ordre des classements : meilleur score d'abord, puis le plus ancien joueur
+    return -p["score"], p["id"]
+
+
+def ranked(players: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # joueurs déjà triés par score_key -> ajoute "rank" (ex aequo : 1, 2, 2, 4)
+    out: List[Dict[str, Any]] = []
+    for pos, p in enumerate(players, 1):
+        rank = out[-1]["rank"] if out and out[-1]["score"] == p["score"] else pos
+        out.append({**p, "rank": rank})
+    return out
+
+
+# =========================
+#  BACKENDS
+# =========================
+class StoreBackend(ABC):
+    # Stockage des stores mémoire ci-dessous, en primitives à la Redis ;
+    # choisi par settings.BLACKJACK_STORE_BACKEND (cf. get_backend) :
+    #   LocalBackend         dicts du process (un état par worker)
+    #   SharedMemoryBackend  fichier mmap partagé par les workers d'une machine (store_shm.py)
+    #   RedisBackend         serveur RESP partagé entre machines (store_redis.py)
+    #
+    # tables : enregistrements par clé ; les lectures renvoient des copies,
+    #          on les modifie puis on les réécrit avec hset (sous lock()).
+    # listes : ids dans l'ordre d'ajout (joueurs d'un game).
+    # zsets  : ids classés par (-score, id) (classement global).
+
+    @abstractmethod
+    def incr(self, name: str) -> int:
+        ...
+
+    @abstractmethod
+    def lock(self, name: str) -> ContextManager:
+        # verrou exclusif nommé, partagé par tous les utilisateurs du backend
+        ...
+
+    @abstractmethod
+    def hget(self, table: str, key: Any) -> Optional[Any]:
+        ...
+
+    def hmget(self, table: str, keys: Iterable[Any]) -> List[Optional[Any]]:
+        return [self.hget(table, k) for k in keys]
+
+    @abstractmethod
+    def hset(self, table: str, key: Any, value: Any) -> None:
+        ...
+
+    @abstractmethod
+    def hsetnx(self, table: str, key: Any, value: Any) -> bool:
+        # écrit seulement si la clé est libre (atomique) ; False sinon
+        ...
+
+    @abstractmethod
+    def hdel(self, table: str, key: Any) -> bool:
+        ...
+
+    @abstractmethod
+    def hvals(self, table: str) -> List[Any]:
+        # valeurs dans l'ordre des clés
+        ...
+
+    @abstractmethod
+    def hlen(self, table: str) -> int:
+        ...
+
+    @abstractmethod
+    def rpush(self, name: str, member: int) -> None:
+        ...
+
+    @abstractmethod
+    def lrem(self, name: str, member: int) -> None:
+        ...
+
+    @abstractmethod
+    def lrange(self, name: str) -> List[int]:
+        ...
+
+    @abstractmethod
+    def zadd(self, name: str, member: int, score: int) -> None:
+        ...
+
+    @abstractmethod
+    def zrem(self, name: str, member: int) -> None:
+        ...
+
+    @abstractmethod
+    def ztop(self, name: str, n: int) -> List[int]:
+        ...
+
+    @abstractmethod
+    def clear(self) -> None:
+        ...
+
+
+def _copy(value: Any) -> Any:
+    return dict(value) if isinstance(value, dict) else value
+
+
+class LocalBackend(StoreBackend):
+    # Dicts du process : le plus rapide, mais chaque worker a son propre état.
+    # lock() : `stripes` verrous choisis par hash du nom, deux games
+    # différents ne se bloquent donc (presque) jamais.
+
+    def __init__(self, stripes: int = 64) -> None:
+        self._tables: Dict[str, Dict[Any, Any]] = {}
+        self._lists: Dict[str, Dict[int, None]] = {}  # un dict sert d'ensemble ordonné
+        self._zsets: Dict[str, Tuple[ScoreIndex, Dict[int, int], threading.Lock]] = {}
+        self._seqs: Dict[str, Sequence] = {}
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._meta_lock = threading.Lock()  # création des tables, séquences...
+
+    def _get(self, registry: Dict[str, Any], name: str, factory) -> Any:
+        obj = registry.get(name)
+        if obj is None:
+            with self._meta_lock:
+                obj = registry.get(name)
+                if obj is None:
+                    obj = registry[name] = factory()
+        return obj
+
+    def incr(self, name: str) -> int:
+        return self._get(self._seqs, name, Sequence).next()
+
+    def lock(self, name: str) -> ContextManager:
+        return self._locks[zlib.crc32(name.encode()) % len(self._locks)]
+
+    def hget(self, table: str, key: Any) -> Optional[Any]:
+        return _copy(self._tables.get(table, {}).get(key))
+
+    def hset(self, table: str, key: Any, value: Any) -> None:
+        self._get(self._tables, table, dict)[key] = value
+
+    def hsetnx(self, table: str, key: Any, value: Any) -> bool:
+        # dict.setdefault est atomique (GIL)
+        return self._get(self._tables, table, dict).setdefault(key, value) is value
+
+    def hdel(self, table: str, key: Any) -> bool:
+        return self._tables.get(table, {}).pop(key, None) is not None
+
+    def hvals(self, table: str) -> List[Any]:
+        # ordre d'insertion (ids croissants des Sequence)
+        return [_copy(v) for v in list(self._tables.get(table, {}).values())]
+
+    def hlen(self, table: str) -> int:
+        return len(self._tables.get(table, ()))
+
+    def rpush(self, name: str, member: int) -> None:
+        self._get(self._lists, name, dict)[member] = None
+
+    def lrem(self, name: str, member: int) -> None:
+        self._lists.get(name, {}).pop(member, None)
+
+    def lrange(self, name: str) -> List[int]:
+        return list(self._lists.get(name, ()))
+
+    def _zset(self, name: str) -> Tuple[ScoreIndex, Dict[int, int], threading.Lock]:
+        return self._get(self._zsets, name, lambda: (ScoreIndex(), {}, threading.Lock()))
+
+    def zadd(self, name: str, member: int, score: int) -> None:
+        index, scores, lock = self._zset(name)
+        with lock:
+            old = scores.get(member)
+            if old is None:
+                index.add((-score, member))
+            else:
+                index.replace((-old, member), (-score, member))
+            scores[member] = score
+
+    def zrem(self, name: str, member: int) -> None:
+        index, scores, lock = self._zset(name)
+        with lock:
+            old = scores.pop(member, None)
+            if old is not None:
+                index.discard((-old, member))
+
+    def ztop(self, name: str, n: int) -> List[int]:
+        return [member for _, member in self._zset(name)[0].first(n)]
+
+    def clear(self) -> None:
+        with self._meta_lock:
+            self._tables.clear()
+            self._lists.clear()
+            self._zsets.clear()
+            self._seqs.clear()
+
+
+_backend: Optional[StoreBackend] = None
+
+
+def get_backend() -> StoreBackend:
+    # backend partagé des stores de l'API mémoire (api.py)
+    global _backend
+    if _backend is None:
+        path = getattr(settings, "BLACKJACK_STORE_BACKEND", "blackjack.store.LocalBackend")
+        _backend = import_string(path)(**getattr(settings, "BLACKJACK_STORE_OPTIONS", {}))
+    return _backend
+
+
+# =========================
+#  STUDENTS (mémoire)
+# =========================
+class StudentStore:
+    # Table "students" du backend, id -> student.
+    # index_email=True ajoute un index email -> id (table "student_emails")
+    # pour les contrôles de doublons.
+
+    def __init__(self, backend: Optional[StoreBackend] = None, index_email: bool = False) -> None:
+        self.backend = backend or LocalBackend()
+        self.index_email = index_email
+
+    @staticmethod
+    def _email_key(email: str) -> str:
+        return email.strip().lower()
+
+    def create(self, name: str, email: str) -> Optional[Dict[str, Any]]:
+        # Avec l'index email : None si l'email est déjà pris. La réservation
+        # de l'email (hsetnx, atomique) précède l'insertion : un seul gagnant.
+        item = {
+            "id": self.backend.incr("students"),
+            "name": name,
+            "email": email,
+            "created_at": datetime.utcnow(),
+        }
+        if self.index_email and not self.backend.hsetnx("student_emails", self._email_key(email), item["id"]):
+            return None
+        self.backend.hset("students", item["id"], item)
+        return item
+
+    def get(self, pk: int) -> Optional[Dict[str, Any]]:
+        return self.backend.hget("students", pk)
+
+    def list(self) -> List[Dict[str, Any]]:
+        return self.backend.hvals("students")
+
+    def delete(self, pk: int) -> bool:
+        item = self.backend.hget("students", pk)
+        if item is None or not self.backend.hdel("students", pk):
+            return False
+        if self.index_email:
+            self.backend.hdel("student_emails", self._email_key(item["email"]))
+        return True
+
+    def get_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        key = self._email_key(email)
+        if self.index_email:
+            pk = self.backend.hget("student_emails", key)
+            return self.get(pk) if pk is not None else None
+        # sans index : parcours linéaire
+        for s in self.list():
+            if self._email_key(s["email"]) == key:
+                return s
+        return None
+
+    def __len__(self) -> int:
+        return self.backend.hlen("students")
+
+
+# =========================
+#  GAMES & PLAYERS (mémoire)
+# =========================
+class GameStore:
+    # Games et joueurs dans le backend :
+    #   tables "games" / "players" (id -> dict), "shoes" (game id -> sabot)
+    #   liste  "game_players:<gid>" : joueurs d'un game, lus en O(joueurs du game)
+    #   zset   "scores"             : classement global
+    #
+    # Chaque mutation d'un game (et de ses joueurs) se fait sous le verrou
+    # "game:<gid>" du backend : atomique pour tous les threads / workers
+    # qui partagent ce backend. Les lectures renvoient des copies.
+
+    def __init__(self, backend: Optional[StoreBackend] = None, stripes: int = 64, decks: int = 6) -> None:
+        self.backend = backend or LocalBackend(stripes)
+        self.decks = decks
+
+    def lock_for(self, gid: int) -> ContextManager:
+        return self.backend.lock(f"game:{gid}")
+
+    # ---- Games ----
+    def create_game(self, name: str) -> Dict[str, Any]:
+        g = {
+            "id": self.backend.incr("games"),
+            "name": name,
+            "turn": 0,
+            "ended": False,
+        }
+        self.backend.hset("games", g["id"], g)
+        return g
+
+    def get_game(self, gid: int) -> Optional[Dict[str, Any]]:
+        return self.backend.hget("games", gid)
+
+    def list_games(self) -> List[Dict[str, Any]]:
+        return self.backend.hvals("games")
+
+    def update_game(self, gid: int, **fields: Any) -> Optional[Dict[str, Any]]:
+        # start / end : met à jour turn / ended sous le verrou du game
+        with self.lock_for(gid):
+            g = self.backend.hget("games", gid)
+            if g is None:
+                return None
+            g.update(fields)
+            self.backend.hset("games", gid, g)
+            return g
+
+    def _players_of(self, gid: int) -> List[Dict[str, Any]]:
+        return [p for p in self.backend.hmget("players", self.backend.lrange(f"game_players:{gid}")) if p]
+
+    def game_detail(self, gid: int) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+        # game + ses joueurs, lus de façon cohérente
+        with self.lock_for(gid):
+            g = self.backend.hget("games", gid)
+            if g is None:
+                return None, []
+            return g, self._players_of(gid)
+
+    # ---- Players ----
+    def add_player(self, gid: int, name: str) -> Dict[str, Any]:
+        p = {
+            "id": self.backend.incr("players"),
+            "name": name,
+            "score": 0,
+            "stand": False,
+            "game_id": gid,
+            "cards": "",
+        }
+        with self.lock_for(gid):
+            # backend plein (cf. SharedMemoryBackend) : l'écriture qui échoue
+            # lève avant d'écrire, les précédentes sont annulées
+            self.backend.rpush(f"game_players:{gid}", p["id"])
+            try:
+                self.backend.zadd("scores", p["id"], 0)
+                self.backend.hset("players", p["id"], p)
+            except Exception:
+                self.backend.zrem("scores", p["id"])
+                self.backend.lrem(f"game_players:{gid}", p["id"])
+                raise
+            return p
+
+    def get_player(self, pid: int) -> Optional[Dict[str, Any]]:
+        return self.backend.hget("players", pid)
+
+    def remove_player(self, pid: int) -> bool:
+        p = self.backend.hget("players", pid)
+        if p is None:
+            return False
+        with self.lock_for(p["game_id"]):
+            if not self.backend.hdel("players", pid):
+                return False
+            self.backend.lrem(f"game_players:{p['game_id']}", pid)
+            self.backend.zrem("scores", pid)
+            return True
+
+    def _shoe(self, gid: int) -> Optional[engine.Shoe]:
+        shoe = self.backend.hget("shoes", gid)
+        return engine.Shoe.from_bytes(shoe["cards"], shoe["pos"]) if shoe else None
+
+    def _deal(self, gid: int) -> int:
+        # une carte du sabot du game (sous son verrou), sabot neuf à la coupe
+        shoe = self._shoe(gid)
+        if shoe is None or shoe.needs_shuffle():
+            shoe = engine.Shoe.new(self.decks)
+        card = shoe.deal()[0]
+        self.backend.hset("shoes", gid, {"cards": shoe.to_bytes(), "pos": shoe.pos})
+        return card
+
+    def shoe_counts(self, gid: int) -> Optional[List[int]]:
+        # composition du sabot pour le prochain tirage (sabot neuf s'il doit être
+        # remélangé, cf. _deal), None si le game n'existe pas
+        with self.lock_for(gid):
+            if self.backend.hget("games", gid) is None:
+                return None
+            shoe = self._shoe(gid)
+            if shoe is None or shoe.needs_shuffle():
+                return engine.Shoe.full_counts(self.decks)
+            return [int(c) for c in shoe.remaining()]
+
+    def play(self, gid: int, pid: int, add_score: int = 0, stand: bool = False,
+             hit: bool = False) -> Optional[Dict[str, Any]]:
+        # read-modify-write du score et du tour, atomique pour ce game.
+        # None si le joueur n'existe pas (ou plus) dans ce game.
+        # hit : une carte du sabot, le score devient la valeur de la main
+        # (sans effet si le joueur s'est déjà arrêté).
+        with self.lock_for(gid):
+            game = self.backend.hget("games", gid)
+            player = self.backend.hget("players", pid)
+            if game is None or player is None or player["game_id"] != gid:
+                return None
+            score, turn = player["score"], game["turn"]
+            if hit:
+                if not player["stand"]:
+                    codes = engine.parse_cards(player["cards"]) + [self._deal(gid)]
+                    player["cards"] = engine.format_cards(codes)
+                    player["score"], _ = engine.hand_value(codes)
+                    player["stand"] = player["score"] >= 21
+                    game["turn"] += 1
+            elif add_score:
+                player["score"] = max(0, player["score"] + int(add_score))
+                game["turn"] += 1
+            if stand:
+                player["stand"] = True
+            self.backend.hset("players", pid, player)
+            if game["turn"] != turn:
+                self.backend.hset("games", gid, game)
+            if player["score"] != score:
+                self.backend.zadd("scores", pid, player["score"])
+            return player
+
+    def game_players(self, gid: int) -> List[Dict[str, Any]]:
+        # ordre d'ajout des joueurs
+        return self.game_detail(gid)[1]
+
+    # ---- Classements ----
+    def top_players(self, n: int) -> List[Dict[str, Any]]:
+        # top-N global, lu dans le zset "scores"
+        # (None : joueur retiré entre-temps)
+        return [p for p in self.backend.hmget("players", self.backend.ztop("scores", n)) if p]
+
+    def game_ranking(self, gid: int, n: int) -> Optional[List[Dict[str, Any]]]:
+        # n meilleurs joueurs d'un game (tas borné : O(joueurs du game . log n)),
+        # None si le game n'existe pas
+        with self.lock_for(gid):
+            if self.backend.hget("games", gid) is None:
+                return None
+            return heapq.nsmallest(n, self._players_of(gid), key=score_key)
@@ -0,0 +1,341 @@
+import pickle
+import socket
+import socketserver
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional
+
+from .store import StoreBackend
+
+# Backend des stores mémoire sur un serveur Redis (ou compatible : KeyDB,
+# Dragonfly...) : état partagé entre workers et entre machines.
+#
+# Client RESP minimal (une connexion par thread), pour ne pas ajouter de
+# dépendance : seules les quelques commandes ci-dessous sont utilisées.
+# Valeurs picklées ; clés préfixées par `prefix`.
+#   tables  HSET <prefix><table> <clé> <valeur>   (ids zéro-paddés : HGETALL trié = ordre des ids)
+#   listes  RPUSH / LREM / LRANGE
+#   zsets   ZADD avec -score, membres zéro-paddés : ZRANGE = ordre (-score, id)
+#   verrous SET NX PX (expirent si le worker meurt), rendus par UNLOCK_SCRIPT
+#
+# LocalRedisServer implémente ces commandes en mémoire : tests et bench sans
+# serveur Redis (python -m blackjack.store_redis --port 6379).
+
+
+class RedisError(Exception):
+    pass
+
+
+class LockTimeout(RedisError):
+    # verrou toujours tenu par un autre worker après acquire_timeout
+    pass
+
+
+class LockExpired(RedisError):
+    # section critique plus longue que lock_timeout : le verrou a expiré
+    # pendant le travail, un autre worker a pu le prendre entre-temps
+    pass
+
+
+# libération atomique d'un verrou : seulement s'il porte encore notre jeton
+# (expiré puis repris par un autre worker entre un GET et un DEL, sinon)
+UNLOCK_SCRIPT = b"if redis.call('get',KEYS[1])==ARGV[1] then return redis.call('del',KEYS[1]) end return 0"
+
+
+def _field(key: Any) -> bytes:
+    return b"%020d" % key if isinstance(key, int) else str(key).encode()
+
+
+class _Connection:
+    def __init__(self, host: str, port: int, db: int) -> None:
+        self.sock = socket.create_connection((host, port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+        if db:
+            self.execute(b"SELECT", db)
+
+    def execute(self, *args: Any) -> Any:
+        out = [b"*%d\r\n" % len(args)]
+        for a in args:
+            a = a if isinstance(a, bytes) else str(a).encode()
+            out.append(b"$%d\r\n%s\r\n" % (len(a), a))
+        self.sock.sendall(b"".join(out))
+        return self._reply()
+
+    def _reply(self) -> Any:
+        line = self.reader.readline()
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest
+        if kind == b"-":
+            raise RedisError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            n = int(rest)
+            if n < 0:
+                return None
+            data = self.reader.read(n + 2)
+            return data[:-2]
+        if kind == b"*":
+            n = int(rest)
+            return None if n < 0 else [self._reply() for _ in range(n)]
+        raise RedisError(f"réponse illisible : {line!r}")
+
+
+class RedisBackend(StoreBackend):
+
+    def __init__(self, host: str = "localhost", port: int = 6379, db: int = 0,
+                 prefix: str = "blackjack:", lock_timeout: float = 5.0, acquire_timeout: float = 10.0) -> None:
+        self.host, self.port, self.db = host, port, db
+        self.prefix = prefix.encode()
+        self.lock_timeout = lock_timeout
+        self.acquire_timeout = acquire_timeout
+        self._local = threading.local()
+
+    def _conn(self) -> _Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = _Connection(self.host, self.port, self.db)
+        return conn
+
+    def _execute(self, *args: Any) -> Any:
+        return self._conn().execute(*args)
+
+    def _key(self, name: str) -> bytes:
+        return self.prefix + name.encode()
+
+    def incr(self, name: str) -> int:
+        return self._execute(b"INCR", self._key("seq:" + name))
+
+    @contextmanager
+    def lock(self, name: str):
+        # Verrou expirant : un worker tué ne bloque pas le game plus de
+        # lock_timeout. Il n'est pas prolongé : la section critique doit tenir
+        # en moins de lock_timeout (celles de GameStore : quelques commandes),
+        # sinon LockExpired à la sortie. Attente bornée : LockTimeout après
+        # acquire_timeout.
+        key, token = self._key("lock:" + name), uuid.uuid4().hex
+        ttl = int(self.lock_timeout * 1000)
+        deadline = time.monotonic() + self.acquire_timeout
+        delay = 0.0005
+        while self._execute(b"SET", key, token, b"NX", b"PX", ttl) is None:
+            if time.monotonic() >= deadline:
+                raise LockTimeout(f"verrou {name} non obtenu en {self.acquire_timeout} s")
+            time.sleep(delay)
+            delay = min(delay * 2, 0.01)
+        try:
+            yield
+        finally:
+            released = self._execute(b"EVAL", UNLOCK_SCRIPT, 1, key, token)
+        if not released:
+            raise LockExpired(f"verrou {name} expiré pendant la section critique (> {self.lock_timeout} s)")
+
+    def hget(self, table: str, key: Any) -> Optional[Any]:
+        data = self._execute(b"HGET", self._key(table), _field(key))
+        return None if data is None else pickle.loads(data)
+
+    def hmget(self, table: str, keys: Iterable[Any]) -> List[Optional[Any]]:
+        fields = [_field(k) for k in keys]
+        if not fields:
+            return []
+        return [None if d is None else pickle.loads(d) for d in self._execute(b"HMGET", self._key(table), *fields)]
+
+    def hset(self, table: str, key: Any, value: Any) -> None:
+        self._execute(b"HSET", self._key(table), _field(key), pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+    def hsetnx(self, table: str, key: Any, value: Any) -> bool:
+        return bool(self._execute(b"HSETNX", self._key(table), _field(key),
+                                  pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+
+    def hdel(self, table: str, key: Any) -> bool:
+        return bool(self._execute(b"HDEL", self._key(table), _field(key)))
+
+    def hvals(self, table: str) -> List[Any]:
+        flat = self._execute(b"HGETALL", self._key(table))
+        pairs = sorted(zip(flat[::2], flat[1::2]))
+        return [pickle.loads(v) for _, v in pairs]
+
+    def hlen(self, table: str) -> int:
+        return self._execute(b"HLEN", self._key(table))
+
+    def rpush(self, name: str, member: int) -> None:
+        self._execute(b"RPUSH", self._key(name), member)
+
+    def lrem(self, name: str, member: int) -> None:
+        self._execute(b"LREM", self._key(name), 0, member)
+
+    def lrange(self, name: str) -> List[int]:
+        return [int(m) for m in self._execute(b"LRANGE", self._key(name), 0, -1)]
+
+    def zadd(self, name: str, member: int, score: int) -> None:
+        self._execute(b"ZADD", self._key(name), -score, _field(member))
+
+    def zrem(self, name: str, member: int) -> None:
+        self._execute(b"ZREM", self._key(name), _field(member))
+
+    def ztop(self, name: str, n: int) -> List[int]:
+        if n <= 0:
+            return []
+        return [int(m) for m in self._execute(b"ZRANGE", self._key(name), 0, n - 1)]
+
+    def clear(self) -> None:
+        keys = self._execute(b"KEYS", self.prefix + b"*")
+        if keys:
+            self._execute(b"DEL", *keys)
+
+
+# =========================
+#  Serveur local (tests, bench)
+# =========================
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self) -> None:
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = [self.rfile.read(int(self.rfile.readline()[1:-2]) + 2)[:-2] for _ in range(int(line[1:-2]))]
+            try:
+                with self.server.lock:
+                    reply = self.server.execute(args[0].upper().decode(), args[1:])
+            except Exception as e:
+                self.wfile.write(b"-ERR %s\r\n" % str(e).encode())
+            else:
+                self.wfile.write(self._encode(reply))
+
+    def _encode(self, value: Any) -> bytes:
+        if value is True:
+            return b"+OK\r\n"
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if isinstance(value, bytes):
+            return b"$%d\r\n%s\r\n" % (len(value), value)
+        return b"*%d\r\n" % len(value) + b"".join(map(self._encode, value))
+
+
+class LocalRedisServer(socketserver.ThreadingTCPServer):
+    # Sous-ensemble de Redis utilisé par RedisBackend, une commande à la fois.
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        super().__init__((host, port), _Handler)
+        self.lock = threading.Lock()
+        self.data: Dict[bytes, Any] = {}
+        self.expires: Dict[bytes, float] = {}
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self) -> "LocalRedisServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def _get(self, key: bytes, default=None) -> Any:
+        if key in self.expires and self.expires[key] <= time.monotonic():
+            del self.expires[key]
+            del self.data[key]
+        return self.data.get(key, default)
+
+    def execute(self, cmd: str, args: List[bytes]) -> Any:
+        d = self.data
+        if cmd == "PING":
+            return True
+        if cmd == "SELECT" or cmd == "FLUSHDB":
+            if cmd == "FLUSHDB":
+                d.clear()
+                self.expires.clear()
+            return True
+        if cmd == "GET":
+            return self._get(args[0])
+        if cmd == "SET":
+            key, value, opts = args[0], args[1], [a.upper() for a in args[2:]]
+            if b"NX" in opts and self._get(key) is not None:
+                return None
+            d[key] = value
+            self.expires.pop(key, None)
+            if b"PX" in opts:
+                self.expires[key] = time.monotonic() + int(opts[opts.index(b"PX") + 1]) / 1000
+            return True
+        if cmd == "DEL":
+            removed = 0
+            for key in args:
+                self.expires.pop(key, None)
+                removed += d.pop(key, None) is not None
+            return removed
+        if cmd == "EVAL":
+            # seul script connu : UNLOCK_SCRIPT (exécuté sous self.lock, donc atomique)
+            if args[0] != UNLOCK_SCRIPT or args[1] != b"1":
+                raise RedisError("unknown script")
+            if self._get(args[2]) != args[3]:
+                return 0
+            return self.execute("DEL", [args[2]])
+        if cmd == "INCR":
+            value = int(self._get(args[0], b"0")) + 1
+            d[args[0]] = b"%d" % value
+            return value
+        if cmd == "KEYS":
+            prefix = args[0].rstrip(b"*")
+            return [k for k in list(d) if k.startswith(prefix) and self._get(k) is not None]
+
+        key = args[0]
+        if cmd.startswith("H"):
+            h = self._get(key, {})
+            if cmd == "HGET":
+                return h.get(args[1])
+            if cmd == "HMGET":
+                return [h.get(f) for f in args[1:]]
+            if cmd == "HSET" or cmd == "HSETNX":
+                if cmd == "HSETNX" and args[1] in h:
+                    return 0
+                new = args[1] not in h
+                d.setdefault(key, h)[args[1]] = args[2]
+                return int(new)
+            if cmd == "HDEL":
+                return sum(h.pop(f, None) is not None for f in args[1:])
+            if cmd == "HGETALL":
+                return [x for item in h.items() for x in item]
+            if cmd == "HLEN":
+                return len(h)
+        if cmd in ("RPUSH", "LREM", "LRANGE"):
+            lst = self._get(key, [])
+            if cmd == "RPUSH":
+                d.setdefault(key, lst).extend(args[1:])
+                return len(lst)
+            if cmd == "LREM":
+                kept = [m for m in lst if m != args[2]]
+                d[key] = kept
+                return len(lst) - len(kept)
+            start, stop = int(args[1]), int(args[2])
+            return lst[start:None if stop == -1 else stop + 1]
+        if cmd in ("ZADD", "ZREM", "ZRANGE"):
+            z = self._get(key, {})
+            if cmd == "ZADD":
+                new = args[2] not in z
+                d.setdefault(key, z)[args[2]] = float(args[1])
+                return int(new)
+            if cmd == "ZREM":
+                return sum(z.pop(m, None) is not None for m in args[1:])
+            start, stop = int(args[1]), int(args[2])
+            members = sorted(z, key=lambda m: (z[m], m))
+            return members[start:None if stop == -1 else stop + 1]
+        raise RedisError(f"unknown command '{cmd}'")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serveur compatible Redis minimal (RedisBackend)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    server = LocalRedisServer(args.host, args.port)
+    print(f"listening on {args.host}:{server.port}")
+    server.serve_forever()
@@ -0,0 +1,285 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import Any, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .store import StoreBackend
+
+# Backend des stores mémoire dans un fichier mmap partagé (par défaut sous
+# /dev/shm, donc en RAM) : tous les workers gunicorn d'une machine voient les
+# mêmes games. Chaque worker ouvre le fichier ; le premier le crée (rempli de
+# zéros = vide).
+#
+# Disposition du fichier :
+#   en-tête   magic + géométrie (vérifiée à l'ouverture)
+#   slots     table de hachage à adressage ouvert (sondage linéaire), commune
+#             à toutes les tables : un enregistrement par slot, picklé
+#   zsets     deux tableaux int64 par zset déclaré, de zset_size cases :
+#             score + _ZBIAS et id du membre + 1 (0 = case libre), en table de
+#             hachage par id (sondage linéaire) : les ids ne sont pas bornés,
+#             seul le nombre de membres présents l'est
+#
+# Verrous : fcntl.lockf sur des octets du fichier (au-delà de sa taille),
+# doublés d'un threading.Lock (les verrous POSIX sont par process, pas par
+# thread). L'octet 0 protège les données ; lock(name) prend un des `stripes`
+# octets suivants.
+
+MAGIC = b"BJSTORE2"
+_HEADER = struct.Struct("<8sIIII")  # magic, slots, slot_size, zsets, zset_size
+_SLOT = struct.Struct("<BxHqI")  # état, table, hash de la clé, taille des données
+EMPTY, USED, DELETED = 0, 1, 2
+_ZBIAS = 1 << 40
+_LOCK_BASE = 1 << 40  # octets de verrou, loin des données
+
+
+def _hash(key: Any) -> int:
+    if isinstance(key, int):
+        return key
+    return int.from_bytes(hashlib.blake2b(str(key).encode(), digest_size=8).digest(), "little", signed=True)
+
+
+class SharedMemoryBackend(StoreBackend):
+    # Limites : un enregistrement (liste de joueurs d'un game comprise) doit
+    # tenir dans un slot, un zset compte au plus zset_size membres à la fois
+    # (ids quelconques < 2**32). Au-delà, ValueError levée avant toute écriture.
+
+    def __init__(self, path: str = "/dev/shm/blackjack-store", slots: int = 65536, slot_size: int = 1024,
+                 zsets: Iterable[str] = ("scores",), zset_size: Optional[int] = None, stripes: int = 64) -> None:
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self.zset_size = zset_size or slots
+        self._zsets = {name: i for i, name in enumerate(zsets)}
+        self._stripes = stripes
+        self._slots_at = mmap.PAGESIZE
+        self._zsets_at = self._slots_at + slots * slot_size
+        size = self._zsets_at + len(self._zsets) * self.zset_size * 16
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._lock = threading.Lock()
+        self._stripe_locks = [threading.Lock() for _ in range(stripes)]
+        header = _HEADER.pack(MAGIC, slots, slot_size, len(self._zsets), self.zset_size)
+        with self._data():
+            if os.fstat(self._fd).st_size == 0:
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, header, 0)
+            elif os.pread(self._fd, _HEADER.size, 0) != header:
+                raise ValueError(f"{path}: store créé avec une autre géométrie")
+        self._mm = mmap.mmap(self._fd, size)
+        self._headers = np.ndarray(slots, dtype=np.dtype({
+            "names": ["state", "table"], "formats": ["u1", "<u2"], "offsets": [0, 2], "itemsize": slot_size,
+        }), buffer=self._mm, offset=self._slots_at)
+
+    # ---- Verrous ----
+    @contextmanager
+    def _file_lock(self, thread_lock: threading.Lock, offset: int):
+        with thread_lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, _LOCK_BASE + offset)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, _LOCK_BASE + offset)
+
+    def _data(self):
+        return self._file_lock(self._lock, 0)
+
+    def lock(self, name: str):
+        stripe = zlib.crc32(name.encode()) % self._stripes
+        return self._file_lock(self._stripe_locks[stripe], 1 + stripe)
+
+    # ---- Slots ----
+    def _tag(self, table: str) -> int:
+        return zlib.crc32(table.encode()) & 0xFFFF
+
+    def _read(self, i: int) -> Tuple[Any, Any, Any]:
+        at = self._slots_at + i * self.slot_size
+        size = _SLOT.unpack_from(self._mm, at)[3]
+        return pickle.loads(self._mm[at + _SLOT.size:at + _SLOT.size + size])
+
+    def _find(self, table: str, key: Any) -> Tuple[Optional[int], Optional[int]]:
+        # (slot de la clé ou None, premier slot libre du sondage)
+        tag, h = self._tag(table), _hash(key)
+        free = None
+        # ids consécutifs de plusieurs tables : on mélange (table, hash) avant
+        # le modulo, sinon les tables se chevauchent en une seule longue grappe
+        i = (((h ^ (tag << 48)) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> 16
+        i %= self.slots
+        for _ in range(self.slots):
+            state, slot_tag, slot_hash, _ = _SLOT.unpack_from(self._mm, self._slots_at + i * self.slot_size)
+            if state == EMPTY:
+                return None, i if free is None else free
+            if state == DELETED:
+                if free is None:
+                    free = i
+            elif slot_tag == tag and slot_hash == h and self._read(i)[:2] == (table, key):
+                return i, free
+            i = (i + 1) % self.slots
+        return None, free
+
+    def _put(self, table: str, key: Any, value: Any) -> None:
+        data = pickle.dumps((table, key, value), pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.slot_size - _SLOT.size:
+            raise ValueError(f"enregistrement de {len(data)} octets : slot_size={self.slot_size} trop petit")
+        i, free = self._find(table, key)
+        if i is None:
+            if free is None:
+                raise ValueError(f"{self.path}: store plein ({self.slots} slots)")
+            i = free
+        at = self._slots_at + i * self.slot_size
+        self._mm[at + _SLOT.size:at + _SLOT.size + len(data)] = data
+        _SLOT.pack_into(self._mm, at, USED, self._tag(table), _hash(key), len(data))
+
+    def _get(self, table: str, key: Any) -> Optional[Any]:
+        i, _ = self._find(table, key)
+        return None if i is None else self._read(i)[2]
+
+    def _delete(self, table: str, key: Any) -> bool:
+        i, _ = self._find(table, key)
+        if i is None:
+            return False
+        self._mm[self._slots_at + i * self.slot_size] = DELETED
+        return True
+
+    # ---- Primitives ----
+    def incr(self, name: str) -> int:
+        with self._data():
+            value = (self._get("_seq", name) or 0) + 1
+            self._put("_seq", name, value)
+            return value
+
+    def hget(self, table: str, key: Any) -> Optional[Any]:
+        with self._data():
+            return self._get(table, key)
+
+    def hmget(self, table: str, keys: Iterable[Any]) -> List[Optional[Any]]:
+        with self._data():
+            return [self._get(table, k) for k in keys]
+
+    def hset(self, table: str, key: Any, value: Any) -> None:
+        with self._data():
+            self._put(table, key, value)
+
+    def hsetnx(self, table: str, key: Any, value: Any) -> bool:
+        with self._data():
+            if self._find(table, key)[0] is not None:
+                return False
+            self._put(table, key, value)
+            return True
+
+    def hdel(self, table: str, key: Any) -> bool:
+        with self._data():
+            return self._delete(table, key)
+
+    def _scan(self, table: str) -> List[Tuple[Any, Any, Any]]:
+        # en-têtes lus d'un coup (vue numpy), seuls les slots de la table sont dépicklés
+        used = np.flatnonzero((self._headers["state"] == USED) & (self._headers["table"] == self._tag(table)))
+        return [rec for rec in map(self._read, used.tolist()) if rec[0] == table]
+
+    def hvals(self, table: str) -> List[Any]:
+        with self._data():
+            return [value for _, _, value in sorted(self._scan(table), key=lambda rec: rec[1])]
+
+    def hlen(self, table: str) -> int:
+        with self._data():
+            return len(self._scan(table))
+
+    # listes : un enregistrement (liste d'ids) de la table "_list"
+    def rpush(self, name: str, member: int) -> None:
+        with self._data():
+            self._put("_list", name, (self._get("_list", name) or []) + [member])
+
+    def lrem(self, name: str, member: int) -> None:
+        with self._data():
+            members = self._get("_list", name)
+            if members and member in members:
+                members.remove(member)
+                self._put("_list", name, members)
+
+    def lrange(self, name: str) -> List[int]:
+        with self._data():
+            return self._get("_list", name) or []
+
+    def _zset(self, name: str) -> Tuple[np.ndarray, np.ndarray]:
+        # (scores, membres)
+        arrays = np.ndarray((2, self.zset_size), dtype=np.int64, buffer=self._mm,
+                            offset=self._zsets_at + self._zsets[name] * self.zset_size * 16)
+        return arrays[0], arrays[1]
+
+    def _zhome(self, member: int) -> int:
+        return (((member * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> 16) % self.zset_size
+
+    def _zfind(self, members: np.ndarray, member: int) -> Tuple[int, bool]:
+        # (case du membre, True), sinon (première case vide du sondage, False) ;
+        # -1 si le zset est plein
+        i = self._zhome(member)
+        for _ in range(self.zset_size):
+            m = members[i]
+            if m == 0:
+                return i, False
+            if m == member + 1:
+                return i, True
+            i = (i + 1) % self.zset_size
+        return -1, False
+
+    def zadd(self, name: str, member: int, score: int) -> None:
+        if not 0 <= member < 1 << 32:
+            raise ValueError(f"membre {member} hors des ids d'un zset")
+        with self._data():
+            scores, members = self._zset(name)
+            i, found = self._zfind(members, member)
+            if i < 0:
+                raise ValueError(f"zset {name} plein (zset_size={self.zset_size})")
+            if not found:
+                members[i] = member + 1
+            scores[i] = score + _ZBIAS
+
+    def zrem(self, name: str, member: int) -> None:
+        with self._data():
+            scores, members = self._zset(name)
+            i, found = self._zfind(members, member)
+            if not found:
+                return
+            # suppression par recul (pas de pierre tombale) : les membres qui
+            # suivent dans la grappe reprennent la case libérée si leur sondage
+            # y passe
+            n, j = self.zset_size, i
+            while True:
+                members[i] = 0
+                while True:
+                    j = (j + 1) % n
+                    if members[j] == 0:
+                        return
+                    home = self._zhome(int(members[j]) - 1)
+                    if (home <= i < j) or (j < home <= i) or (i < j < home):
+                        break
+                members[i], scores[i] = members[j], scores[j]
+                i = j
+
+    def ztop(self, name: str, n: int) -> List[int]:
+        with self._data():
+            zset, ids = self._zset(name)
+            used = np.flatnonzero(ids)
+            scores = zset[used] - _ZBIAS
+            members = ids[used] - 1
+        # clé composite (-score, id) en un seul int64, puis sélection partielle
+        keys = -scores * (1 << 32) + members
+        if n < len(keys):
+            keys = keys[np.argpartition(keys, n)[:n]]
+        return (np.sort(keys) & 0xFFFFFFFF).tolist()
+
+    def clear(self) -> None:
+        with self._data():
+            self._mm[self._slots_at:] = bytes(len(self._mm) - self._slots_at)
+
+    def close(self) -> None:
+        del self._headers
+        self._mm.close()
+        os.close(self._fd)
@@ -0,0 +1,116 @@
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from . import engine
+
+# Tables de stratégie de base et d'EV exactes, précalculées.
+#
+# Calcul hors ligne (python manage.py build_strategy) par programmation
+# dynamique, en sabot infini (chaque carte tirée a la probabilité de son rang,
+# 4/13 pour les valeurs 10) ; le croupier n'a pas de "peek" et les paiements
+# sont +1 / 0 / -1 (ni blackjack naturel, ni double, ni split).
+#
+# Une case par état (règle, as ?, total hard, carte du croupier) : c'est la
+# même main réduite que la clé de odds.hint. Le fichier .npy est ouvert en
+# mmap au démarrage (BlackjackConfig.ready) : tous les workers partagent les
+# mêmes pages, et une décision est un simple accès indexé.
+
+RECORD = np.dtype([("stand", "<f4"), ("hit", "<f4"), ("action", "u1")])
+STAND, HIT = 0, 1
+ACTIONS = ("stand", "hit")
+# règles : le croupier reste sur tous les 17 (S17) / tire sur 17 soft (H17)
+RULES = ("s17", "h17")
+SHAPE = (len(RULES), 2, 22, 11)  # règle, as, total hard 0..21, carte du croupier 1..10
+
+_P = {v: (4 if v == 10 else 1) / 13 for v in range(1, 11)}
+
+
+def _total(hard: int, ace: bool) -> int:
+    return hard + 10 if ace and hard <= 11 else hard
+
+
+@lru_cache(maxsize=None)
+def _dealer(hard: int, ace: bool, h17: bool) -> Tuple[float, ...]:
+    # distribution finale du croupier depuis (hard, as) : P(17..21), P(bust)
+    total = _total(hard, ace)
+    if total > 21:
+        return (0.0,) * 5 + (1.0,)
+    if total >= 17 and not (h17 and total == 17 and ace and hard <= 11):
+        return tuple(float(total == t) for t in range(17, 22)) + (0.0,)
+    dist = [0.0] * 6
+    for v, p in _P.items():
+        for i, q in enumerate(_dealer(hard + v, ace or v == 1, h17)):
+            dist[i] += p * q
+    return tuple(dist)
+
+
+def _stand_ev(total: int, up: int, h17: bool) -> float:
+    if total > 21:
+        return -1.0
+    *finals, bust = _dealer(up, up == 1, h17)
+    ev = bust
+    for t, p in zip(range(17, 22), finals):
+        ev += p * ((total > t) - (total < t))
+    return ev
+
+
+@lru_cache(maxsize=None)
+def _best_ev(hard: int, ace: bool, up: int, h17: bool) -> float:
+    if _total(hard, ace) > 21:
+        return -1.0
+    return max(_stand_ev(_total(hard, ace), up, h17), _hit_ev(hard, ace, up, h17))
+
+
+def _hit_ev(hard: int, ace: bool, up: int, h17: bool) -> float:
+    return sum(p * _best_ev(hard + v, ace or v == 1, up, h17) for v, p in _P.items())
+
+
+def build_tables() -> np.ndarray:
+    table = np.zeros(SHAPE, dtype=RECORD)
+    for rule, name in enumerate(RULES):
+        h17 = name == "h17"
+        for ace in (0, 1):
+            for hard in range(22):
+                for up in range(1, 11):
+                    stand = _stand_ev(_total(hard, bool(ace)), up, h17)
+                    hit = _hit_ev(hard, bool(ace), up, h17)
+                    table[rule, ace, hard, up] = (stand, hit, HIT if hit > stand else STAND)
+    return table
+
+
+def write_tables(path: Path) -> np.ndarray:
+    table = build_tables()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    np.save(path, table)
+    return table
+
+
+_tables: Optional[np.ndarray] = None
+
+
+def table_path() -> Path:
+    return Path(getattr(settings, "BLACKJACK_STRATEGY_TABLE",
+                        Path(__file__).resolve().parent / "data" / "strategy.npy"))
+
+
+def get_tables() -> np.ndarray:
+    # fichier en mmap (lecture seule, sans copie) ; calculé en mémoire s'il manque
+    global _tables
+    if _tables is None:
+        path = table_path()
+        _tables = np.load(path, mmap_mode="r") if path.exists() else build_tables()
+    return _tables
+
+
+def lookup(hard: int, ace: bool, up: int) -> Tuple[str, float, float]:
+    # (action, EV stand, EV hit) pour la main réduite (hard, as) face à la
+    # carte `up` (code engine), sous la règle BLACKJACK_DEALER_HITS_SOFT_17
+    if hard > 21:
+        return "stand", -1.0, -1.0
+    rule = int(bool(getattr(settings, "BLACKJACK_DEALER_HITS_SOFT_17", False)))
+    rec = get_tables()[rule, int(ace), hard, engine.VALUES[up]]
+    return ACTIONS[rec["action"]], float(rec["stand"]), float(rec["hit"])
@@ -0,0 +1,395 @@
+import atexit
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+
+from . import events, movelog
+from .cache import collection_versions
+from .models import Game, Move, Player
+from .projection import schema_fields
+from .schemas import GameListItem, PlayerOut
+
+logger = logging.getLogger(__name__)
+
+# Write-behind des coups simples (add_score / stand) de l'API ORM, activé par
+# BLACKJACK_WRITE_BEHIND.
+#
+# play_turn applique le coup à une copie mémoire des joueurs et du tour de
+# leur game (chargée au premier coup, 1 SELECT), l'écrit dans le journal puis
+# répond tout de suite. Le flush écrit les changements cumulés en une
+# transaction : bulk_create des coups (movelog), bulk_update des joueurs,
+# bulk_update des tours et move_count, un UPDATE des agrégats
+# (cf. api._player_aggregates). Déclenché toutes les
+# BLACKJACK_WRITE_BEHIND_INTERVAL secondes par un thread, ou plus tôt au-delà de
+# BLACKJACK_WRITE_BEHIND_MAX_PENDING joueurs en attente.
+#
+# Les autres écritures d'un game (hit, lots de coups, départ d'un joueur,
+# start / end) appellent flush(gid) d'abord : la base est à jour et les copies
+# de ce game sont jetées, elles seront relues après. Chaque flush jette aussi
+# les copies des games restés sans coup depuis le flush précédent : la mémoire
+# suit les games en cours, pas tous ceux joués depuis le démarrage.
+#
+# Lectures : le détail d'un game (GET /games/{gid}) passe par overlay() et est
+# toujours à jour ; listes et classements ont au plus un flush de retard.
+#
+# If-Match (cf. api._if_match) : comparé à la version de la copie, sans
+# requête. Les versions du joueur et du game avancent à chaque coup, comme
+# avec les UPDATE de l'API.
+#
+# Journal : une ligne JSON par coup, valeurs après le coup (score, stand, tour,
+# versions, move_count du game) ; rejouer un journal déjà écrit en base ne
+# change donc rien (les coups déjà comptés dans move_count sont sautés).
+# Game.version et Game.move_count sont écrits en incrément (F() + coups en
+# attente) : même si une écriture du game a échappé à sync(), aucun numéro de
+# version n'est réutilisé et move_count reste le nombre de Move du game. Vidé
+# après chaque flush réussi. BLACKJACK_WRITE_BEHIND_FSYNC : fsync par coup
+# (survit aussi à une coupure de courant, au prix d'une écriture disque
+# synchrone par coup).
+#
+# Un journal par process, <BLACKJACK_WRITE_BEHIND_JOURNAL>.<pid>, verrouillé
+# (flock) tant que le process vit. Au démarrage, un buffer rejoue puis
+# supprime les journaux que plus personne ne verrouille (workers morts) ;
+# ceux des workers vivants ne sont pas touchés.
+#
+# Les copies sont celles du process : un game doit être joué par un seul
+# worker (un worker, ou routage collant par game).
+
+PLAYER_FIELDS = schema_fields(PlayerOut)
+GAME_FIELDS = schema_fields(GameListItem)
+
+
+class VersionConflict(Exception):
+    # If-Match périmé : version actuelle du joueur
+    def __init__(self, version: int) -> None:
+        super().__init__(version)
+        self.version = version
+
+
+class WriteBehindBuffer:
+
+    def __init__(self, journal: Optional[str] = None, interval: float = 0.5,
+                 max_pending: int = 1000, fsync: bool = False) -> None:
+        self.interval = interval
+        self.max_pending = max_pending
+        self.fsync = fsync
+        self._players: Dict[int, Dict[str, Any]] = {}  # copies chargées, pid -> PlayerOut
+        self._turns: Dict[int, int] = {}               # gid -> tour
+        self._counts: Dict[int, int] = {}              # gid -> Game.move_count
+        self._versions: Dict[int, int] = {}            # gid -> Game.version
+        self._bumps: Dict[int, int] = {}               # gid -> versions du game en attente
+        self._moves: List[Move] = []                   # coups en attente, dans l'ordre
+        self._dirty_players: Dict[int, float] = {}     # pid -> date du premier coup en attente
+        self._dirty_games: Dict[int, float] = {}
+        self._lock = threading.RLock()
+        self._wakeup = threading.Event()
+        self.path = f"{journal}.{os.getpid()}" if journal else None
+        self._fd = None
+        self.flushes = self.flushed_rows = self.errors = 0
+        self.last_flush = self.max_flush = self.total_flush = 0.0
+        if journal:
+            # le nôtre d'abord, verrouillé : un autre worker qui démarre ne le prendra pas
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o600)
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(self._fd)
+                raise RuntimeError(f"{self.path} : journal déjà ouvert par un autre buffer de ce process")
+            self._recover(str(journal))
+        if interval > 0:
+            threading.Thread(target=self._run, name="write-behind", daemon=True).start()
+
+    # ---- Coups ----
+    def play(self, gid: int, pid: int, add_score: int = 0, stand: bool = False,
+             expected: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        # coup appliqué à la copie du joueur, None si le joueur n'est pas dans ce
+        # game ; VersionConflict si expected n'est pas sa version
+        with self._lock:
+            p = self._players.get(pid)
+            if p is None or p["game_id"] != gid:
+                row = (Player.objects.filter(pk=pid, game_id=gid)
+                       .values(*PLAYER_FIELDS, "game__turn", "game__move_count", "game__version").first())
+                if row is None:
+                    return None
+                self._turns.setdefault(gid, row.pop("game__turn"))
+                self._counts.setdefault(gid, row.pop("game__move_count"))
+                self._versions.setdefault(gid, row.pop("game__version"))
+                p = self._players[pid] = row
+            if expected is not None and p["version"] != expected:
+                raise VersionConflict(p["version"])
+            moves = []
+            if add_score:
+                p["score"] = max(0, p["score"] + int(add_score))
+                self._turns[gid] += 1
+                moves.append((Move.Kind.SCORE, int(add_score)))
+            if stand:
+                p["stand"] = True
+                moves.append((Move.Kind.STAND, 0))
+            if moves:
+                now = time.monotonic()
+                self._dirty_players.setdefault(pid, now)
+                self._dirty_games.setdefault(gid, now)
+                self._moves += [Move(game_id=gid, player_id=pid, kind=k, value=v) for k, v in moves]
+                self._counts[gid] += len(moves)
+                p["version"] += 1
+                self._versions[gid] += 1
+                self._bumps[gid] = self._bumps.get(gid, 0) + 1
+                self._log({"p": pid, "g": gid, "score": p["score"], "stand": p["stand"], "v": p["version"],
+                           "turn": self._turns[gid], "moves": moves,
+                           "n": self._counts[gid]})
+            pending = len(self._dirty_players)
+            p = dict(p)
+        if pending >= self.max_pending:
+            if self.interval > 0:
+                self._wakeup.set()
+            else:
+                self.flush()
+        return p
+
+    def overlay(self, gid: int, game: Dict[str, Any]) -> Dict[str, Any]:
+        # détail d'un game (GameOut) lu en base + coups pas encore écrits
+        with self._lock:
+            if gid not in self._turns:
+                return game
+            game["turn"] = self._turns[gid]
+            game["version"] = self._versions[gid]
+            players = [self._players.get(p["id"], p) for p in game["players"]]
+        game["players"] = [dict(p) for p in players]
+        game["top_score"] = max((p["score"] for p in players), default=0)
+        game["standing_count"] = sum(p["stand"] for p in players)
+        return game
+
+    # ---- Journal ----
+    def _log(self, record: Dict[str, Any]) -> None:
+        if self._fd is not None:
+            os.write(self._fd, json.dumps(record, separators=(",", ":")).encode() + b"\n")
+            if self.fsync:
+                os.fsync(self._fd)
+
+    def _recover(self, journal: str) -> None:
+        # journaux des workers morts (sans verrou), et le nôtre s'il vient d'un
+        # ancien process de même pid ; `journal` seul : format d'avant (un
+        # journal commun)
+        paths = [p for p in glob.glob(glob.escape(journal) + ".*") if p.rsplit(".", 1)[1].isdigit()]
+        for path in [journal] + sorted(paths):
+            if path == self.path:
+                self._replay(os.pread(self._fd, os.fstat(self._fd).st_size, 0), path)
+                os.ftruncate(self._fd, 0)
+                continue
+            try:
+                fd = os.open(path, os.O_RDWR)
+            except FileNotFoundError:
+                continue
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)  # worker vivant
+                continue
+            try:
+                if os.fstat(fd).st_nlink:  # pas déjà repris par un autre worker
+                    self._replay(os.pread(fd, os.fstat(fd).st_size, 0), path)
+                    os.unlink(path)
+            finally:
+                os.close(fd)
+
+    def _replay(self, data: bytes, path: str) -> None:
+        # coups journalisés mais pas encore écrits en base (crash du worker) :
+        # dernière valeur par joueur / game, écrite avant de reprendre
+        lines = data.splitlines()
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break  # dernière ligne tronquée par le crash
+        if records:
+            # coups déjà en base (flush commité juste avant le crash) : sautés
+            gids = {r["g"] for r in records}
+            written = dict(Game.objects.filter(pk__in=gids).values_list("id", "move_count"))
+            records = [r for r in records if r["n"] > written.get(r["g"], r["n"])]
+        players, games, bumps, moves = {}, {}, Counter(), []
+        for r in records:
+            players[r["p"]] = Player(pk=r["p"], game_id=r["g"], score=r["score"], stand=r["stand"], version=r["v"])
+            games[r["g"]] = Game(pk=r["g"], turn=r["turn"])
+            bumps[r["g"]] += 1
+            moves += [Move(game_id=r["g"], player_id=r["p"], kind=k, value=v) for k, v in r["moves"]]
+        if players:
+            added = Counter(m.game_id for m in moves)
+            for gid, game in games.items():
+                game.version = F("version") + bumps[gid]
+                game.move_count = F("move_count") + added[gid]
+            self._write(players, games, moves)
+            logger.warning("write-behind : %d joueurs repris du journal %s", len(players), path)
+
+    def close(self) -> None:
+        # fin du process : journal supprimé s'il est vide, verrou rendu (un
+        # journal non vide sera repris par le prochain worker)
+        if self._fd is not None:
+            if not os.fstat(self._fd).st_size:
+                os.unlink(self.path)
+            os.close(self._fd)
+            self._fd = None
+
+    # ---- Flush ----
+    def _write(self, players: Dict[int, Player], games: Dict[int, Game], moves: List[Move]) -> Dict[int, int]:
+        # move_count et version des games sont des incréments F() ; renvoie
+        # le move_count écrit de chaque game
+        from .api import _player_aggregates  # api importe ce module
+
+        with transaction.atomic():
+            Move.objects.bulk_create(moves)
+            Player.objects.bulk_update(players.values(), ["score", "stand", "version"])
+            Game.objects.bulk_update(games.values(), ["turn", "move_count", "version"])
+            qs = Game.objects.filter(pk__in=list(games))
+            qs.update(**_player_aggregates(score=True, stand=True))
+            counts = dict(qs.values_list("id", "move_count"))
+            for gid, added in Counter(m.game_id for m in moves).items():
+                movelog.snapshot_if_due(gid, counts[gid], added)
+        return counts
+
+    def flush(self, gid: Optional[int] = None) -> int:
+        # écrit tous les coups en attente ; avec gid, jette ensuite les copies
+        # de ce game (une autre écriture va le modifier en base).
+        # Les coups attendent pendant l'écriture : la copie reste la référence.
+        with self._lock:
+            pids, gids = list(self._dirty_players), list(self._dirty_games)
+            if pids:
+                t0 = time.perf_counter()
+                players = {
+                    pid: Player(pk=pid, **{f: self._players[pid][f] for f in ("game_id", "score", "stand", "version")})
+                    for pid in pids
+                }
+                added = Counter(m.game_id for m in self._moves)
+                games = {
+                    g: Game(pk=g, turn=self._turns[g], move_count=F("move_count") + added[g],
+                            version=F("version") + self._bumps[g])
+                    for g in gids
+                }
+                try:
+                    counts = self._write(players, games, self._moves)
+                except Exception:
+                    self.errors += 1
+                    raise
+                elapsed = time.perf_counter() - t0
+                self.flushes += 1
+                self.flushed_rows += len(pids)
+                self.last_flush = elapsed
+                self.max_flush = max(self.max_flush, elapsed)
+                self.total_flush += elapsed
+                self._dirty_players.clear()
+                self._dirty_games.clear()
+                self._bumps.clear()
+                self._counts.update(counts)  # journal : "n" suit la base
+                self._moves = []
+                if self._fd is not None:
+                    os.ftruncate(self._fd, 0)
+            # copies des games sans coup depuis le flush précédent : jetées,
+            # la mémoire ne garde que les games joués
+            idle = set(self._turns).difference(gids)
+            if gid is not None:
+                idle.add(gid)
+            self._drop(idle)
+        if pids:
+            collection_versions.bump("games")  # compteurs de /games
+            self._publish(gids)
+        return len(pids)
+
+    def _drop(self, gids) -> None:
+        for gid in gids:
+            self._turns.pop(gid, None)
+            self._counts.pop(gid, None)
+            self._versions.pop(gid, None)
+        if gids:
+            for pid in [pid for pid, p in self._players.items() if p["game_id"] in gids]:
+                del self._players[pid]
+
+    def _publish(self, gids) -> None:
+        # agrégats à jour : événement "game" pour les abonnés (cf. events)
+        watched = [g for g in gids if events.has_subscribers(g)]
+        for game in Game.objects.filter(pk__in=watched).values(*GAME_FIELDS) if watched else ():
+            events.publish(game["id"], "game", game=game)
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("write-behind : flush en échec, nouvel essai dans %ss", self.interval)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            oldest = min(self._dirty_players.values(), default=None)
+            return {
+                "enabled": True,
+                "pending_players": len(self._dirty_players),
+                "pending_games": len(self._dirty_games),
+                "backlog_age_ms": (time.monotonic() - oldest) * 1000 if oldest is not None else 0.0,
+                "journal_bytes": os.fstat(self._fd).st_size if self._fd is not None else 0,
+                "flushes": self.flushes,
+                "flushed_rows": self.flushed_rows,
+                "errors": self.errors,
+                "last_flush_ms": self.last_flush * 1000,
+                "max_flush_ms": self.max_flush * 1000,
+                "avg_flush_ms": self.total_flush / self.flushes * 1000 if self.flushes else 0.0,
+            }
+
+
+_buffer: Optional[WriteBehindBuffer] = None
+_buffer_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return getattr(settings, "BLACKJACK_WRITE_BEHIND", False)
+
+
+def get_buffer() -> WriteBehindBuffer:
+    # créé (et journal rejoué) au premier coup
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = WriteBehindBuffer(
+                    journal=getattr(settings, "BLACKJACK_WRITE_BEHIND_JOURNAL", None),
+                    interval=getattr(settings, "BLACKJACK_WRITE_BEHIND_INTERVAL", 0.5),
+                    max_pending=getattr(settings, "BLACKJACK_WRITE_BEHIND_MAX_PENDING", 1000),
+                    fsync=getattr(settings, "BLACKJACK_WRITE_BEHIND_FSYNC", False),
+                )
+                atexit.register(_flush_at_exit, _buffer)
+    return _buffer
+
+
+def _flush_at_exit(buffer: WriteBehindBuffer) -> None:
+    # arrêt propre du worker ; en cas d'échec, le journal sera rejoué
+    try:
+        buffer.flush()
+    except Exception:
+        logger.exception("write-behind : flush final en échec")
+    buffer.close()
+
+
+def sync(gid: int) -> None:
+    # avant toute autre écriture du game gid (cf. en-tête)
+    if _buffer is not None:
+        _buffer.flush(gid)
+
+
+def overlay(gid: int, game: Dict[str, Any]) -> Dict[str, Any]:
+    return _buffer.overlay(gid, game) if _buffer is not None else game
+
+
+def stats() -> Dict[str, Any]:
+    if _buffer is None:
+        return {"enabled": enabled()}
+    return _buffer.stats()
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -38,9 +41,12 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'corsheaders',
+    'blackjack',
 ]
 
 MIDDLEWARE = [
+    # en premier : la durée mesurée couvre tous les middlewares (GET /api/metrics)
+    'blackjack.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,12 +85,120 @@ WSGI_APPLICATION = 'bootcamp.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+#
+# Profil choisi par la variable d'environnement DB_PROFILE :
+#   dev       SQLite par défaut de Django, une connexion par requête
+#   sqlite    SQLite de prod : WAL (les lecteurs ne sont plus bloqués par
+#             l'écrivain), synchronous=NORMAL, busy timeout, mmap, transactions
+#             IMMEDIATE (pas d'échec « database is locked » en montée de verrou)
+#             et connexions gardées ouvertes entre les requêtes
+#   postgres  PostgreSQL avec pool de connexions (pip install "psycopg[pool]")
+DB_PROFILE = os.environ.get('DB_PROFILE', 'dev')
+
+SQLITE_NAME = os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3')
+
+if DB_PROFILE == 'dev':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': SQLITE_NAME,
+        }
+    }
+elif DB_PROFILE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': SQLITE_NAME,
+            'CONN_MAX_AGE': None,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA mmap_size=268435456;'
+                ),
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 5,  # busy timeout, en secondes
+            },
+        }
+    }
+elif DB_PROFILE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'bootcamp'),
+            'USER': os.environ.get('POSTGRES_USER', 'bootcamp'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            # le pool remplace les connexions persistantes (CONN_MAX_AGE doit rester à 0)
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('POSTGRES_POOL_MIN', 2)),
+                    'max_size': int(os.environ.get('POSTGRES_POOL_MAX', 20)),
+                    'timeout': 10,
+                },
+            },
+        }
     }
-}
+else:
+    raise ImproperlyConfigured(f"DB_PROFILE inconnu : {DB_PROFILE!r} (dev, sqlite ou postgres)")
+
+
+# API blackjack montée sur /api/ : "sync" (blackjack.api) ou "async" (blackjack.api_async, ASGI)
+BLACKJACK_API_MODE = os.environ.get('BLACKJACK_API_MODE', 'sync')
+
+# Pub/sub des événements de game (flux SSE GET /api/games/{gid}/events,
+# servi en ASGI seulement : 501 sous un serveur WSGI)
+BLACKJACK_EVENT_BROKER = 'blackjack.events.InProcessBroker'
+
+# Cache LRU/TTL des détails de game (GET /api/games/{gid}), stats sur /api/cache/stats
+BLACKJACK_GAME_CACHE_SIZE = 10_000
+BLACKJACK_GAME_CACHE_TTL = 30.0
+
+# Rendu JSON des APIs ORM : orjson s'il est installé, sinon json de la stdlib
+# ('blackjack.renderers.StdlibJSONRenderer' pour forcer la stdlib)
+BLACKJACK_JSON_RENDERER = 'blackjack.renderers.FastJSONRenderer'
+
+# Nombre de jeux d'un sabot (blackjack.engine.Shoe), pour les coups "hit"
+BLACKJACK_SHOE_DECKS = 6
+
+# Conseils Monte Carlo (GET /api/games/{gid}/players/{pid}/hint, blackjack.odds) :
+# parties simulées par conseil, découpées en tranches sur un pool de process
+# (None = un process par CPU, 0 = pas de pool), dans la limite du délai (s)
+BLACKJACK_HINT_SAMPLES = 200_000
+BLACKJACK_HINT_CHUNK = 25_000
+BLACKJACK_HINT_WORKERS = None
+BLACKJACK_HINT_TIMEOUT = 1.0
+BLACKJACK_HINT_CACHE_SIZE = 10_000
+
+# Tables de stratégie de base / EV exactes (python manage.py build_strategy),
+# ouvertes en mmap au démarrage ; règle du croupier : tire sur 17 soft ?
+BLACKJACK_STRATEGY_TABLE = BASE_DIR / 'blackjack' / 'data' / 'strategy.npy'
+BLACKJACK_DEALER_HITS_SOFT_17 = False
+
+# Stockage de l'API mémoire (blackjack.api) : dicts du process (un état par
+# worker), fichier mmap partagé par les workers de la machine
+# ('blackjack.store_shm.SharedMemoryBackend') ou serveur Redis
+# ('blackjack.store_redis.RedisBackend') ; options passées au constructeur
+BLACKJACK_STORE_BACKEND = 'blackjack.store.LocalBackend'
+BLACKJACK_STORE_OPTIONS = {}
+
+# Write-behind des coups simples de l'API ORM (blackjack.writebehind) : réponse
+# depuis une copie mémoire, écriture groupée en base toutes les INTERVAL
+# secondes (0 = pas de thread, flush au seuil seulement) ou au-delà de
+# MAX_PENDING joueurs en attente. JOURNAL : préfixe des journaux, un par
+# worker (<JOURNAL>.<pid>), ceux des workers morts sont rejoués au démarrage ;
+# FSYNC : un fsync par coup. Un game doit être joué par un seul worker.
+BLACKJACK_WRITE_BEHIND = False
+BLACKJACK_WRITE_BEHIND_INTERVAL = 0.5
+BLACKJACK_WRITE_BEHIND_MAX_PENDING = 1000
+BLACKJACK_WRITE_BEHIND_JOURNAL = BASE_DIR / 'write-behind.journal'
+BLACKJACK_WRITE_BEHIND_FSYNC = False
+
+# Journal des coups (blackjack.movelog) : un snapshot de l'état d'un game tous
+# les N coups ; un replay rejoue au plus N coups.
+BLACKJACK_SNAPSHOT_EVERY = 500
 
 
 # Password validation